@@ -0,0 +1,188 @@
+# activity_cache.py
+"""
+Resumos de atividade por usuário mantidos em memória.
+
+Para cada (guilda, usuário) consultado recentemente guarda os intervalos das
+sessões de voz dos últimos `window_days` dias. As verificações de inatividade leem
+daqui em vez de somar voice_sessions no Postgres a cada avaliação: cada sessão
+gravada atualiza o resumo (Database.add_session_listener), uma falta carrega o
+usuário do banco e um verificador periódico compara uma amostra com o banco.
+
+Os intervalos (e não totais diários) são guardados porque os períodos de
+monitoramento começam no horário da atribuição do cargo, não à meia-noite: com
+eles o recorte de cada período é idêntico ao de Database.get_voice_sessions.
+"""
+import bisect
+import logging
+import random
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+
+logger = logging.getLogger('inactivity_bot')
+
+def clip_sessions(intervals: List[Tuple[datetime, datetime]], start_date: datetime,
+                  end_date: datetime) -> List[Dict]:
+    """Mesmo resultado de Database.get_voice_sessions: sessões que tocam o período, com a duração recortada"""
+    return [
+        {
+            'join_time': join_time,
+            'leave_time': leave_time,
+            'duration': int(round((min(leave_time, end_date) - max(join_time, start_date)).total_seconds()))
+        }
+        for join_time, leave_time in intervals
+        if join_time < end_date and leave_time > start_date
+    ]
+
+class _UserSummary:
+    __slots__ = ('covered_since', 'sessions')
+
+    def __init__(self, covered_since: datetime, sessions: List[Tuple[datetime, datetime]]):
+        self.covered_since = covered_since  # Sessões que terminam depois deste instante estão todas aqui
+        self.sessions = sessions            # (join_time, leave_time) ordenados por join_time
+
+class RollingActivityCache:
+    VERIFY_MARGIN = timedelta(minutes=5)
+
+    def __init__(self, db, active_sessions: Optional[Dict] = None, window_days: int = 35,
+                 max_users: int = 20000, verify_sample: int = 50):
+        self.db = db
+        self.active_sessions = active_sessions if active_sessions is not None else {}
+        self.window_days = window_days
+        self.max_users = max_users
+        self.verify_sample = verify_sample
+        self._entries: 'OrderedDict[Tuple[int, int], _UserSummary]' = OrderedDict()
+        self._hydrating: Dict[Tuple[int, int], List[List[Tuple[datetime, datetime]]]] = {}  # Um buffer por carga em andamento
+        self.stats = {'hits': 0, 'misses': 0, 'bypass': 0, 'evictions': 0, 'verified': 0, 'mismatches': 0}
+
+    def configure(self, settings: dict, monitoring_period: int):
+        self.max_users = int(settings.get('max_users', self.max_users))
+        self.verify_sample = int(settings.get('verify_sample', self.verify_sample))
+        # A janela precisa cobrir pelo menos um período de monitoramento completo
+        self.window_days = max(int(settings.get('window_days', self.window_days)), monitoring_period + 1)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _window_start(self) -> datetime:
+        return datetime.now(pytz.utc) - timedelta(days=self.window_days)
+
+    def _store(self, key: Tuple[int, int], entry: _UserSummary):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _prune(self, entry: _UserSummary, window_start: datetime):
+        if entry.covered_since < window_start:
+            entry.sessions = [s for s in entry.sessions if s[1] > window_start]
+            entry.covered_since = window_start
+
+    def record_session(self, user_id: int, guild_id: int, join_time: datetime,
+                       leave_time: datetime, duration: int, session_id: Optional[int] = None):
+        """Listener de sessões gravadas (Database.add_session_listener)"""
+        key = (guild_id, user_id)
+        for buffer in self._hydrating.get(key, ()):
+            buffer.append((join_time, leave_time))
+        entry = self._entries.get(key)
+        if entry is not None and leave_time > entry.covered_since:
+            bisect.insort(entry.sessions, (join_time, leave_time))
+
+    def invalidate(self, user_id: int, guild_id: int):
+        self._entries.pop((guild_id, user_id), None)
+
+    def get_active_since(self, user_id: int, guild_id: int) -> Optional[datetime]:
+        """Início da sessão de voz em andamento, se o usuário estiver em um canal agora"""
+        session = self.active_sessions.get((user_id, guild_id))
+        return session.get('start_time') if session else None
+
+    async def _hydrate(self, user_id: int, guild_id: int) -> _UserSummary:
+        key = (guild_id, user_id)
+        since = self._window_start()
+        # Cada chamada tem seu buffer: cargas simultâneas da mesma chave (ex.: verify e uma falta) não se atrapalham
+        buffer = []
+        self._hydrating.setdefault(key, []).append(buffer)
+        try:
+            rows = await self.db.get_session_intervals(guild_id, {user_id: since})
+            sessions = set(rows.get(user_id, []))
+            # Sessões gravadas enquanto a consulta rodava
+            sessions.update(s for s in buffer if s[1] > since)
+        finally:
+            self._hydrating[key].remove(buffer)
+            if not self._hydrating[key]:
+                del self._hydrating[key]
+
+        entry = _UserSummary(since, sorted(sessions))
+        self._store(key, entry)
+        return entry
+
+    async def get_voice_sessions(self, user_id: int, guild_id: int,
+                                 start_date: datetime, end_date: datetime) -> List[Dict]:
+        """Substituto em memória de Database.get_voice_sessions"""
+        window_start = self._window_start()
+        if start_date < window_start:
+            # Fora da janela mantida em memória
+            self.stats['bypass'] += 1
+            return await self.db.get_voice_sessions(user_id, guild_id, start_date, end_date)
+
+        key = (guild_id, user_id)
+        entry = self._entries.get(key)
+        if entry is not None and start_date >= entry.covered_since:
+            self.stats['hits'] += 1
+            self._entries.move_to_end(key)
+        else:
+            self.stats['misses'] += 1
+            try:
+                entry = await self._hydrate(user_id, guild_id)
+            except Exception as e:
+                logger.error(f"Erro ao carregar resumo de atividade de {user_id}: {e}", exc_info=True)
+                return await self.db.get_voice_sessions(user_id, guild_id, start_date, end_date)
+
+        self._prune(entry, window_start)
+        return clip_sessions(entry.sessions, start_date, end_date)
+
+    async def verify(self, sample_size: Optional[int] = None) -> Dict[str, int]:
+        """Compara uma amostra dos resumos com o banco e recarrega os divergentes"""
+        sample_size = sample_size or self.verify_sample
+        keys = random.sample(list(self._entries), min(sample_size, len(self._entries)))
+        by_guild: Dict[int, Dict[int, datetime]] = {}
+        for guild_id, user_id in keys:
+            by_guild.setdefault(guild_id, {})[user_id] = self._entries[(guild_id, user_id)].covered_since
+
+        checked = mismatches = 0
+        for guild_id, since_by_user in by_guild.items():
+            # Sessões que terminaram perto do início da consulta podem ainda não estar commitadas nela
+            settled = datetime.now(pytz.utc) - self.VERIFY_MARGIN
+            rows = await self.db.get_session_intervals(guild_id, since_by_user)
+            for user_id in since_by_user:
+                entry = self._entries.get((guild_id, user_id))
+                if entry is None:
+                    continue
+                checked += 1
+                cached = {s for s in entry.sessions if entry.covered_since < s[1] < settled}
+                expected = {s for s in rows.get(user_id, []) if entry.covered_since < s[1] < settled}
+                if cached == expected:
+                    continue
+                mismatches += 1
+                logger.warning(
+                    f"Resumo de atividade divergente para {user_id} (guilda {guild_id}): "
+                    f"{len(cached)} sessões em memória, {len(expected)} no banco"
+                )
+                # Uma sessão antiga ainda pode ter sido gravada depois da consulta (ex.: sessão
+                # fantasma corrigida): em vez de sobrescrever, recarrega do banco com o buffer de _hydrate
+                try:
+                    await self._hydrate(user_id, guild_id)
+                except Exception as e:
+                    logger.error(f"Erro ao recarregar resumo de atividade de {user_id}: {e}")
+                    self.invalidate(user_id, guild_id)
+
+        self.stats['verified'] += checked
+        self.stats['mismatches'] += mismatches
+        return {'checked': checked, 'mismatches': mismatches}
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats, entries=len(self._entries),
+                    sessions=sum(len(entry.sessions) for entry in self._entries.values()))
@@ -0,0 +1,423 @@
+# benchmarks.py
+"""
+Benchmarks de desempenho do bot.
+
+Uso:
+    python benchmarks.py imports [--runs 5] [--max-seconds 3.0]
+    python benchmarks.py charts [--runs 20] [--days 30]
+    python benchmarks.py user_activity --dsn postgres://... [--users 2000] [--concurrency 20]
+    python benchmarks.py sessions --dsn postgres://... [--users 10000] [--sessions-per-user 100]
+
+`imports` mede, em processos novos, o tempo de importação dos módulos do bot e
+verifica que dependências pesadas (numpy, matplotlib, Flask) não são carregadas
+na inicialização. O tempo real até o on_ready é registrado pelo próprio bot no log
+("Tempo de inicialização") e em `bot.startup_timings`.
+
+`charts` compara os backends do gráfico de atividade (matplotlib e raster), cada
+um num processo novo: tempo por gráfico e pico de memória (RSS) do processo.
+
+`user_activity` popula um schema descartável (bench_activity) num Postgres local e
+compara p50/p99 da sequência de consultas antiga do /user_activity com a consulta
+única (Database.get_user_activity_snapshot), com várias chamadas concorrentes
+disputando um pool pequeno.
+
+`sessions` usa o mesmo schema (1M de sessões por padrão) e compara, para a guilda
+inteira, o caminho com Records (fetch + laço em Python) com o carregador colunar
+(session_arrays, via COPY binário e via fetch enxuto) mais os kernels vetorizados:
+tempo de carga, tempo de cálculo e pico de memória alocada (tracemalloc).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import List
+
+BOT_MODULES = ['database', 'charts', 'utils', 'main']
+
+# Módulos que só devem ser carregados quando a funcionalidade é usada
+LAZY_MODULES = ['numpy', 'matplotlib', 'flask']
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+def _probe_import(module: str) -> dict:
+    code = _IMPORT_PROBE.format(module=module, lazy=LAZY_MODULES)
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {module}: {result.stderr.strip().splitlines()[-1:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def bench_imports(runs: int, max_seconds: float) -> int:
+    failures = 0
+    print(f"{'módulo':<12} {'mediana':>9} {'mín':>9} {'máx':>9}  carregados")
+    for module in BOT_MODULES:
+        samples = [_probe_import(module) for _ in range(runs)]
+        times = [sample['seconds'] for sample in samples]
+        loaded = sorted(set().union(*(sample['loaded'] for sample in samples)))
+        median = statistics.median(times)
+        print(f"{module:<12} {median:>8.3f}s {min(times):>8.3f}s {max(times):>8.3f}s  {', '.join(loaded) or '-'}")
+
+        if loaded:
+            print(f"  ✗ {module} carrega na importação: {', '.join(loaded)}")
+            failures += 1
+        if module == 'main' and median > max_seconds:
+            print(f"  ✗ importação de main acima do limite ({median:.2f}s > {max_seconds:.2f}s)")
+            failures += 1
+    return failures
+
+_CHART_PROBE = """
+import json, resource, time
+rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+labels = ['%02d/10' % (day + 1) for day in range({days})]
+values = [float((day * 37) % 240) for day in range({days})]
+title = 'Atividade de Voz - Benchmark\\nPeríodo: 01/10/2026 a 30/10/2026 ({days} dias)'
+
+start = time.perf_counter()
+if {backend!r} == 'raster':
+    from raster_charts import render_activity_bar_chart_raster as render
+else:
+    from charts import render_activity_bar_chart as render
+render(labels, values, title)
+first = time.perf_counter() - start
+
+times = []
+for _ in range({runs}):
+    start = time.perf_counter()
+    size = len(render(labels, values, title))
+    times.append(time.perf_counter() - start)
+
+print(json.dumps({{'first': first, 'times': times, 'png_bytes': size,
+                  'rss_start_kb': rss_start, 'rss_peak_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+"""
+
+def bench_charts(runs: int, days: int) -> int:
+    print(f"{'backend':<12} {'1º gráfico':>11} {'mediana':>9} {'p95':>9} {'PNG':>9} {'RSS pico':>10} {'Δ RSS':>9}")
+    for backend in ('matplotlib', 'raster'):
+        code = _CHART_PROBE.format(backend=backend, runs=runs, days=days)
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            print(f"{backend:<12} falhou: {result.stderr.strip().splitlines()[-1:]}")
+            continue
+
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        times = sorted(data['times'])
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+        print(
+            f"{backend:<12} {data['first'] * 1000:>9.0f}ms {statistics.median(times) * 1000:>7.1f}ms "
+            f"{p95 * 1000:>7.1f}ms {data['png_bytes'] / 1024:>7.0f}KB {data['rss_peak_kb'] / 1024:>8.1f}MB "
+            f"{(data['rss_peak_kb'] - data['rss_start_kb']) / 1024:>7.1f}MB"
+        )
+    return 0
+
+BENCH_SCHEMA = 'bench_activity'
+
+_BENCH_DDL = [
+    'CREATE TABLE voice_sessions (id SERIAL PRIMARY KEY, user_id BIGINT, guild_id BIGINT, '
+    'join_time TIMESTAMPTZ, leave_time TIMESTAMPTZ, duration INT)',
+    'CREATE INDEX ON voice_sessions (user_id, guild_id, join_time, leave_time)',
+    'CREATE INDEX ON voice_sessions (guild_id, join_time)',
+    'CREATE TABLE user_warnings (user_id BIGINT, guild_id BIGINT, warning_type VARCHAR(20), '
+    'warning_date TIMESTAMPTZ, PRIMARY KEY (user_id, guild_id, warning_type))',
+    'CREATE TABLE role_assignments (user_id BIGINT, guild_id BIGINT, role_id BIGINT, '
+    'assigned_at TIMESTAMPTZ, PRIMARY KEY (user_id, guild_id, role_id))',
+    'CREATE TABLE checked_periods (user_id BIGINT, guild_id BIGINT, period_start TIMESTAMPTZ, '
+    'period_end TIMESTAMPTZ, meets_requirements BOOLEAN, PRIMARY KEY (user_id, guild_id, period_start))',
+]
+
+BENCH_GUILD_ID = 1
+BENCH_ROLE_IDS = [101, 102]
+
+async def _seed_bench_schema(dsn: str, users: int, sessions_per_user: int, days: int = 60):
+    """Recria o schema de benchmark com sessões, avisos e cargos sintéticos"""
+    import asyncpg
+    import random
+    from datetime import datetime, timedelta
+    import pytz
+
+    rng = random.Random(42)
+    now = datetime.now(pytz.utc)
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute(f'DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE')
+        await conn.execute(f'CREATE SCHEMA {BENCH_SCHEMA}')
+        await conn.execute(f'SET search_path TO {BENCH_SCHEMA}')
+        for ddl in _BENCH_DDL:
+            await conn.execute(ddl)
+
+        sessions = []
+        for user_id in range(1, users + 1):
+            for _ in range(sessions_per_user):
+                join_time = now - timedelta(seconds=rng.randint(0, days * 86400))
+                duration = rng.randint(60, 4 * 3600)
+                sessions.append((user_id, BENCH_GUILD_ID, join_time, join_time + timedelta(seconds=duration), duration))
+        await conn.copy_records_to_table(
+            'voice_sessions', records=sessions,
+            columns=['user_id', 'guild_id', 'join_time', 'leave_time', 'duration']
+        )
+        await conn.copy_records_to_table('role_assignments', records=[
+            (user_id, BENCH_GUILD_ID, role_id, now - timedelta(days=rng.randint(1, 90)))
+            for user_id in range(1, users + 1) for role_id in BENCH_ROLE_IDS
+        ])
+        await conn.copy_records_to_table('user_warnings', records=[
+            (user_id, BENCH_GUILD_ID, warning_type, now - timedelta(days=rng.randint(0, 30)))
+            for user_id in range(1, users + 1, 3) for warning_type in ('first', 'second')
+        ])
+        await conn.execute('ANALYZE')
+    finally:
+        await conn.close()
+
+async def _legacy_user_activity_fetch(pool, user_id: int, start_date, end_date, period_days: int, required_seconds: int):
+    """Sequência de consultas que o /user_activity fazia antes da consulta única"""
+    import asyncio
+    from datetime import timedelta
+
+    async def assigned_time(role_id):
+        async with pool.acquire() as role_conn:
+            row = await role_conn.fetchrow(
+                "SELECT assigned_at FROM role_assignments WHERE user_id = $1 AND guild_id = $2 AND role_id = $3",
+                user_id, BENCH_GUILD_ID, role_id
+            )
+            return row['assigned_at'] if row else None
+
+    async with pool.acquire() as conn:
+        sessions = await conn.fetch(
+            "SELECT * FROM voice_sessions WHERE user_id = $1 AND guild_id = $2 AND join_time < $4 AND leave_time > $3 ORDER BY join_time DESC",
+            user_id, BENCH_GUILD_ID, start_date, end_date
+        )
+
+    # Os cargos eram buscados em conexões próprias (get_role_assigned_time)
+    assigned = [t for t in await asyncio.gather(*(assigned_time(r) for r in BENCH_ROLE_IDS)) if t]
+    anchor = max(assigned) if assigned else None
+
+    async with pool.acquire() as conn:
+        if not anchor:
+            last_check = await conn.fetchrow(
+                "SELECT period_start FROM checked_periods WHERE user_id = $1 AND guild_id = $2 ORDER BY period_start DESC LIMIT 1",
+                user_id, BENCH_GUILD_ID
+            )
+            anchor = last_check['period_start'] if last_check else None
+
+        if anchor:
+            period_start = anchor + timedelta(days=((end_date - anchor).days // period_days) * period_days)
+            await conn.fetch(
+                "SELECT join_time, duration FROM voice_sessions WHERE user_id = $1 AND guild_id = $2 AND join_time >= $3 AND join_time < $4",
+                user_id, BENCH_GUILD_ID, period_start, period_start + timedelta(days=period_days)
+            )
+
+        await conn.fetch(
+            "SELECT warning_type, warning_date FROM user_warnings WHERE user_id = $1 AND guild_id = $2 ORDER BY warning_date DESC LIMIT 3",
+            user_id, BENCH_GUILD_ID
+        )
+        for role_id in BENCH_ROLE_IDS:
+            await conn.fetchval(
+                "SELECT assigned_at FROM role_assignments WHERE user_id = $1 AND guild_id = $2 AND role_id = $3",
+                user_id, BENCH_GUILD_ID, role_id
+            )
+        return sessions
+
+def _latency_summary(samples: List[float]) -> str:
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"p50 {statistics.median(samples) * 1000:>7.1f}ms  p99 {p99 * 1000:>7.1f}ms  ({len(samples)} chamadas)"
+
+async def _bench_user_activity(dsn: str, users: int, sessions_per_user: int, requests: int,
+                               concurrency: int, pool_size: int, seed: bool) -> int:
+    import asyncio
+    import random
+    import time
+    from datetime import datetime, timedelta
+    import asyncpg
+    import pytz
+    from database import Database
+
+    if seed:
+        print(f"Populando {BENCH_SCHEMA}: {users} usuários x {sessions_per_user} sessões...")
+        await _seed_bench_schema(dsn, users, sessions_per_user)
+
+    pool = await asyncpg.create_pool(dsn, min_size=pool_size, max_size=pool_size,
+                                     server_settings={'search_path': BENCH_SCHEMA})
+    db = Database()
+    db.pool = pool
+
+    rng = random.Random(7)
+    user_ids = [rng.randint(1, users) for _ in range(requests)]
+    period_days, required_seconds, window_days = 14, 15 * 60, 14
+
+    async def run(label, fetch):
+        semaphore = asyncio.Semaphore(concurrency)
+        samples = []
+
+        async def one(user_id):
+            async with semaphore:
+                end_date = datetime.now(pytz.utc)
+                start = time.perf_counter()
+                await fetch(user_id, end_date - timedelta(days=window_days), end_date)
+                samples.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(one(user_id) for user_id in user_ids))
+        print(f"{label:<16} {_latency_summary(samples)}")
+
+    try:
+        await run('legado', lambda uid, start, end: _legacy_user_activity_fetch(
+            pool, uid, start, end, period_days, required_seconds))
+        await run('consulta única', lambda uid, start, end: db.get_user_activity_snapshot(
+            uid, BENCH_GUILD_ID, start, end, BENCH_ROLE_IDS, 'America/Sao_Paulo', period_days, required_seconds))
+    finally:
+        await pool.close()
+    return 0
+
+def _record_summary(rows, start_date, end_date, tz, min_session_seconds: int) -> dict:
+    """Totais por usuário iterando Records, como os caminhos atuais fazem"""
+    seconds, sessions, days = {}, {}, {}
+    for row in rows:
+        clipped = (min(row['leave_time'], end_date) - max(row['join_time'], start_date)).total_seconds()
+        if clipped <= 0:
+            continue
+        user_id = row['user_id']
+        seconds[user_id] = seconds.get(user_id, 0) + clipped
+        sessions[user_id] = sessions.get(user_id, 0) + 1
+        if clipped >= min_session_seconds:
+            days.setdefault(user_id, set()).add(row['join_time'].astimezone(tz).date())
+    return {user_id: (int(seconds[user_id]), sessions[user_id], len(days.get(user_id, ())))
+            for user_id in seconds}
+
+async def _bench_sessions(dsn: str, users: int, sessions_per_user: int, seed: bool) -> int:
+    import time
+    import tracemalloc
+    from datetime import datetime, timedelta
+    import asyncpg
+    import pytz
+    from database import Database
+    from session_arrays import load_guild_sessions, summarize_by_user
+
+    if seed:
+        print(f"Populando {BENCH_SCHEMA}: {users} usuários x {sessions_per_user} sessões...")
+        await _seed_bench_schema(dsn, users, sessions_per_user)
+
+    pool = await asyncpg.create_pool(dsn, min_size=1, max_size=2, server_settings={'search_path': BENCH_SCHEMA})
+    db = Database()
+    db.pool = pool
+    tz = pytz.timezone('America/Sao_Paulo')
+    end_date = datetime.now(pytz.utc)
+    start_date = end_date - timedelta(days=30)
+    min_session_seconds = 15 * 60
+
+    async def measure(label, load, compute):
+        tracemalloc.start()
+        start = time.perf_counter()
+        data = await load()
+        loaded = time.perf_counter()
+        result = compute(data)
+        done = time.perf_counter()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{label:<16} {len(data):>9} sessões  carga {(loaded - start) * 1000:>8.0f}ms  "
+              f"cálculo {(done - loaded) * 1000:>8.0f}ms  pico {peak / 1024 / 1024:>7.1f}MB")
+        return result
+
+    async def fetch_records():
+        async with pool.acquire() as conn:
+            return await conn.fetch(
+                "SELECT user_id, join_time, leave_time FROM voice_sessions "
+                "WHERE guild_id = $1 AND join_time < $3 AND leave_time > $2",
+                BENCH_GUILD_ID, start_date, end_date
+            )
+
+    def vectorized(arrays):
+        summary = summarize_by_user(arrays, start_date, end_date, tz, min_session_seconds)
+        return {int(user_id): (int(seconds), int(count), int(days)) for user_id, seconds, count, days in zip(
+            summary['user_ids'], summary['seconds'], summary['sessions'], summary['days'])}
+
+    try:
+        reference = await measure('Records', fetch_records,
+                                  lambda rows: _record_summary(rows, start_date, end_date, tz, min_session_seconds))
+        failures = 0
+        for method in ('copy', 'fetch'):
+            result = await measure(f"colunar ({method})",
+                                   lambda: load_guild_sessions(db, BENCH_GUILD_ID, start_date, end_date, method),
+                                   vectorized)
+            # Epochs em segundos inteiros: tolera 1s de arredondamento por sessão
+            divergent = [
+                user_id for user_id, (seconds, count, days) in reference.items()
+                if user_id not in result or result[user_id][1:] != (count, days)
+                or abs(result[user_id][0] - seconds) > 2 * count
+            ]
+            if divergent or len(result) != len(reference):
+                print(f"  ✗ {method}: {len(divergent)} usuários com totais diferentes do caminho com Records")
+                failures += 1
+    finally:
+        await pool.close()
+    return failures
+
+def bench_sessions(args) -> int:
+    import asyncio
+    dsn = args.dsn or os.getenv('DATABASE_URL')
+    if not dsn:
+        print("Informe --dsn ou DATABASE_URL (use um Postgres local: o schema de benchmark é recriado)")
+        return 1
+    return asyncio.run(_bench_sessions(dsn, args.users, args.sessions_per_user, not args.no_seed))
+
+def bench_user_activity(args) -> int:
+    import asyncio
+    dsn = args.dsn or os.getenv('DATABASE_URL')
+    if not dsn:
+        print("Informe --dsn ou DATABASE_URL (use um Postgres local: o schema de benchmark é recriado)")
+        return 1
+    return asyncio.run(_bench_user_activity(
+        dsn, args.users, args.sessions_per_user, args.requests, args.concurrency, args.pool_size, not args.no_seed
+    ))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do bot de controle de atividade")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    imports_parser = subparsers.add_parser('imports', help="Tempo de importação e dependências carregadas")
+    imports_parser.add_argument('--runs', type=int, default=5)
+    imports_parser.add_argument('--max-seconds', type=float, default=3.0)
+
+    charts_parser = subparsers.add_parser('charts', help="Tempo e memória dos backends de gráfico")
+    charts_parser.add_argument('--runs', type=int, default=20)
+    charts_parser.add_argument('--days', type=int, default=30)
+
+    activity_parser = subparsers.add_parser('user_activity', help="Latência da busca de dados do /user_activity")
+    activity_parser.add_argument('--dsn')
+    activity_parser.add_argument('--users', type=int, default=2000)
+    activity_parser.add_argument('--sessions-per-user', type=int, default=60)
+    activity_parser.add_argument('--requests', type=int, default=500)
+    activity_parser.add_argument('--concurrency', type=int, default=20)
+    activity_parser.add_argument('--pool-size', type=int, default=5)
+    activity_parser.add_argument('--no-seed', action='store_true', help="Reutiliza o schema já populado")
+
+    sessions_parser = subparsers.add_parser('sessions', help="Records x arrays colunares nas análises da guilda")
+    sessions_parser.add_argument('--dsn')
+    sessions_parser.add_argument('--users', type=int, default=10000)
+    sessions_parser.add_argument('--sessions-per-user', type=int, default=100)
+    sessions_parser.add_argument('--no-seed', action='store_true', help="Reutiliza o schema já populado")
+
+    args = parser.parse_args()
+    if args.benchmark == 'imports':
+        sys.exit(1 if bench_imports(args.runs, args.max_seconds) else 0)
+    elif args.benchmark == 'charts':
+        sys.exit(1 if bench_charts(args.runs, args.days) else 0)
+    elif args.benchmark == 'user_activity':
+        sys.exit(bench_user_activity(args))
+    elif args.benchmark == 'sessions':
+        sys.exit(1 if bench_sessions(args) else 0)
+
+if __name__ == '__main__':
+    main()
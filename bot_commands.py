@@ -8,13 +8,17 @@ from datetime import datetime, timedelta
 import logging
 from main import bot, allowed_roles_only, send_forgiveness_message
 import asyncio
-from utils import generate_activity_report, calculate_most_active_days
-import numpy as np
+from utils import generate_activity_report, calculate_most_active_days, DayBins, WEEKDAYS_PT
 import time
 from tasks import perf_metrics
+from charts import chart_renderer, render_occupancy_chart, render_heatmap_chart, ChartQueueFull
+from io import BytesIO
 import pytz
 import asyncpg
 from collections import defaultdict
+import os
+import shutil
+import tempfile
 
 logger = logging.getLogger('inactivity_bot')
 
@@ -917,184 +921,140 @@ async def user_activity(interaction: discord.Interaction, member: discord.Member
     start_date_param = end_date_param - timedelta(days=days)
 
     try:
-        async with bot.db.pool.acquire() as conn:
-            voice_sessions_param = await conn.fetch(
-                "SELECT * FROM voice_sessions WHERE user_id = $1 AND guild_id = $2 AND join_time < $4 AND leave_time > $3 ORDER BY join_time DESC",
-                member.id, member.guild.id, start_date_param, end_date_param
+        required_min = bot.config['required_minutes']
+        required_days = bot.config['required_days']
+        monitoring_period = bot.config['monitoring_period']
+        tracked_roles = [role for role in member.roles if role.id in bot.config['tracked_roles']]
+
+        snapshot = await bot.db.get_user_activity_snapshot(
+            member.id, member.guild.id, start_date_param, end_date_param,
+            [role.id for role in tracked_roles], str(bot.timezone),
+            monitoring_period, required_min * 60
+        )
+
+        bins = DayBins.from_arrays(
+            snapshot['bin_days'], snapshot['bin_total'], snapshot['bin_count'], snapshot['bin_longest']
+        )
+        total_minutes = snapshot['total_time'] / 60
+        sessions_count = snapshot['session_count']
+        avg_session_duration = total_minutes / sessions_count if sessions_count else 0
+        most_active_days = calculate_most_active_days(None, days, bins=bins)
+
+        active_days_text = "Nenhum dia com atividade"
+        if most_active_days:
+            active_days_text = "\n".join(
+                f"• {day_name} ({date_str}): {total} min (⌀ {avg} min/sessão)"
+                for day_name, date_str, total, avg in most_active_days[:3]
             )
-            
-            total_time = sum(session['duration'] for session in voice_sessions_param)
-            total_minutes = total_time / 60
-            sessions_count = len(voice_sessions_param)
-            avg_session_duration = total_minutes / sessions_count if sessions_count else 0
-            most_active_days = calculate_most_active_days(voice_sessions_param, days)
-
-            active_days_text = "Nenhum dia com atividade"
-            if most_active_days:
-                active_days_text = "\n".join(
-                    f"• {day_name} ({date_str}): {total} min (⌀ {avg} min/sessão)"
-                    for day_name, date_str, total, avg in most_active_days[:3]
-                )
 
-            required_min = bot.config['required_minutes']
-            required_days = bot.config['required_days']
-            monitoring_period = bot.config['monitoring_period']
+        embed = discord.Embed(
+            title=f"📊 Atividade de {member.display_name} (últimos {days} dias)",
+            color=discord.Color.blue(),
+            timestamp=datetime.now(pytz.utc)
+        )
+        embed.set_thumbnail(url=member.display_avatar.url)
 
-            embed = discord.Embed(
-                title=f"📊 Atividade de {member.display_name} (últimos {days} dias)",
-                color=discord.Color.blue(),
-                timestamp=datetime.now(pytz.utc)
-            )
-            embed.set_thumbnail(url=member.display_avatar.url)
+        embed.add_field(
+            name="📈 Estatísticas Gerais",
+            value=(
+                f"**Sessões:** {sessions_count}\n"
+                f"**Tempo Total:** {int(total_minutes)} min\n"
+                f"**Duração Média:** {int(avg_session_duration)} min/sessão\n"
+                f"**Dias Mais Ativos:**\n{active_days_text}\n"
+                f"**Última Atividade:** {snapshot['last_join'].strftime('%d/%m %H:%M') if snapshot['last_join'] else 'N/D'}"
+            ),
+            inline=True
+        )
+
+        embed.add_field(
+            name="📋 Requisitos do Servidor",
+            value=(
+                f"**Minutos necessários:** {required_min} min\n"
+                f"**Dias necessários:** {required_days} dias\n"
+                f"**Período de monitoramento:** {monitoring_period} dias"
+            ),
+            inline=True
+        )
+
+        now = datetime.now(pytz.utc)
+        period_start = snapshot['period_start']
+
+        if period_start:
+            period_end = period_start + timedelta(days=monitoring_period)
+            valid_days_count = snapshot['period_valid_days'] or 0
+
+            is_complying = valid_days_count >= required_days
+            status_emoji = "✅" if is_complying else "⚠️"
+            status_text = "Cumprindo" if is_complying else "Não cumprindo"
+            days_remaining = max(0, (period_end - now).days)
 
             embed.add_field(
-                name="📈 Estatísticas Gerais",
+                name="🔄 Status Atual",
                 value=(
-                    f"**Sessões:** {sessions_count}\n"
-                    f"**Tempo Total:** {int(total_minutes)} min\n"
-                    f"**Duração Média:** {int(avg_session_duration)} min/sessão\n"
-                    f"**Dias Mais Ativos:**\n{active_days_text}\n"
-                    f"**Última Atividade:** {voice_sessions_param[0]['join_time'].strftime('%d/%m %H:%M') if voice_sessions_param else 'N/D'}"
+                    f"{status_emoji} **{status_text}** os requisitos\n"
+                    f"**Período:** {period_start.strftime('%d/%m/%Y')} a {period_end.strftime('%d/%m/%Y')}\n"
+                    f"**Dias Restantes:** {days_remaining}"
                 ),
                 inline=True
             )
 
+            progress = min(1.0, valid_days_count / required_days) if required_days > 0 else 1.0
+            progress_bar = "[" + "█" * int(progress * 10) + " " * (10 - int(progress * 10)) + "]"
+            progress_text = f"{progress*100:.0f}% ({valid_days_count}/{required_days} dias)"
+
             embed.add_field(
-                name="📋 Requisitos do Servidor",
-                value=(
-                    f"**Minutos necessários:** {required_min} min\n"
-                    f"**Dias necessários:** {required_days} dias\n"
-                    f"**Período de monitoramento:** {monitoring_period} dias"
-                ),
+                name="📊 Progresso no Período",
+                value=f"{progress_bar}\n{progress_text}",
+                inline=False
+            )
+        else:
+             embed.add_field(
+                name="🔄 Status Atual",
+                value="Não foi possível determinar o período (sem cargos monitorados ou histórico).",
                 inline=True
             )
-            
-            now = datetime.now(pytz.utc)
-            period_duration_days = bot.config.get('monitoring_period', 14)
-            period_start = None
-            anchor_date = None
-
-            tracked_roles_ids = bot.config.get('tracked_roles', [])
-            member_tracked_roles = [role for role in member.roles if role.id in tracked_roles_ids]
-            
-            if member_tracked_roles:
-                assigned_times = await asyncio.gather(*[
-                    bot.db.get_role_assigned_time(member.id, member.guild.id, role.id) for role in member_tracked_roles
-                ])
-                valid_times = [t for t in assigned_times if t is not None]
-                if valid_times:
-                    anchor_date = max(valid_times)
-                    if anchor_date.tzinfo is None:
-                         anchor_date = anchor_date.replace(tzinfo=pytz.utc)
-
-            if not anchor_date:
-                last_check = await conn.fetchrow(
-                    "SELECT period_start FROM checked_periods WHERE user_id = $1 AND guild_id = $2 ORDER BY period_start DESC LIMIT 1",
-                    member.id, member.guild.id
-                )
-                if last_check and last_check['period_start']:
-                    anchor_date = last_check['period_start']
-                    if anchor_date.tzinfo is None:
-                        anchor_date = anchor_date.replace(tzinfo=pytz.utc)
-
-            if anchor_date:
-                time_since_anchor = now - anchor_date
-                periods_passed = time_since_anchor.days // period_duration_days
-                
-                period_start = anchor_date + timedelta(days=periods_passed * period_duration_days)
-                period_end = period_start + timedelta(days=period_duration_days)
-
-                valid_days_current_period = set()
-                current_period_sessions = await conn.fetch(
-                    "SELECT join_time, duration FROM voice_sessions WHERE user_id = $1 AND guild_id = $2 AND join_time >= $3 AND join_time < $4",
-                    member.id, member.guild.id, period_start, period_end
-                )
-                
-                for session in current_period_sessions:
-                    if session['duration'] >= (required_min * 60):
-                        valid_days_current_period.add(session['join_time'].date())
-
-                is_complying = len(valid_days_current_period) >= required_days
-                status_emoji = "✅" if is_complying else "⚠️"
-                status_text = "Cumprindo" if is_complying else "Não cumprindo"
-                days_remaining = max(0, (period_end - now).days)
-
-                embed.add_field(
-                    name="🔄 Status Atual",
-                    value=(
-                        f"{status_emoji} **{status_text}** os requisitos\n"
-                        f"**Período:** {period_start.strftime('%d/%m/%Y')} a {period_end.strftime('%d/%m/%Y')}\n"
-                        f"**Dias Restantes:** {days_remaining}"
-                    ),
-                    inline=True
-                )
-
-                progress = min(1.0, len(valid_days_current_period) / required_days) if required_days > 0 else 1.0
-                progress_bar = "[" + "█" * int(progress * 10) + " " * (10 - int(progress * 10)) + "]"
-                progress_text = f"{progress*100:.0f}% ({len(valid_days_current_period)}/{required_days} dias)"
-
-                embed.add_field(
-                    name="📊 Progresso no Período",
-                    value=f"{progress_bar}\n{progress_text}",
-                    inline=False
-                )
-            else:
-                 embed.add_field(
-                    name="🔄 Status Atual",
-                    value="Não foi possível determinar o período (sem cargos monitorados ou histórico).",
-                    inline=True
-                )
 
-            all_warnings = await conn.fetch(
-                "SELECT warning_type, warning_date FROM user_warnings WHERE user_id = $1 AND guild_id = $2 ORDER BY warning_date DESC LIMIT 3",
-                member.id, member.guild.id
+        if snapshot['warnings']:
+            warnings_text = "\n".join(
+                f"• {warning_type.capitalize()} - {warning_date.strftime('%d/%m/%Y %H:%M')} (UTC)"
+                for warning_type, warning_date in snapshot['warnings']
+            )
+            embed.add_field(
+                name="⚠️ Histórico de Avisos",
+                value=warnings_text,
+                inline=False
             )
 
-            if all_warnings:
-                warnings_text = "\n".join(
-                    f"• {warn['warning_type'].capitalize()} - {warn['warning_date'].strftime('%d/%m/%Y %H:%M')} (UTC)"
-                    for warn in all_warnings
-                )
-                embed.add_field(
-                    name="⚠️ Histórico de Avisos",
-                    value=warnings_text,
-                    inline=False
-                )
+        if tracked_roles:
+            embed.add_field(
+                name="🎖️ Cargos Monitorados",
+                value="\n".join(role.mention for role in tracked_roles),
+                inline=True
+            )
+            assignment_info = []
+            for role in tracked_roles:
+                assigned_at = snapshot['role_assignments'].get(role.id)
+                if assigned_at:
+                    assignment_info.append(f"• {role.mention}: {assigned_at.strftime('%d/%m/%Y')}")
+                else:
+                    assignment_info.append(f"• {role.mention}: Data desconhecida")
 
-            tracked_roles = [role for role in member.roles if role.id in bot.config['tracked_roles']]
-            if tracked_roles:
-                embed.add_field(
-                    name="🎖️ Cargos Monitorados",
-                    value="\n".join(role.mention for role in tracked_roles),
-                    inline=True
-                )
-                assignment_info = []
-                for role in tracked_roles:
-                    assigned_at = await conn.fetchval(
-                        "SELECT assigned_at FROM role_assignments WHERE user_id = $1 AND guild_id = $2 AND role_id = $3",
-                        member.id, member.guild.id, role.id
-                    )
-                    if assigned_at:
-                        assignment_info.append(f"• {role.mention}: {assigned_at.strftime('%d/%m/%Y')}")
-                    else:
-                        assignment_info.append(f"• {role.mention}: Data desconhecida")
-
-                embed.add_field(
-                    name="📅 Data de Atribuição",
-                    value="\n".join(assignment_info),
-                    inline=True
-                )
+            embed.add_field(
+                name="📅 Data de Atribuição",
+                value="\n".join(assignment_info),
+                inline=True
+            )
 
-            if voice_sessions_param:
-                try:
-                    report_file = await generate_activity_report(member, voice_sessions_param, days)
-                    if report_file:
-                        await interaction.followup.send(embed=embed, file=report_file)
-                        return
-                except Exception as e:
-                    logger.error(f"Erro ao gerar gráfico: {e}")
+        if sessions_count:
+            try:
+                report_file = await generate_activity_report(member, None, days, interaction.user.id, bins=bins)
+                if report_file:
+                    await interaction.followup.send(embed=embed, file=report_file)
+                    return
+            except Exception as e:
+                logger.error(f"Erro ao gerar gráfico: {e}")
 
-            await interaction.followup.send(embed=embed)
+        await interaction.followup.send(embed=embed)
 
     except asyncpg.PostgresError as db_error:
         logger.error(f"Erro de banco de dados: {db_error}")
@@ -1109,7 +1069,6 @@ async def user_activity(interaction: discord.Interaction, member: discord.Member
     limit="Número de usuários para mostrar (3-20)"
 )
 @allowed_roles_only()
-@app_commands.checks.cooldown(1, 60.0, key=lambda i: (i.guild_id, i.user.id))
 async def activity_ranking(interaction: discord.Interaction, days: int = 7, limit: int = 5):
     """Mostra os usuários mais ativos no servidor"""
     if days < 1 or days > 30:
@@ -1127,37 +1086,43 @@ async def activity_ranking(interaction: discord.Interaction, days: int = 7, limi
     if not await check_db_connection(interaction):
         return
 
-    end_date = datetime.now(pytz.utc)
-    start_date = end_date - timedelta(days=days)
-
-    async with bot.db.pool.acquire() as conn:
-        top_results = await conn.fetch('''
-            SELECT
-                user_id,
-                SUM(duration) as total_time,
-                COUNT(DISTINCT DATE(join_time)) as active_days,
-                COUNT(*) as session_count,
-                AVG(duration) as avg_duration
-            FROM voice_sessions
-            WHERE guild_id = $1
-            AND join_time >= $2
-            AND leave_time <= $3
-            GROUP BY user_id
-            ORDER BY total_time DESC
-            LIMIT $4
-        ''', interaction.guild.id, start_date, end_date, limit)
-
-        general_stats = await conn.fetchrow('''
-            SELECT
-                COUNT(DISTINCT user_id) as total_users,
-                COUNT(*) as total_sessions,
-                SUM(duration) as total_time
-            FROM voice_sessions
-            WHERE guild_id = $1
-            AND join_time >= $2
-            AND leave_time <= $3
-        ''', interaction.guild.id, start_date, end_date)
-
+    # Ranking incremental em memória; consulta agregada só enquanto a guilda não foi carregada
+    ranking_data = bot.leaderboard.get_ranking(interaction.guild.id, days, limit) if bot.leaderboard else None
+    if ranking_data is not None:
+        top_results = ranking_data['top']
+        general_stats = ranking_data
+    else:
+        end_date = datetime.now(pytz.utc)
+        start_date = end_date - timedelta(days=days)
+    
+        async with bot.db.pool.acquire() as conn:
+            top_results = await conn.fetch('''
+                SELECT
+                    user_id,
+                    SUM(duration) as total_time,
+                    COUNT(DISTINCT DATE(join_time)) as active_days,
+                    COUNT(*) as session_count,
+                    AVG(duration) as avg_duration
+                FROM voice_sessions
+                WHERE guild_id = $1
+                AND join_time >= $2
+                AND leave_time <= $3
+                GROUP BY user_id
+                ORDER BY total_time DESC
+                LIMIT $4
+            ''', interaction.guild.id, start_date, end_date, limit)
+    
+            general_stats = await conn.fetchrow('''
+                SELECT
+                    COUNT(DISTINCT user_id) as total_users,
+                    COUNT(*) as total_sessions,
+                    SUM(duration) as total_time
+                FROM voice_sessions
+                WHERE guild_id = $1
+                AND join_time >= $2
+                AND leave_time <= $3
+            ''', interaction.guild.id, start_date, end_date)
+    
     if not top_results:
         embed = discord.Embed(
             title=f"🏆 Ranking de Atividade (últimos {days} dias)",
@@ -1287,6 +1252,8 @@ async def force_check(interaction: discord.Interaction, member: discord.Member):
             f"**Dias válidos:** {result['valid_days']}/{result['required_days']}\n"
             f"**Sessões no período:** {result['sessions_count']}"
         )
+        if result.get('active_since'):
+            embed.description += f"\n🎙️ Em chamada agora, desde <t:{int(result['active_since'].timestamp())}:R>"
         embed.color = discord.Color.orange()
 
         embed.add_field(
@@ -1325,6 +1292,8 @@ async def force_check(interaction: discord.Interaction, member: discord.Member):
 
                 try:
                     start_time = time.time()
+                    await bot.api_budget.acquire('interactive', cost=len(member_tracked_roles))
+                    await bot.rate_limit_monitor.acquire_role_edit(member, member_tracked_roles)
                     await member.remove_roles(*member_tracked_roles)
                     perf_metrics.record_api_call(time.time() - start_time)
 
@@ -1392,6 +1361,151 @@ async def force_check_error(interaction: discord.Interaction, error: app_command
     except Exception as e:
         logger.error(f"Erro ao tratar erro do comando force_check: {e}")
 
+def _bulk_check_embed(runner, role: Optional[discord.Role]) -> discord.Embed:
+    titles = {
+        'running': ("⏳ Verificação em Massa em Andamento", discord.Color.blue()),
+        'completed': ("✅ Verificação em Massa Concluída", discord.Color.green()),
+        'cancelled': ("⏹️ Verificação em Massa Cancelada", discord.Color.orange()),
+        'failed': ("❌ Verificação em Massa Interrompida", discord.Color.red())
+    }
+    title, color = titles.get(runner.status, titles['running'])
+    embed = discord.Embed(
+        title=title,
+        description=f"**Alvo:** {role.mention if role else 'todos os cargos monitorados'}",
+        color=color,
+        timestamp=datetime.now(pytz.utc)
+    )
+    embed.add_field(name="Progresso", value=f"{runner.position}/{runner.total} membros", inline=True)
+    embed.add_field(name="Cargos Removidos", value=str(runner.counters['removed']), inline=True)
+    embed.add_field(name="Avisos Planejados", value=str(runner.counters['warnings']), inline=True)
+    if runner.status in ('cancelled', 'failed'):
+        embed.add_field(
+            name="Retomar",
+            value="Use `/force_check_bulk retomar:True` para continuar de onde parou.",
+            inline=False
+        )
+    embed.set_footer(text=f"Execução #{runner.run_id} | {time.monotonic() - runner.started:.0f}s")
+    return embed
+
+class BulkCheckView(discord.ui.View):
+    """Botão de cancelamento de uma verificação em massa"""
+
+    def __init__(self, author: discord.User, runner):
+        super().__init__(timeout=None)
+        self.author = author
+        self.runner = runner
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author.id:
+            await interaction.response.send_message(
+                "❌ Apenas quem executou o comando pode usar estes botões.",
+                ephemeral=True
+            )
+            return False
+        return True
+
+    @discord.ui.button(label="Cancelar", style=discord.ButtonStyle.red)
+    async def cancel_callback(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.runner.cancel()
+        button.disabled = True
+        await interaction.response.edit_message(view=self)
+
+@bot.tree.command(name="force_check_bulk", description="Força a verificação de inatividade de todos os membros de um cargo (ou do servidor)")
+@app_commands.describe(
+    cargo="Cargo a verificar (padrão: todos os membros com cargos monitorados)",
+    retomar="Retoma a última verificação em massa cancelada ou interrompida"
+)
+@app_commands.checks.cooldown(1, 60.0, key=lambda i: i.guild_id)
+@allowed_roles_only()
+@commands.has_permissions(administrator=True)
+async def force_check_bulk(interaction: discord.Interaction, cargo: Optional[discord.Role] = None, retomar: bool = False):
+    """Avalia muitos membros com a mesma lógica da verificação periódica, em lotes pré-carregados"""
+    await interaction.response.defer(thinking=True)
+
+    if not await check_db_connection(interaction):
+        return
+
+    guild = interaction.guild
+    if guild.id in bot.bulk_checks:
+        await interaction.followup.send("⚠️ Já existe uma verificação em massa em andamento neste servidor.", ephemeral=True)
+        return
+
+    from tasks import BulkForceCheck
+
+    if retomar:
+        pending = await bot.db.get_resumable_bulk_check_run(guild.id)
+        if not pending:
+            await interaction.followup.send("ℹ️ Não há verificação em massa pendente para retomar.", ephemeral=True)
+            return
+        cargo = guild.get_role(pending['role_id']) if pending['role_id'] else None
+        runner = BulkForceCheck(
+            bot, guild, pending['id'], list(pending['member_ids']), position=pending['position'],
+            counters={key: pending[key] for key in ('processed', 'removed', 'warnings')}
+        )
+    else:
+        tracked_role_ids = set(bot.config['tracked_roles'])
+        if cargo is not None and cargo.id not in tracked_role_ids:
+            await interaction.followup.send(f"❌ O cargo {cargo.mention} não é monitorado.", ephemeral=True)
+            return
+
+        member_ids = sorted(
+            member.id for member in (cargo.members if cargo else guild.members)
+            if not member.bot and any(role.id in tracked_role_ids for role in member.roles)
+        )
+        if not member_ids:
+            await interaction.followup.send("ℹ️ Nenhum membro com cargos monitorados para verificar.", ephemeral=True)
+            return
+        run_id = await bot.db.create_bulk_check_run(guild.id, cargo.id if cargo else None, interaction.user.id, member_ids)
+        runner = BulkForceCheck(bot, guild, run_id, member_ids)
+
+    view = BulkCheckView(interaction.user, runner)
+    message = await interaction.followup.send(embed=_bulk_check_embed(runner, cargo), view=view, wait=True)
+    # Edições pelo canal (token do bot) continuam funcionando depois que o token da interação expira
+    progress_message = interaction.channel.get_partial_message(message.id)
+
+    async def on_progress(current):
+        try:
+            await progress_message.edit(embed=_bulk_check_embed(current, cargo))
+        except discord.HTTPException as e:
+            logger.warning(f"Não foi possível atualizar o progresso da verificação em massa: {e}")
+
+    async def run_in_background():
+        try:
+            status = await runner.run(on_progress=on_progress)
+        finally:
+            bot.bulk_checks.pop(guild.id, None)
+            view.stop()
+        try:
+            await progress_message.edit(embed=_bulk_check_embed(runner, cargo), view=None)
+        except discord.HTTPException as e:
+            logger.warning(f"Não foi possível atualizar o resultado da verificação em massa: {e}")
+        await bot.log_action(
+            "Verificação Forçada em Massa",
+            interaction.user,
+            f"Alvo: {cargo.mention if cargo else 'todos os cargos monitorados'}\n"
+            f"Status: {status} | Membros: {runner.position}/{runner.total} | "
+            f"Cargos removidos: {runner.counters['removed']} | Avisos: {runner.counters['warnings']}"
+        )
+
+    bot.bulk_checks[guild.id] = runner
+    bot.loop.create_task(run_in_background(), name=f'force_check_bulk_{guild.id}')
+
+@force_check_bulk.error
+async def force_check_bulk_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    """Trata erros do comando force_check_bulk"""
+    try:
+        if isinstance(error, app_commands.CommandOnCooldown):
+            msg = f"⏳ Este comando está em cooldown. Tente novamente em {error.retry_after:.1f} segundos."
+        else:
+            logger.error(f"Erro no comando force_check_bulk: {error}")
+            msg = "❌ Ocorreu um erro ao executar este comando."
+        if not interaction.response.is_done():
+            await interaction.response.send_message(msg, ephemeral=True)
+        else:
+            await interaction.followup.send(msg, ephemeral=True)
+    except Exception as e:
+        logger.error(f"Erro ao tratar erro do comando force_check_bulk: {e}")
+
 @bot.tree.command(name="cleanup_data", description="Limpa dados antigos do banco de dados")
 @allowed_roles_only()
 @commands.has_permissions(administrator=True)
@@ -1451,6 +1565,512 @@ async def cleanup_data(interaction: discord.Interaction, days: int = 60):
             ephemeral=True
         )
 
+@bot.tree.command(name="rate_limit_report", description="Mostra o consumo da API do Discord por endpoint e hora")
+@app_commands.describe(horas="Janela do relatório em horas (1 a 168, padrão 24)")
+@allowed_roles_only()
+@commands.has_permissions(administrator=True)
+async def rate_limit_report(interaction: discord.Interaction, horas: app_commands.Range[int, 1, 168] = 24):
+    """Relatório agregado (no banco) das observações de rate limit gravadas pela telemetria"""
+    try:
+        await interaction.response.defer(thinking=True, ephemeral=True)
+
+        if not await check_db_connection(interaction):
+            return
+
+        # Garante que as observações em memória entrem no relatório
+        await bot.rate_limit_telemetry.flush()
+        report = await bot.db.get_rate_limit_report(interaction.guild.id, hours=horas, limit=500)
+
+        if not report['endpoints']:
+            await interaction.followup.send(
+                f"ℹ️ Nenhuma observação de rate limit nas últimas {horas} horas.", ephemeral=True)
+            return
+
+        # Totais já vêm agregados por endpoint no banco; as linhas por hora servem só de detalhe
+        hours_by_endpoint = defaultdict(list)
+        for row in report['hourly']:
+            hours_by_endpoint[row['endpoint']].append(row)
+
+        embed = discord.Embed(
+            title="📡 Consumo da API do Discord",
+            description=f"Últimas {horas} horas — requisições estimadas a partir das amostras gravadas.",
+            color=discord.Color.blue(),
+            timestamp=datetime.now(pytz.utc)
+        )
+
+        ranked = report['endpoints']
+        for total in ranked[:10]:
+            hourly = ", ".join(
+                f"{row['hour'].astimezone(bot.timezone).strftime('%d/%m %Hh')}: {float(row['estimated_requests'] or 0):.0f}"
+                for row in hours_by_endpoint[total['endpoint']][:4]
+            ) or "N/A"
+            value = (
+                f"Requisições: ~{float(total['estimated_requests'] or 0):.0f} | 429: {total['rate_limited']} | "
+                f"Menor cota restante: {total['min_remaining'] if total['min_remaining'] is not None else 'N/A'}\n"
+                f"Por hora: {hourly}"
+            )
+            embed.add_field(name=f"`{total['endpoint'][:240]}`", value=value[:1024], inline=False)
+
+        if len(ranked) > 10:
+            embed.set_footer(text=f"Mostrando 10 de {len(ranked)} endpoints")
+
+        telemetry = bot.rate_limit_telemetry.stats
+        embed.add_field(
+            name="Telemetria",
+            value=(
+                f"Observadas: {telemetry['observed']} | Amostradas: {telemetry['sampled']} | "
+                f"Gravadas: {telemetry['written']} | Descartadas: {telemetry['dropped']}"
+            ),
+            inline=False
+        )
+
+        await interaction.followup.send(embed=embed, ephemeral=True)
+    except Exception as e:
+        logger.error(f"Erro ao gerar relatório de rate limits: {e}", exc_info=True)
+        await interaction.followup.send(
+            "❌ Ocorreu um erro ao gerar o relatório de rate limits.",
+            ephemeral=True
+        )
+
+AT_RISK_PAGE_SIZE = 10
+
+def _risk_marker(row: Dict) -> str:
+    if row['days_missing'] > row['days_remaining']:
+        return "🔴"  # Não há dias suficientes para cumprir
+    if row['risk'] >= 0.5:
+        return "🟠"
+    return "🟡"
+
+class AtRiskView(discord.ui.View):
+    """Paginação do relatório /at_risk (cada página é uma nova consulta com OFFSET)"""
+
+    def __init__(self, author: discord.User, guild: discord.Guild, user_ids: List[int], tracked_role_ids: List[int]):
+        super().__init__(timeout=300)
+        self.author = author
+        self.guild = guild
+        self.user_ids = user_ids
+        self.tracked_role_ids = tracked_role_ids
+        self.page = 0
+        self.total = 0
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author.id:
+            await interaction.response.send_message(
+                "❌ Apenas quem executou o comando pode usar estes botões.",
+                ephemeral=True
+            )
+            return False
+        return True
+
+    async def build_embed(self) -> discord.Embed:
+        required_days = bot.config['required_days']
+        monitoring_period = bot.config['monitoring_period']
+
+        start_time = time.time()
+        report = await bot.db.get_at_risk_members(
+            self.guild.id, self.user_ids, self.tracked_role_ids, datetime.now(pytz.utc),
+            monitoring_period, str(bot.timezone), bot.config['required_minutes'] * 60, required_days,
+            limit=AT_RISK_PAGE_SIZE, offset=self.page * AT_RISK_PAGE_SIZE
+        )
+        self.total = report['total']
+        if not report['members'] and self.total and self.page:
+            # A lista encolheu desde a última página: volta para a última página existente
+            self.page = (self.total - 1) // AT_RISK_PAGE_SIZE
+            report = await bot.db.get_at_risk_members(
+                self.guild.id, self.user_ids, self.tracked_role_ids, datetime.now(pytz.utc),
+                monitoring_period, str(bot.timezone), bot.config['required_minutes'] * 60, required_days,
+                limit=AT_RISK_PAGE_SIZE, offset=self.page * AT_RISK_PAGE_SIZE
+            )
+            self.total = report['total']
+        perf_metrics.record_db_query(time.time() - start_time)
+        rows = report['members']
+
+        embed = discord.Embed(
+            title="⚠️ Membros em Risco no Período Atual",
+            color=discord.Color.orange(),
+            timestamp=datetime.now(pytz.utc)
+        )
+        if not rows:
+            embed.description = "✅ Nenhum membro monitorado está abaixo dos requisitos no período atual."
+            embed.color = discord.Color.green()
+        else:
+            lines = []
+            for position, row in enumerate(rows, start=self.page * AT_RISK_PAGE_SIZE + 1):
+                member = self.guild.get_member(row['user_id'])
+                name = member.mention if member else f"<@{row['user_id']}>"
+                no_anchor = " (sem registro de cargo, período provisório)" if row['no_anchor'] else ""
+                lines.append(
+                    f"{_risk_marker(row)} **{position}.** {name}{no_anchor} — "
+                    f"{row['valid_days']}/{required_days} dias, {row['total_seconds'] // 60} min | "
+                    f"faltam {row['days_missing']} dia(s) em {row['days_remaining']} restante(s) | "
+                    f"déficit projetado: {row['projected_shortfall']:.1f} dia(s)"
+                )
+            embed.description = "\n".join(lines)
+
+        pages = max(1, -(-self.total // AT_RISK_PAGE_SIZE))
+        embed.set_footer(
+            text=f"Página {self.page + 1}/{pages} | {self.total} em risco de {len(self.user_ids)} monitorados | "
+                 f"🔴 sem dias suficientes · 🟠 risco alto · 🟡 atenção"
+        )
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page + 1 >= pages
+        return embed
+
+    @discord.ui.button(label="◀ Anterior", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(0, self.page - 1)
+        await interaction.response.defer()
+        await interaction.edit_original_response(embed=await self.build_embed(), view=self)
+
+    @discord.ui.button(label="Próxima ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await interaction.response.defer()
+        await interaction.edit_original_response(embed=await self.build_embed(), view=self)
+
+@bot.tree.command(name="at_risk", description="Lista os membros monitorados que estão abaixo dos requisitos no período atual")
+@allowed_roles_only()
+async def at_risk(interaction: discord.Interaction):
+    """Relatório de membros em risco, calculado no banco para todos os membros monitorados"""
+    await interaction.response.defer(thinking=True, ephemeral=True)
+
+    if not await check_db_connection(interaction):
+        return
+
+    tracked_role_ids = bot.config['tracked_roles']
+    whitelist = bot.config['whitelist']
+    user_ids = [
+        member.id for member in interaction.guild.members
+        if not member.bot
+        and member.id not in whitelist['users']
+        and not any(role.id in whitelist['roles'] for role in member.roles)
+        and any(role.id in tracked_role_ids for role in member.roles)
+    ]
+
+    if not user_ids:
+        await interaction.followup.send("ℹ️ Nenhum membro com cargos monitorados encontrado.", ephemeral=True)
+        return
+
+    try:
+        view = AtRiskView(interaction.user, interaction.guild, user_ids, tracked_role_ids)
+        embed = await view.build_embed()
+        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+    except Exception as e:
+        logger.error(f"Erro ao gerar relatório de membros em risco: {e}", exc_info=True)
+        await interaction.followup.send("❌ Ocorreu um erro ao calcular os membros em risco.", ephemeral=True)
+
+@bot.tree.command(name="simulate_requirements", description="Simula o efeito de novos requisitos de atividade sem alterar nada")
+@app_commands.describe(
+    minutos="Minutos mínimos por sessão (padrão: valor atual)",
+    dias="Dias válidos exigidos por período (padrão: valor atual)",
+    periodo="Período de monitoramento em dias (padrão: valor atual)"
+)
+@app_commands.checks.cooldown(1, 30.0, key=lambda i: i.guild_id)
+@allowed_roles_only()
+@commands.has_permissions(administrator=True)
+async def simulate_requirements(interaction: discord.Interaction,
+                                minutos: Optional[app_commands.Range[int, 1, 1440]] = None,
+                                dias: Optional[app_commands.Range[int, 1, 365]] = None,
+                                periodo: Optional[app_commands.Range[int, 1, 365]] = None):
+    """Reaplica a avaliação de inatividade ao histórico com valores candidatos (execução a seco)"""
+    await interaction.response.defer(thinking=True, ephemeral=True)
+
+    if not await check_db_connection(interaction):
+        return
+
+    current = (bot.config['required_minutes'], bot.config['required_days'], bot.config['monitoring_period'])
+    candidate = (minutos or current[0], dias or current[1], periodo or current[2])
+    if candidate[1] > candidate[2]:
+        await interaction.followup.send(
+            f"❌ {candidate[1]} dias exigidos não cabem em um período de {candidate[2]} dias.", ephemeral=True
+        )
+        return
+
+    from simulation import RequirementsSimulation, eligible_members
+
+    members = eligible_members(bot, interaction.guild)
+    if not members:
+        await interaction.followup.send("ℹ️ Nenhum membro com cargos monitorados para simular.", ephemeral=True)
+        return
+
+    try:
+        simulation = await RequirementsSimulation.load(bot, interaction.guild, members)
+        perf_metrics.record_db_query(simulation.load_seconds)
+
+        first_warning_days = bot.config.get('warnings', {}).get('first_warning', 7)
+        started = time.perf_counter()
+        # Avaliação vetorizada fora do event loop
+        baseline, simulated = await asyncio.to_thread(
+            lambda: [simulation.run(*params, first_warning_days, bot.timezone) for params in (current, candidate)]
+        )
+        evaluation_seconds = time.perf_counter() - started
+    except Exception as e:
+        logger.error(f"Erro ao simular requisitos: {e}", exc_info=True)
+        await interaction.followup.send("❌ Ocorreu um erro ao simular os requisitos.", ephemeral=True)
+        return
+
+    embed = discord.Embed(
+        title="🧪 Simulação de Requisitos",
+        description=(
+            f"**Simulado:** {candidate[0]} min/sessão, {candidate[1]} dias a cada {candidate[2]} dias\n"
+            f"**Atual:** {current[0]} min/sessão, {current[1]} dias a cada {current[2]} dias\n"
+            f"Nada foi alterado: nenhum aviso enviado e nenhum cargo removido."
+        ),
+        color=discord.Color.blurple(),
+        timestamp=datetime.now(pytz.utc)
+    )
+    for key, label in (('pass', "✅ Cumprem o período atual"), ('pending', "⏳ Ainda no prazo"),
+                       ('warn', "⚠️ Receberiam aviso"), ('lose', "🚨 Perderiam os cargos")):
+        delta = simulated[key] - baseline[key]
+        embed.add_field(
+            name=label,
+            value=f"**{simulated[key]}** (hoje: {baseline[key]}, {delta:+d})",
+            inline=True
+        )
+    if simulation.without_anchor:
+        embed.add_field(
+            name="Sem data de referência",
+            value=f"{simulation.without_anchor} membros ainda não têm período iniciado e não entram na simulação.",
+            inline=False
+        )
+    embed.set_footer(
+        text=f"{len(simulation.users)} membros, {len(simulation.sessions)} sessões | "
+             f"carga {simulation.load_seconds:.2f}s, avaliação {evaluation_seconds:.2f}s"
+    )
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@simulate_requirements.error
+async def simulate_requirements_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    """Trata erros do comando simulate_requirements"""
+    try:
+        if isinstance(error, app_commands.CommandOnCooldown):
+            msg = f"⏳ Este comando está em cooldown. Tente novamente em {error.retry_after:.1f} segundos."
+        else:
+            logger.error(f"Erro no comando simulate_requirements: {error}")
+            msg = "❌ Ocorreu um erro ao executar este comando."
+        if not interaction.response.is_done():
+            await interaction.response.send_message(msg, ephemeral=True)
+        else:
+            await interaction.followup.send(msg, ephemeral=True)
+    except Exception as e:
+        logger.error(f"Erro ao tratar erro do comando simulate_requirements: {e}")
+
+MAX_EXPORT_UPLOADS = 10
+
+# Intervalos do gráfico de ocupação (segundos); usa o menor que gere até 96 pontos
+OCCUPANCY_BUCKETS = [300, 900, 1800, 3600, 7200]
+
+@bot.tree.command(name="voice_occupancy", description="Mostra o pico e a média de pessoas em voz ao longo do tempo")
+@app_commands.describe(
+    horas="Janela em horas (1-168)",
+    canal="Canal de voz específico (padrão: servidor inteiro)"
+)
+@allowed_roles_only()
+async def voice_occupancy(interaction: discord.Interaction, horas: app_commands.Range[int, 1, 168] = 24,
+                          canal: Optional[discord.VoiceChannel] = None):
+    """Curva de ocupação de voz a partir das amostras gravadas pelo VoiceOccupancySampler"""
+    await interaction.response.defer(thinking=True)
+
+    if not await check_db_connection(interaction):
+        return
+
+    guild = interaction.guild
+    try:
+        # Inclui as amostras ainda não gravadas
+        await bot.voice_occupancy.flush(guild.id)
+    except Exception as e:
+        logger.warning(f"Não foi possível gravar amostras pendentes de ocupação: {e}")
+
+    bucket_seconds = next((b for b in OCCUPANCY_BUCKETS if horas * 3600 / b <= 96), OCCUPANCY_BUCKETS[-1])
+    start_time = time.time()
+    rows = await bot.db.get_voice_occupancy(
+        guild.id, canal.id if canal else 0, datetime.now(pytz.utc) - timedelta(hours=horas), bucket_seconds
+    )
+    perf_metrics.record_db_query(time.time() - start_time)
+
+    target = canal.mention if canal else "o servidor"
+    if not rows:
+        await interaction.followup.send(f"ℹ️ Ainda não há amostras de ocupação para {target} nas últimas {horas}h.")
+        return
+
+    label_format = '%H:%M' if horas <= 24 else '%d/%m %H:%M'
+    labels = [row['bucket'].astimezone(bot.timezone).strftime(label_format) for row in rows]
+    peaks = [int(row['peak']) for row in rows]
+    averages = [float(row['average'] or 0) for row in rows]
+    peak_row = max(rows, key=lambda row: row['peak'])
+    title = f"Ocupação de Voz - {canal.name if canal else guild.name}\nÚltimas {horas}h (intervalos de {bucket_seconds // 60} min)"
+
+    embed = discord.Embed(
+        title=f"🔊 Ocupação de Voz - últimas {horas}h",
+        description=f"Pessoas em voz em {target}.",
+        color=discord.Color.blue(),
+        timestamp=datetime.now(pytz.utc)
+    )
+    embed.add_field(
+        name="Pico",
+        value=f"{peak_row['peak']} pessoas <t:{int(peak_row['bucket'].timestamp())}:f>",
+        inline=True
+    )
+    embed.add_field(name="Média", value=f"{sum(averages) / len(averages):.1f} pessoas", inline=True)
+
+    try:
+        png = await chart_renderer.render(render_occupancy_chart, labels, peaks, averages, title)
+    except ChartQueueFull:
+        embed.set_footer(text="Muitos gráficos em renderização no momento; tente novamente em instantes.")
+        await interaction.followup.send(embed=embed)
+        return
+    except Exception as e:
+        logger.error(f"Erro ao renderizar gráfico de ocupação: {e}", exc_info=True)
+        await interaction.followup.send(embed=embed)
+        return
+
+    embed.set_image(url="attachment://ocupacao_voz.png")
+    await interaction.followup.send(embed=embed, file=discord.File(BytesIO(png), filename="ocupacao_voz.png"))
+
+@bot.tree.command(name="activity_heatmap", description="Mostra em quais dias da semana e horários há mais atividade em voz")
+@app_commands.describe(
+    dias="Janela em dias (7-90)",
+    membro="Membro específico (padrão: servidor inteiro)"
+)
+@allowed_roles_only()
+async def activity_heatmap(interaction: discord.Interaction, dias: app_commands.Range[int, 7, 90] = 30,
+                           membro: Optional[discord.Member] = None):
+    """Mapa de calor 7x24 dos minutos em voz por hora da semana, no fuso configurado"""
+    await interaction.response.defer(thinking=True)
+
+    if not await check_db_connection(interaction):
+        return
+
+    guild = interaction.guild
+    try:
+        start_time = time.time()
+        entry = await bot.heatmaps.get(guild.id, dias, membro.id if membro else None)
+        perf_metrics.record_db_query(time.time() - start_time)
+    except Exception as e:
+        logger.error(f"Erro ao calcular mapa de calor de atividade: {e}", exc_info=True)
+        await interaction.followup.send("❌ Ocorreu um erro ao calcular o mapa de calor.")
+        return
+
+    target = membro.mention if membro else "o servidor"
+    minutes = entry.minutes
+    if not minutes.any():
+        await interaction.followup.send(f"ℹ️ Não há atividade em voz registrada para {target} nos últimos {dias} dias.")
+        return
+
+    weekday, hour = divmod(int(minutes.argmax()), 24)
+    by_weekday = minutes.sum(axis=1)
+    by_hour = minutes.sum(axis=0)
+    title = (f"Atividade por Hora da Semana - {membro.display_name if membro else guild.name}\n"
+             f"Últimos {dias} dias ({bot.timezone})")
+
+    embed = discord.Embed(
+        title=f"🗓️ Mapa de Calor - últimos {dias} dias",
+        description=f"Minutos em voz de {target} por dia da semana e hora ({bot.timezone}).",
+        color=discord.Color.blue(),
+        timestamp=datetime.now(pytz.utc)
+    )
+    embed.add_field(
+        name="Horário mais movimentado",
+        value=f"{WEEKDAYS_PT[weekday]}, {hour:02d}h-{(hour + 1) % 24:02d}h ({int(minutes[weekday, hour])} min)",
+        inline=False
+    )
+    embed.add_field(name="Dia mais ativo", value=WEEKDAYS_PT[int(by_weekday.argmax())], inline=True)
+    embed.add_field(name="Hora mais ativa", value=f"{int(by_hour.argmax()):02d}h", inline=True)
+    embed.add_field(name="Total", value=f"{minutes.sum() / 60:.1f} horas", inline=True)
+
+    png = entry.cached_png(title)
+    if png is None:
+        version = entry.version
+        try:
+            png = await chart_renderer.render(render_heatmap_chart, minutes.round(1).tolist(), WEEKDAYS_PT, title)
+        except ChartQueueFull:
+            embed.set_footer(text="Muitos gráficos em renderização no momento; tente novamente em instantes.")
+            await interaction.followup.send(embed=embed)
+            return
+        except Exception as e:
+            logger.error(f"Erro ao renderizar mapa de calor: {e}", exc_info=True)
+            await interaction.followup.send(embed=embed)
+            return
+        entry.store_png(version, title, png)
+
+    embed.set_image(url="attachment://mapa_calor.png")
+    await interaction.followup.send(embed=embed, file=discord.File(BytesIO(png), filename="mapa_calor.png"))
+
+@bot.tree.command(name="export_activity", description="Exporta sessões de voz, atividade e avisos em CSV compactado")
+@app_commands.describe(
+    days="Período em dias a exportar (1 a 365, padrão 30)",
+    tabela="Tabela a exportar (padrão: todas)"
+)
+@allowed_roles_only()
+@commands.has_permissions(administrator=True)
+@app_commands.checks.cooldown(1, 300.0, key=lambda i: i.guild_id)
+async def export_activity(interaction: discord.Interaction, days: app_commands.Range[int, 1, 365] = 30,
+                          tabela: Literal["todas", "voice_sessions", "user_activity", "user_warnings"] = "todas"):
+    """Exporta os dados de atividade da guilda via COPY, em partes .csv.gz dentro do limite de upload"""
+    await interaction.response.defer(thinking=True, ephemeral=True)
+
+    if not await check_db_connection(interaction):
+        return
+
+    from export_activity import export_guild_activity
+
+    end_date = datetime.now(pytz.utc)
+    start_date = end_date - timedelta(days=days)
+    tables = None if tabela == "todas" else [tabela]
+    # Margem para o overhead do multipart no upload
+    max_part_bytes = int(interaction.guild.filesize_limit * 0.95)
+
+    export_dir = tempfile.mkdtemp(prefix=f"export_{interaction.guild.id}_")
+    try:
+        results = await export_guild_activity(
+            bot.db, interaction.guild.id, start_date, end_date, export_dir,
+            tables=tables, max_part_bytes=max_part_bytes
+        )
+
+        paths = [path for writer in results.values() for path in writer.paths]
+        summary = "\n".join(
+            f"• **{table}**: {max(0, writer.rows - 1)} linhas em {len(writer.paths)} arquivo(s)"
+            for table, writer in results.items()
+        )
+
+        if len(paths) > MAX_EXPORT_UPLOADS:
+            await interaction.followup.send(
+                f"⚠️ A exportação gerou {len(paths)} arquivos, acima do limite de {MAX_EXPORT_UPLOADS} envios.\n"
+                f"{summary}\n\nReduza o período ou use `python export_activity.py --guild {interaction.guild.id} --days {days}`.",
+                ephemeral=True
+            )
+            return
+
+        await interaction.followup.send(
+            f"📦 Exportação dos últimos {days} dias concluída:\n{summary}", ephemeral=True)
+        for path in paths:
+            await interaction.followup.send(file=discord.File(path, filename=os.path.basename(path)), ephemeral=True)
+
+        await bot.log_action(
+            "Exportação de Atividade",
+            interaction.user,
+            f"Tabelas: {', '.join(results)} | Período: {days} dias | Arquivos: {len(paths)}"
+        )
+    except Exception as e:
+        logger.error(f"Erro ao exportar atividade: {e}", exc_info=True)
+        await interaction.followup.send("❌ Ocorreu um erro ao exportar os dados.", ephemeral=True)
+    finally:
+        await asyncio.to_thread(shutil.rmtree, export_dir, True)
+
+@export_activity.error
+async def export_activity_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    """Trata erros do comando export_activity"""
+    if isinstance(error, app_commands.CommandOnCooldown):
+        msg = f"⏳ Uma exportação foi feita recentemente. Tente novamente em {error.retry_after:.0f} segundos."
+    else:
+        logger.error(f"Erro inesperado em /export_activity: {error}", exc_info=True)
+        msg = "❌ Ocorreu um erro inesperado ao executar este comando."
+
+    if interaction.response.is_done():
+        await interaction.followup.send(msg, ephemeral=True)
+    else:
+        await interaction.response.send_message(msg, ephemeral=True)
+
 @bot.tree.command(name="set_log_channel", description="Define o canal para logs do bot")
 @allowed_roles_only()
 @commands.has_permissions(administrator=True)
@@ -1523,7 +2143,8 @@ class SmartRestoreView(discord.ui.View):
         restored_count = 0
         error_count = 0
         
-        batch_size = 3 
+        # Lotes apenas para o feedback de progresso; dentro do lote o limite é o do AIMD
+        batch_size = 20
         
         member_items = list(self.roles_to_restore.items())
 
@@ -1541,43 +2162,47 @@ class SmartRestoreView(discord.ui.View):
             await self.message.edit(
                 embed=discord.Embed(
                     title="⏳ Iniciando Devolução...",
-                    description=f"Processando {total_members} membros. Isso pode levar alguns instantes para evitar bloqueios do Discord.",
+                    description=f"Processando {total_members} membros. O ritmo segue o orçamento de API do bot para evitar bloqueios do Discord.",
                     color=discord.Color.blue()
                 ), view=None
             )
         except:
             pass
 
-        for i in range(0, total_members, batch_size):
-            batch = member_items[i:i + batch_size]
-            
-            for member, roles in batch:
-                if not roles:
-                    continue
-                    
-                try:
+        async def restore_member(member, roles):
+            nonlocal processed_count, restored_count, error_count
+            if not roles:
+                return
+                
+            try:
+                # Concorrência por guilda ajustada por AIMD (latência e 429)
+                async with bot.mutation_concurrency.slot(member.guild.id) as timing:
+                    await bot.api_budget.acquire('roles', cost=len(roles))
+                    await bot.rate_limit_monitor.acquire_role_edit(member, roles, add=True)
+                    timing.start()
                     await member.add_roles(*roles, reason=f"Reversão via /devolver_cargos por {self.author.name}.")
-                    restored_count += len(roles)
-                    
-                    await send_forgiveness_message(member, roles)
-                    
-                except discord.Forbidden:
-                    error_count += 1
-                    logger.warning(f"Permissão negada ao devolver cargos para {member.display_name}")
-                except discord.HTTPException as e:
-                    error_count += 1
-                    if e.status == 429:
-                        retry_after = float(e.response.headers.get('Retry-After', 5))
-                        logger.warning(f"Rate limit atingido na devolução. Pausando por {retry_after}s")
-                        await asyncio.sleep(retry_after + 1)
-                    else:
-                        logger.error(f"Erro HTTP ao devolver cargos para {member.display_name}: {e}")
-                except Exception as e:
-                    error_count += 1
-                    logger.error(f"Erro genérico ao devolver cargos: {e}")
+                restored_count += len(roles)
+                
+                await send_forgiveness_message(member, roles)
                 
-                processed_count += 1
-                await asyncio.sleep(1.5) 
+            except discord.Forbidden:
+                error_count += 1
+                logger.warning(f"Permissão negada ao devolver cargos para {member.display_name}")
+            except discord.HTTPException as e:
+                error_count += 1
+                if e.status == 429:
+                    logger.warning(f"Rate limit atingido na devolução de {member.display_name}; concorrência reduzida.")
+                else:
+                    logger.error(f"Erro HTTP ao devolver cargos para {member.display_name}: {e}")
+            except Exception as e:
+                error_count += 1
+                logger.error(f"Erro genérico ao devolver cargos: {e}")
+            
+            processed_count += 1
+
+        for i in range(0, total_members, batch_size):
+            batch = member_items[i:i + batch_size]
+            await asyncio.gather(*(restore_member(member, roles) for member, roles in batch))
 
             if i % (batch_size * 2) == 0:
                 try:
@@ -1589,8 +2214,6 @@ class SmartRestoreView(discord.ui.View):
                     await self.message.edit(embed=progress_embed)
                 except:
                     pass
-            
-            await asyncio.sleep(2)
 
         summary_embed = discord.Embed(
             title="✅ Operação Concluída",
@@ -0,0 +1,345 @@
+# charts.py
+"""
+Renderização de gráficos fora do event loop.
+
+As funções de renderização recebem apenas dados simples (listas, strings, números)
+e devolvem os bytes do PNG, para poderem rodar em processos separados. Este módulo
+não importa discord nem main: os processos filhos (contexto 'spawn') importam só ele.
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger('inactivity_bot')
+
+CHART_STYLE = {
+    'figure.dpi': 100,
+    'savefig.dpi': 100,
+    'axes.titlesize': 10,
+    'axes.labelsize': 8,
+    'xtick.labelsize': 7,
+    'ytick.labelsize': 7,
+    'font.size': 8,
+}
+
+_matplotlib_ready = False
+
+def _setup_matplotlib():
+    """Configura o matplotlib no processo de renderização (backend sem display)"""
+    global _matplotlib_ready
+    if _matplotlib_ready:
+        return
+    import matplotlib
+    matplotlib.use('Agg')
+    matplotlib.rcParams.update(CHART_STYLE)
+    _matplotlib_ready = True
+
+def render_activity_bar_chart(labels: List[str], values: List[float], title: str,
+                              xlabel: str = 'Data', ylabel: str = 'Minutos em Voz') -> bytes:
+    """Gráfico de barras de minutos por dia usando a API orientada a objetos (sem pyplot)"""
+    _setup_matplotlib()
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import matplotlib.style
+
+    with matplotlib.style.context('seaborn-v0_8'):
+        fig = Figure(figsize=(12, 6))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1, 1, 1)
+
+        bars = ax.bar(labels, values, color='#5865F2', width=0.7)
+
+        # Adicionar valores nas barras
+        for bar in bars:
+            height = bar.get_height()
+            if height > 0:
+                ax.text(bar.get_x() + bar.get_width() / 2., height,
+                        f'{int(height)} min',
+                        ha='center', va='bottom', fontsize=9)
+
+        ax.set_title(title, fontsize=12, pad=12)
+        ax.set_xlabel(xlabel, fontsize=10)
+        ax.set_ylabel(ylabel, fontsize=10)
+        ax.tick_params(axis='x', labelrotation=45, labelsize=8)
+        ax.tick_params(axis='y', labelsize=9)
+        max_value = max(values) if values else 0
+        ax.set_ylim(0, max_value * 1.2 if max_value > 0 else 100)
+        ax.grid(axis='y', alpha=0.4)
+        fig.tight_layout()
+
+        buffer = BytesIO()
+        fig.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
+        return buffer.getvalue()
+
+def render_occupancy_chart(labels: List[str], peaks: List[float], averages: List[float], title: str) -> bytes:
+    """Curvas de pico e média de pessoas em voz ao longo do tempo"""
+    _setup_matplotlib()
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import matplotlib.style
+
+    with matplotlib.style.context('seaborn-v0_8'):
+        fig = Figure(figsize=(12, 6))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1, 1, 1)
+
+        positions = list(range(len(labels)))
+        ax.fill_between(positions, averages, color='#5865F2', alpha=0.35, step='mid', label='Média')
+        ax.plot(positions, peaks, color='#ED4245', linewidth=1.5, drawstyle='steps-mid', label='Pico')
+
+        step = max(1, len(labels) // 16)
+        ax.set_xticks(positions[::step])
+        ax.set_xticklabels(labels[::step], rotation=45, ha='right')
+        ax.set_title(title, fontsize=12, pad=12)
+        ax.set_xlabel('Horário', fontsize=10)
+        ax.set_ylabel('Pessoas em voz', fontsize=10)
+        max_value = max(peaks) if peaks else 0
+        ax.set_ylim(0, max_value * 1.2 if max_value > 0 else 5)
+        ax.grid(axis='y', alpha=0.4)
+        ax.legend(loc='upper left')
+        fig.tight_layout()
+
+        buffer = BytesIO()
+        fig.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
+        return buffer.getvalue()
+
+def render_heatmap_chart(matrix: List[List[float]], row_labels: List[str], title: str) -> bytes:
+    """Mapa de calor dia da semana x hora (minutos em voz por célula)"""
+    _setup_matplotlib()
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(12, 4.5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+
+    image = ax.imshow(matrix, cmap='YlOrRd', aspect='auto', interpolation='nearest')
+    colorbar = fig.colorbar(image, ax=ax, pad=0.01)
+    colorbar.set_label('Minutos em voz', fontsize=9)
+
+    ax.set_xticks(range(24))
+    ax.set_xticklabels([f'{hour:02d}h' for hour in range(24)])
+    ax.set_yticks(range(len(row_labels)))
+    ax.set_yticklabels(row_labels)
+    ax.set_title(title, fontsize=12, pad=12)
+    ax.set_xlabel('Hora', fontsize=10)
+    fig.tight_layout()
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
+    return buffer.getvalue()
+
+class ChartQueueFull(Exception):
+    """Há gráficos demais aguardando renderização"""
+
+class ChartRenderer:
+    """
+    Pool de processos (contexto 'spawn') para renderizar gráficos em paralelo
+    sem bloquear o event loop. O número de pedidos em andamento é limitado e
+    cada renderização tem timeout; um pool quebrado ou travado é recriado.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: int = 8, timeout: float = 30.0):
+        self.max_workers = max_workers or max(1, min(2, (os.cpu_count() or 1) - 1))
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._pending = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def _reset_executor(self, terminate: bool = False):
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        # shutdown() descarta a referência aos processos: guarda antes para poder encerrá-los
+        processes = list((getattr(executor, '_processes', None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        if terminate:
+            # Um worker travado nunca devolve o controle: sem terminate() o processo ficaria órfão
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+    async def render(self, func, *args, timeout: Optional[float] = None, in_thread: bool = False) -> bytes:
+        """
+        Executa `func(*args)` em um processo do pool e retorna os bytes do PNG.
+        Renderizadores leves (in_thread=True) rodam numa thread, sem subir o pool.
+        """
+        if self._pending >= self.max_pending:
+            raise ChartQueueFull(f"{self._pending} gráficos aguardando renderização")
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            executor = None if in_thread else self._get_executor()
+            future = loop.run_in_executor(executor, func, *args)
+            return await asyncio.wait_for(future, timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Renderização de gráfico excedeu {timeout or self.timeout:.0f}s. Reiniciando o pool de gráficos.")
+            if not in_thread:
+                self._reset_executor(terminate=True)
+            raise
+        except BrokenProcessPool:
+            logger.error("Pool de renderização de gráficos quebrado. Recriando.")
+            self._reset_executor()
+            raise
+        finally:
+            self._pending -= 1
+
+    def shutdown(self):
+        self._reset_executor()
+
+chart_renderer = ChartRenderer()
+
+def _render_raster(*args) -> bytes:
+    from raster_charts import render_activity_bar_chart_raster
+    return render_activity_bar_chart_raster(*args)
+
+# Backends do gráfico de atividade (config 'chart_backend'): função e se roda numa thread
+CHART_BACKENDS = {
+    'matplotlib': (render_activity_bar_chart, False),
+    'raster': (_render_raster, True),
+}
+
+async def render_activity_chart(labels: List[str], values: List[float], title: str,
+                                backend: str = 'matplotlib') -> bytes:
+    """Renderiza o gráfico de atividade com o backend configurado"""
+    func, in_thread = CHART_BACKENDS.get(backend, CHART_BACKENDS['matplotlib'])
+    return await chart_renderer.render(func, labels, values, title, in_thread=in_thread)
+
+class GraphCache:
+    """
+    Cache de PNGs renderizados, endereçado pelo conteúdo do gráfico.
+
+    A chave é (guild, usuário, dias, hash dos dados binados + título). Quando novas
+    sessões alteram os bins o hash muda, então a entrada antiga simplesmente deixa
+    de ser consultada e sai pelo LRU. Opcionalmente mantém uma segunda camada em
+    disco (GRAPH_CACHE_DIR) que sobrevive a reinícios.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, disk_dir: Optional[str] = None,
+                 disk_max_files: int = 500):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_files = disk_max_files
+        self._entries: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._latest: Dict[Tuple, str] = {}
+        self._size = 0
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+            except OSError as e:
+                logger.error(f"Erro ao criar diretório do cache de gráficos: {e}")
+                self.disk_dir = None
+
+    @staticmethod
+    def make_key(guild_id: int, user_id: int, days: int, labels: List[str],
+                 values: List[float], title: str) -> Tuple[int, int, int, str]:
+        """Gera a chave do gráfico a partir dos dados que ele desenha"""
+        digest = hashlib.sha256()
+        digest.update(title.encode('utf-8'))
+        for label, value in zip(labels, values):
+            digest.update(f"|{label}={value:.2f}".encode('utf-8'))
+        return (guild_id, user_id, days, digest.hexdigest()[:32])
+
+    def _disk_path(self, key: Tuple) -> str:
+        guild_id, user_id, days, digest = key
+        return os.path.join(self.disk_dir, f"{guild_id}_{user_id}_{days}_{digest}.png")
+
+    def _store(self, key: Tuple, png: bytes):
+        prefix = key[:3]
+        previous = self._latest.get(prefix)
+        if previous is not None and previous != key[3]:
+            # Os bins mudaram: a versão anterior deste gráfico não será mais pedida
+            old = self._entries.pop(prefix + (previous,), None)
+            if old is not None:
+                self._size -= len(old)
+        self._latest[prefix] = key[3]
+
+        if key in self._entries:
+            self._size -= len(self._entries[key])
+        self._entries[key] = png
+        self._entries.move_to_end(key)
+        self._size += len(png)
+
+        while self._size > self.max_bytes and self._entries:
+            old_key, old_png = self._entries.popitem(last=False)
+            self._size -= len(old_png)
+            if self._latest.get(old_key[:3]) == old_key[3]:
+                del self._latest[old_key[:3]]
+            self.stats['evictions'] += 1
+
+    def _read_disk(self, key: Tuple) -> Optional[bytes]:
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key: Tuple, png: bytes):
+        prefix = f"{key[0]}_{key[1]}_{key[2]}_"
+        files = sorted(
+            (entry for entry in os.scandir(self.disk_dir) if entry.name.endswith('.png')),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in files:
+            if entry.name.startswith(prefix):
+                os.remove(entry.path)
+        files = [entry for entry in files if not entry.name.startswith(prefix)]
+        for entry in files[:max(0, len(files) - self.disk_max_files + 1)]:
+            os.remove(entry.path)
+
+        tmp_path = self._disk_path(key) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, self._disk_path(key))
+
+    async def get(self, key: Tuple) -> Optional[bytes]:
+        png = self._entries.get(key)
+        if png is not None:
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return png
+
+        if self.disk_dir:
+            try:
+                png = await asyncio.to_thread(self._read_disk, key)
+            except OSError as e:
+                logger.error(f"Erro ao ler cache de gráficos em disco: {e}")
+                png = None
+            if png is not None:
+                self._store(key, png)
+                self.stats['disk_hits'] += 1
+                return png
+
+        self.stats['misses'] += 1
+        return None
+
+    async def put(self, key: Tuple, png: bytes):
+        self._store(key, png)
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, key, png)
+            except OSError as e:
+                logger.error(f"Erro ao gravar cache de gráficos em disco: {e}")
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, 'entries': len(self._entries), 'bytes': self._size}
+
+graph_cache = GraphCache(disk_dir=os.getenv('GRAPH_CACHE_DIR'))
@@ -193,6 +193,27 @@ class DatabaseBackup:
         except Exception as e:
             logger.warning(f"Erro ao limpar backups antigos: {e}")
             
+class PendingSessions:
+    """
+    Sessões notificadas (Database.add_session_listener) enquanto uma consulta agregada roda.
+    A consulta marca em `visible` as que o seu snapshot já incluía; `unseen()` devolve as
+    demais, que precisam ser somadas ao resultado.
+    """
+    __slots__ = ('sessions', 'visible')
+
+    def __init__(self):
+        self.sessions: List[Tuple] = []  # (session_id, ...dados do listener)
+        self.visible = set()
+
+    def add(self, session_id: Optional[int], *session):
+        self.sessions.append((session_id,) + session)
+
+    def ids(self) -> List[int]:
+        return [session[0] for session in self.sessions if session[0] is not None]
+
+    def unseen(self) -> List[Tuple]:
+        return [session[1:] for session in self.sessions if session[0] not in self.visible]
+
 class Database:
     def __init__(self):
         self.pool: Optional[Pool] = None
@@ -204,6 +225,7 @@ class Database:
         self._active_tasks = set()
         self._is_closing = False
         self._restart_lock = asyncio.Lock()
+        self._session_listeners = []
 
     async def check_if_user_exists(self, user_id: int, guild_id: int) -> bool:
         """Verifica se o usuário tem algum registro prévio no banco de dados."""
@@ -481,6 +503,7 @@ class Database:
                 await conn.execute('CREATE INDEX IF NOT EXISTS idx_duration ON voice_sessions (duration)')
                 await conn.execute('CREATE INDEX IF NOT EXISTS idx_session_composite ON voice_sessions (user_id, guild_id, join_time, leave_time, duration)')
                 await conn.execute('CREATE INDEX IF NOT EXISTS idx_user_guild_duration ON voice_sessions (user_id, guild_id, duration)')
+                await conn.execute('CREATE INDEX IF NOT EXISTS idx_guild_join_leave ON voice_sessions (guild_id, join_time, leave_time)')
                 
                 # Tabela de avisos
                 await conn.execute('''
@@ -565,6 +588,8 @@ class Database:
                 await conn.execute('CREATE INDEX IF NOT EXISTS idx_reset ON rate_limit_logs (reset_at)')
                 await conn.execute('CREATE INDEX IF NOT EXISTS idx_endpoint ON rate_limit_logs (endpoint)')
                 await conn.execute('CREATE INDEX IF NOT EXISTS idx_date ON rate_limit_logs (log_date)')
+                # Peso da amostra: observações amostradas valem 1/sample_rate requisições
+                await conn.execute('ALTER TABLE rate_limit_logs ADD COLUMN IF NOT EXISTS sample_weight REAL DEFAULT 1')
                 
                 # Tabela de execuções de tasks
                 await conn.execute('''
@@ -618,6 +643,64 @@ class Database:
                 )""")
 
                 await conn.execute('CREATE INDEX IF NOT EXISTS idx_forgiveness_date ON forgiveness_messages (message_date)')
+
+                # Fila de saída persistente (mensagens ainda não entregues)
+                await conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbound_messages (
+                    dedupe_key TEXT PRIMARY KEY,
+                    priority TEXT NOT NULL,
+                    dest_type TEXT NOT NULL,
+                    dest_id BIGINT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL,
+                    expires_at TIMESTAMPTZ NOT NULL
+                )""")
+
+                await conn.execute('CREATE INDEX IF NOT EXISTS idx_outbound_expires ON outbound_messages (expires_at)')
+
+                # Mensagens enviadas pelo bot nos canais de log/notificação (para limpeza sem varrer histórico)
+                await conn.execute("""
+                CREATE TABLE IF NOT EXISTS bot_messages (
+                    message_id BIGINT PRIMARY KEY,
+                    channel_id BIGINT NOT NULL,
+                    guild_id BIGINT,
+                    created_at TIMESTAMPTZ NOT NULL
+                )""")
+
+                await conn.execute('CREATE INDEX IF NOT EXISTS idx_bot_messages_channel_date ON bot_messages (channel_id, created_at)')
+
+                # Execuções do /force_check_bulk (permite cancelar e retomar de onde parou)
+                await conn.execute("""
+                CREATE TABLE IF NOT EXISTS bulk_check_runs (
+                    id SERIAL PRIMARY KEY,
+                    guild_id BIGINT NOT NULL,
+                    role_id BIGINT,
+                    requested_by BIGINT,
+                    member_ids BIGINT[] NOT NULL,
+                    position INT NOT NULL DEFAULT 0,
+                    processed INT NOT NULL DEFAULT 0,
+                    removed INT NOT NULL DEFAULT 0,
+                    warnings INT NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                )""")
+
+                await conn.execute('CREATE INDEX IF NOT EXISTS idx_bulk_check_runs_guild ON bulk_check_runs (guild_id, started_at)')
+
+                # Ocupação dos canais de voz (uma linha por canal a cada gravação; channel_id 0 = total da guilda)
+                await conn.execute("""
+                CREATE TABLE IF NOT EXISTS voice_occupancy (
+                    guild_id BIGINT NOT NULL,
+                    channel_id BIGINT NOT NULL,
+                    bucket_start TIMESTAMPTZ NOT NULL,
+                    bucket_end TIMESTAMPTZ NOT NULL,
+                    samples SMALLINT NOT NULL,
+                    peak SMALLINT NOT NULL,
+                    average REAL NOT NULL
+                )""")
+
+                await conn.execute('CREATE INDEX IF NOT EXISTS idx_voice_occupancy_lookup ON voice_occupancy (guild_id, channel_id, bucket_start)')
                 logger.info("Tabelas criadas/verificadas com sucesso")
                 
             except Exception as e:
@@ -915,6 +998,42 @@ class Database:
             if conn:
                 await self.pool.release(conn)
 
+    def add_session_listener(self, callback):
+        """Registra um callback chamado com (user_id, guild_id, join_time, leave_time, duration, session_id)
+        a cada sessão gravada"""
+        self._session_listeners.append(callback)
+
+    def notify_session_recorded(self, user_id: int, guild_id: int, join_time: datetime,
+                                leave_time: datetime, duration: int, session_id: Optional[int] = None):
+        for callback in self._session_listeners:
+            try:
+                callback(user_id, guild_id, join_time, leave_time, duration, session_id)
+            except Exception as e:
+                logger.error(f"Erro em listener de sessões de voz: {e}", exc_info=True)
+
+    async def _fetch_session_snapshot(self, conn: Connection, query: str, args: list,
+                                      pending: Optional[PendingSessions]) -> List:
+        """
+        Executa uma consulta sobre voice_sessions. Com `pending`, roda em REPEATABLE READ e,
+        no mesmo snapshot, marca quais das sessões notificadas durante a consulta ela já via.
+        """
+        if pending is None:
+            return await conn.fetch(query, *args)
+        async with conn.transaction(isolation='repeatable_read', readonly=True):
+            rows = await conn.fetch(query, *args)
+            checked = set()
+            while True:
+                # Sessões notificadas durante a própria verificação também são conferidas
+                ids = [session_id for session_id in pending.ids() if session_id not in checked]
+                if not ids:
+                    break
+                checked.update(ids)
+                visible = await conn.fetch(
+                    "SELECT id FROM voice_sessions WHERE id = ANY($1::int[])", ids
+                )
+                pending.visible.update(row['id'] for row in visible)
+        return rows
+
     async def log_voice_leave(self, user_id: int, guild_id: int, duration: int):
         """Registra saída de canal de voz"""
         now = datetime.now(pytz.utc)
@@ -930,11 +1049,14 @@ class Database:
                 ''', now, duration, user_id, guild_id)
                 
                 join_time = now - timedelta(seconds=duration)
-                await conn.execute('''
+                session_id = await conn.fetchval('''
                     INSERT INTO voice_sessions
                     (user_id, guild_id, join_time, leave_time, duration)
                     VALUES ($1, $2, $3, $4, $5)
+                    RETURNING id
                 ''', user_id, guild_id, join_time, now, duration)
+
+            self.notify_session_recorded(user_id, guild_id, join_time, now, duration, session_id)
                 
         except (ConnectionError, TimeoutError) as e:
             logger.error(f"Não foi possível registrar saída de voz: {e}")
@@ -968,6 +1090,312 @@ class Database:
             if conn:
                 await self.pool.release(conn)
 
+    async def get_daily_session_totals(self, guild_id: int, start_date: datetime,
+                                       end_date: Optional[datetime], timezone: str,
+                                       pending: Optional[PendingSessions] = None) -> List[Dict]:
+        """Totais de voz por usuário e dia local (fuso `timezone`) das sessões da guilda no período
+        (sem limite final se `end_date` for None; `pending`: ver _fetch_session_snapshot)"""
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            return await self._fetch_session_snapshot(conn, '''
+                SELECT
+                    user_id,
+                    (join_time AT TIME ZONE $4)::DATE AS day,
+                    SUM(duration)::BIGINT AS total_time,
+                    COUNT(*) AS session_count
+                FROM voice_sessions
+                WHERE guild_id = $1
+                AND join_time >= $2
+                AND ($3::TIMESTAMPTZ IS NULL OR leave_time <= $3)
+                GROUP BY user_id, day
+            ''', [guild_id, start_date, end_date, timezone], pending)
+        except Exception as e:
+            logger.error(f"Erro ao obter totais diários de sessões: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def get_hour_of_week_totals(self, guild_id: int, start_date: datetime, timezone: str,
+                                      user_id: Optional[int] = None,
+                                      pending: Optional[PendingSessions] = None) -> List[Dict]:
+        """
+        Segundos em voz por dia da semana (0 = segunda) e hora local desde `start_date`.
+        Cada sessão é dividida nas horas locais que cobre (generate_series) e só a parte
+        dentro de cada hora é somada nela. Sessões abertas há mais de um dia antes da
+        janela foram encerradas pela limpeza de sessões fantasmas e não são buscadas.
+        `pending`: ver _fetch_session_snapshot.
+        """
+        args = [guild_id, start_date, timezone]
+        filters = ''
+        if user_id:
+            args.append(user_id)
+            filters += f'AND user_id = ${len(args)} '
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            return await self._fetch_session_snapshot(conn, f'''
+                SELECT
+                    (EXTRACT(ISODOW FROM h)::INT - 1) AS weekday,
+                    EXTRACT(HOUR FROM h)::INT AS hour,
+                    SUM(EXTRACT(EPOCH FROM LEAST(s.local_leave, h + INTERVAL '1 hour') - GREATEST(s.local_join, h)))::BIGINT AS seconds
+                FROM (
+                    SELECT
+                        GREATEST(join_time, $2) AT TIME ZONE $3 AS local_join,
+                        leave_time AT TIME ZONE $3 AS local_leave
+                    FROM voice_sessions
+                    WHERE guild_id = $1
+                    AND join_time >= $2 - INTERVAL '1 day'
+                    AND leave_time > $2
+                    {filters}
+                ) s
+                CROSS JOIN LATERAL generate_series(
+                    date_trunc('hour', s.local_join), s.local_leave - INTERVAL '1 microsecond', INTERVAL '1 hour'
+                ) AS h
+                GROUP BY 1, 2
+            ''', args, pending)
+        except Exception as e:
+            logger.error(f"Erro ao obter atividade por hora da semana: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def get_user_activity_snapshot(self, user_id: int, guild_id: int, start_date: datetime,
+                                         end_date: datetime, tracked_role_ids: List[int], timezone: str,
+                                         monitoring_period: int, required_seconds: int) -> Dict:
+        """
+        Tudo o que o /user_activity exibe em uma única consulta: resumo das sessões da janela,
+        bins diários no fuso configurado, avisos recentes, atribuição dos cargos monitorados e
+        situação do período atual (âncora, início e dias válidos).
+        """
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            row = await conn.fetchrow('''
+                WITH window_sessions AS (
+                    SELECT join_time, duration
+                    FROM voice_sessions
+                    WHERE user_id = $1 AND guild_id = $2
+                    AND join_time < $4 AND leave_time > $3
+                ),
+                daily AS (
+                    SELECT
+                        (join_time AT TIME ZONE $6)::DATE AS day,
+                        SUM(duration)::BIGINT AS total_time,
+                        COUNT(*)::BIGINT AS session_count,
+                        MAX(duration)::BIGINT AS longest
+                    FROM window_sessions
+                    GROUP BY 1
+                ),
+                tracked_roles AS (
+                    SELECT role_id, assigned_at
+                    FROM role_assignments
+                    WHERE user_id = $1 AND guild_id = $2 AND role_id = ANY($5::BIGINT[])
+                ),
+                anchor AS (
+                    SELECT COALESCE(
+                        (SELECT MAX(assigned_at) FROM tracked_roles),
+                        (SELECT period_start FROM checked_periods
+                         WHERE user_id = $1 AND guild_id = $2
+                         ORDER BY period_start DESC LIMIT 1)
+                    ) AS anchor_date
+                ),
+                current_period AS (
+                    SELECT anchor_date + make_interval(
+                        days => (FLOOR(EXTRACT(EPOCH FROM ($4 - anchor_date)) / ($7 * 86400)) * $7)::INT
+                    ) AS period_start
+                    FROM anchor
+                    WHERE anchor_date IS NOT NULL
+                ),
+                recent_warnings AS (
+                    SELECT warning_type, warning_date
+                    FROM user_warnings
+                    WHERE user_id = $1 AND guild_id = $2
+                    ORDER BY warning_date DESC
+                    LIMIT 3
+                )
+                SELECT
+                    (SELECT COUNT(*) FROM window_sessions) AS session_count,
+                    (SELECT COALESCE(SUM(duration), 0)::BIGINT FROM window_sessions) AS total_time,
+                    (SELECT MAX(join_time) FROM window_sessions) AS last_join,
+                    (SELECT array_agg(day ORDER BY day) FROM daily) AS bin_days,
+                    (SELECT array_agg(total_time ORDER BY day) FROM daily) AS bin_total,
+                    (SELECT array_agg(session_count ORDER BY day) FROM daily) AS bin_count,
+                    (SELECT array_agg(longest ORDER BY day) FROM daily) AS bin_longest,
+                    (SELECT array_agg(warning_type ORDER BY warning_date DESC) FROM recent_warnings) AS warning_types,
+                    (SELECT array_agg(warning_date ORDER BY warning_date DESC) FROM recent_warnings) AS warning_dates,
+                    (SELECT array_agg(role_id) FROM tracked_roles) AS role_ids,
+                    (SELECT array_agg(assigned_at) FROM tracked_roles) AS role_assigned_at,
+                    (SELECT anchor_date FROM anchor) AS anchor_date,
+                    (SELECT period_start FROM current_period) AS period_start,
+                    (SELECT COUNT(DISTINCT (vs.join_time AT TIME ZONE $6)::DATE)
+                     FROM voice_sessions vs, current_period cp
+                     WHERE vs.user_id = $1 AND vs.guild_id = $2
+                     AND vs.join_time >= cp.period_start
+                     AND vs.join_time < cp.period_start + make_interval(days => $7)
+                     AND vs.duration >= $8) AS period_valid_days
+            ''', user_id, guild_id, start_date, end_date, tracked_role_ids, timezone,
+                monitoring_period, required_seconds)
+
+            snapshot = dict(row)
+            snapshot['warnings'] = list(zip(snapshot.pop('warning_types') or [], snapshot.pop('warning_dates') or []))
+            snapshot['role_assignments'] = dict(zip(snapshot.pop('role_ids') or [], snapshot.pop('role_assigned_at') or []))
+            return snapshot
+        except (ConnectionError, TimeoutError) as e:
+            logger.error(f"Não foi possível obter o resumo de atividade: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao obter o resumo de atividade: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def get_at_risk_members(self, guild_id: int, user_ids: List[int], tracked_role_ids: List[int],
+                                  now: datetime, monitoring_period: int, timezone: str,
+                                  required_seconds: int, required_days: int,
+                                  limit: int = 10, offset: int = 0) -> Dict:
+        """
+        Progresso de cada membro monitorado no período atual e projeção de déficit, em uma
+        única consulta. Retorna {'members': página de quem ainda não cumpriu, ordenada por risco
+        (dias que faltam por dia restante), 'total': total de membros em risco}.
+        Membros sem âncora (sem atribuição de cargo nem verificação) entram como o BatchProcessor
+        os trata: com o período [now - período, now], avaliado na próxima verificação (`no_anchor`).
+        """
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            rows = await conn.fetch('''
+                WITH members AS (
+                    SELECT UNNEST($2::BIGINT[]) AS user_id
+                ),
+                role_anchor AS (
+                    SELECT user_id, MAX(assigned_at) AS assigned_at
+                    FROM role_assignments
+                    WHERE guild_id = $1 AND role_id = ANY($3::BIGINT[]) AND user_id = ANY($2::BIGINT[])
+                    GROUP BY user_id
+                ),
+                last_check AS (
+                    SELECT user_id, period_start
+                    FROM (
+                        SELECT user_id, period_start,
+                               ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY period_start DESC) AS rn
+                        FROM checked_periods
+                        WHERE guild_id = $1 AND user_id = ANY($2::BIGINT[])
+                    ) ranked
+                    WHERE rn = 1
+                ),
+                bounds AS (
+                    SELECT user_id,
+                           anchor IS NULL AS no_anchor,
+                           CASE WHEN anchor IS NULL THEN $4 - make_interval(days => $5)
+                                ELSE anchor + make_interval(
+                                    days => (FLOOR(EXTRACT(EPOCH FROM ($4 - anchor)) / ($5 * 86400)) * $5)::INT
+                                )
+                           END AS period_start
+                    FROM (
+                        SELECT m.user_id, COALESCE(ra.assigned_at, lc.period_start) AS anchor
+                        FROM members m
+                        LEFT JOIN role_anchor ra USING (user_id)
+                        LEFT JOIN last_check lc USING (user_id)
+                    ) anchors
+                ),
+                daily AS (
+                    SELECT vs.user_id,
+                           (vs.join_time AT TIME ZONE $6)::DATE AS day,
+                           SUM(vs.duration) AS seconds,
+                           MAX(vs.duration) AS longest
+                    FROM voice_sessions vs
+                    JOIN bounds b ON b.user_id = vs.user_id
+                    WHERE vs.guild_id = $1
+                    AND vs.join_time >= b.period_start
+                    AND vs.join_time < b.period_start + make_interval(days => $5)
+                    GROUP BY vs.user_id, day
+                ),
+                progress AS (
+                    SELECT b.user_id, b.period_start, b.no_anchor,
+                           COALESCE(SUM(d.seconds), 0)::BIGINT AS total_seconds,
+                           COUNT(d.day) FILTER (WHERE d.longest >= $7) AS valid_days
+                    FROM bounds b
+                    LEFT JOIN daily d USING (user_id)
+                    GROUP BY b.user_id, b.period_start, b.no_anchor
+                ),
+                scored AS (
+                    SELECT p.*,
+                           GREATEST($8 - p.valid_days, 0) AS days_missing,
+                           GREATEST(CEIL(EXTRACT(EPOCH FROM (p.period_start + make_interval(days => $5) - $4)) / 86400), 0)::INT AS days_remaining,
+                           GREATEST(EXTRACT(EPOCH FROM ($4 - p.period_start)) / 86400, 1) AS days_elapsed
+                    FROM progress p
+                )
+                at_risk AS (
+                    SELECT user_id, period_start, no_anchor, total_seconds, valid_days, days_missing, days_remaining,
+                           GREATEST($8 - valid_days * $5 / days_elapsed, 0)::FLOAT AS projected_shortfall,
+                           (days_missing::FLOAT / GREATEST(days_remaining, 1)) AS risk
+                    FROM scored
+                    WHERE days_missing > 0
+                ),
+                page AS (
+                    SELECT * FROM at_risk
+                    ORDER BY risk DESC, valid_days ASC, total_seconds ASC, user_id
+                    LIMIT $9 OFFSET $10
+                )
+                -- Uma linha com o total mesmo quando a página está além do fim
+                SELECT (SELECT COUNT(*) FROM at_risk) AS total_count, page.*
+                FROM (SELECT 1) AS one
+                LEFT JOIN page ON TRUE
+                ORDER BY page.risk DESC, page.valid_days ASC, page.total_seconds ASC, page.user_id
+            ''', guild_id, user_ids, tracked_role_ids, now, monitoring_period, timezone,
+                required_seconds, required_days, limit, offset)
+            return {
+                'members': [dict(row) for row in rows if row['user_id'] is not None],
+                'total': rows[0]['total_count'] if rows else 0
+            }
+        except (ConnectionError, TimeoutError) as e:
+            logger.error(f"Não foi possível calcular membros em risco: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao calcular membros em risco: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def copy_query_to(self, query: str, *args, output, format: str = 'csv', header: Optional[bool] = True) -> str:
+        """Executa COPY (query) TO STDOUT enviando os dados em blocos para `output` (arquivo ou corrotina)"""
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            return await conn.copy_from_query(query, *args, output=output, format=format, header=header)
+        except Exception as e:
+            logger.error(f"Erro ao exportar dados via COPY: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def get_session_columns(self, guild_id: int, start_date: datetime,
+                                  end_date: datetime) -> Tuple[List[int], List[int], List[int]]:
+        """Sessões da guilda que tocam o período como três colunas (user_id, join em epoch, duração)"""
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            row = await conn.fetchrow('''
+                SELECT array_agg(user_id) AS user_ids,
+                       array_agg(EXTRACT(EPOCH FROM join_time)::INT8) AS join_epochs,
+                       array_agg(GREATEST(EXTRACT(EPOCH FROM (leave_time - join_time)), 0)::INT4) AS durations
+                FROM voice_sessions
+                WHERE guild_id = $1 AND join_time < $3 AND leave_time > $2
+            ''', guild_id, start_date, end_date)
+            return row['user_ids'] or [], row['join_epochs'] or [], row['durations'] or []
+        except Exception as e:
+            logger.error(f"Erro ao obter sessões em colunas da guilda {guild_id}: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
     async def get_voice_sessions(self, user_id: int, guild_id: int, 
                                start_date: datetime, end_date: datetime) -> List[Dict]:
         """Obtém sessões de voz do usuário em um período, calculando a duração efetiva dentro do período."""
@@ -998,6 +1426,33 @@ class Database:
             if conn:
                 await self.pool.release(conn)
 
+    async def get_session_intervals(self, guild_id: int,
+                                    since_by_user: Dict[int, datetime]) -> Dict[int, List[Tuple[datetime, datetime]]]:
+        """Intervalos (join_time, leave_time) das sessões de cada usuário que terminam após o seu `since`"""
+        if not since_by_user:
+            return {}
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            results = await conn.fetch('''
+                SELECT s.user_id, s.join_time, s.leave_time
+                FROM unnest($2::bigint[], $3::timestamptz[]) AS m(user_id, since)
+                JOIN voice_sessions s
+                  ON s.guild_id = $1 AND s.user_id = m.user_id AND s.leave_time > m.since
+                ORDER BY s.user_id, s.join_time
+            ''', guild_id, list(since_by_user), list(since_by_user.values()))
+
+            intervals: Dict[int, List[Tuple[datetime, datetime]]] = {}
+            for row in results:
+                intervals.setdefault(row['user_id'], []).append((row['join_time'], row['leave_time']))
+            return intervals
+        except Exception as e:
+            logger.error(f"Erro ao obter intervalos de sessões da guilda {guild_id}: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
     async def log_period_check(self, user_id: int, guild_id: int, 
                              start_date: datetime, end_date: datetime, 
                              meets_requirements: bool):
@@ -1069,6 +1524,32 @@ class Database:
             if conn:
                 await self.pool.release(conn)
 
+    async def log_warnings_bulk(self, warnings: List[Tuple[int, int, str]], warning_date: datetime = None):
+        """Registra vários avisos em um único comando. Cada item: (user_id, guild_id, warning_type)"""
+        if not warnings:
+            return
+        warning_date = warning_date or datetime.now(pytz.utc)
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            await conn.execute('''
+                INSERT INTO user_warnings (user_id, guild_id, warning_type, warning_date)
+                SELECT DISTINCT ON (w.user_id, w.guild_id, w.warning_type)
+                       w.user_id, w.guild_id, w.warning_type, $4
+                FROM unnest($1::bigint[], $2::bigint[], $3::text[]) AS w(user_id, guild_id, warning_type)
+                ON CONFLICT (user_id, guild_id, warning_type) DO UPDATE 
+                SET warning_date = EXCLUDED.warning_date
+            ''', [w[0] for w in warnings], [w[1] for w in warnings], [w[2] for w in warnings], warning_date)
+        except (ConnectionError, TimeoutError) as e:
+            logger.error(f"Não foi possível registrar avisos em lote: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao registrar avisos em lote: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
     async def get_last_warning(self, user_id: int, guild_id: int) -> Optional[Tuple[str, datetime]]:
         """Obtém último aviso enviado ao usuário"""
         conn = None
@@ -1363,6 +1844,166 @@ class Database:
             if conn:
                 await self.pool.release(conn)
 
+    async def load_guild_activity_snapshot(self, guild_id: int, user_ids: List[int],
+                                           tracked_role_ids: List[int], include_history: bool = True) -> Dict:
+        """
+        Carrega em lote tudo que a verificação de inatividade lê de um conjunto de membros:
+        atribuições de cargos monitorados, última verificação de período e, a partir da
+        âncora de cada membro, sessões de voz e avisos. São quatro consultas no total,
+        independentemente do número de membros. Com `include_history=False` só as âncoras
+        (atribuições e última verificação) são carregadas.
+        """
+        snapshot = {'role_assignments': {}, 'last_checks': {}, 'sessions': {}, 'warnings': {}}
+        if not user_ids:
+            return snapshot
+
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            assignments = await conn.fetch('''
+                SELECT user_id, role_id, assigned_at
+                FROM role_assignments
+                WHERE guild_id = $1 AND user_id = ANY($2) AND role_id = ANY($3)
+            ''', guild_id, user_ids, tracked_role_ids)
+            for row in assignments:
+                snapshot['role_assignments'].setdefault(row['user_id'], {})[row['role_id']] = row['assigned_at']
+
+            last_checks = await conn.fetch('''
+                SELECT DISTINCT ON (user_id)
+                    user_id, period_start, period_end, meets_requirements
+                FROM checked_periods
+                WHERE guild_id = $1 AND user_id = ANY($2)
+                ORDER BY user_id, period_start DESC
+            ''', guild_id, user_ids)
+            for row in last_checks:
+                snapshot['last_checks'][row['user_id']] = {
+                    'period_start': row['period_start'],
+                    'period_end': row['period_end'],
+                    'meets_requirements': row['meets_requirements']
+                }
+
+            if not include_history:
+                return snapshot
+
+            # Histórico a partir da âncora mais antiga possível de cada membro
+            since = {}
+            for user_id in user_ids:
+                candidates = list(snapshot['role_assignments'].get(user_id, {}).values())
+                if user_id in snapshot['last_checks']:
+                    candidates.append(snapshot['last_checks'][user_id]['period_start'])
+                if candidates:
+                    since[user_id] = min(candidates)
+            if not since:
+                return snapshot
+
+            since_users, since_dates = list(since), list(since.values())
+            sessions = await conn.fetch('''
+                SELECT s.user_id, s.join_time, s.leave_time
+                FROM unnest($2::bigint[], $3::timestamptz[]) AS m(user_id, since)
+                JOIN voice_sessions s
+                  ON s.guild_id = $1 AND s.user_id = m.user_id AND s.leave_time > m.since
+                ORDER BY s.user_id, s.join_time
+            ''', guild_id, since_users, since_dates)
+            for row in sessions:
+                snapshot['sessions'].setdefault(row['user_id'], []).append((row['join_time'], row['leave_time']))
+
+            warnings = await conn.fetch('''
+                SELECT w.user_id, w.warning_type, w.warning_date
+                FROM unnest($2::bigint[], $3::timestamptz[]) AS m(user_id, since)
+                JOIN user_warnings w
+                  ON w.guild_id = $1 AND w.user_id = m.user_id AND w.warning_date >= m.since
+            ''', guild_id, since_users, since_dates)
+            for row in warnings:
+                snapshot['warnings'].setdefault(row['user_id'], []).append((row['warning_type'], row['warning_date']))
+
+            return snapshot
+        except Exception as e:
+            logger.error(f"Erro ao carregar dados de atividade em lote da guilda {guild_id}: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def log_period_checks_bulk(self, records: List[Tuple[int, int, datetime, datetime, bool]]):
+        """Registra várias verificações de período. Cada item: (user_id, guild_id, início, fim, cumpre)"""
+        if not records:
+            return
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            await conn.executemany('''
+                INSERT INTO checked_periods
+                (user_id, guild_id, period_start, period_end, meets_requirements)
+                VALUES ($1, $2, $3, $4, $5)
+                ON CONFLICT (user_id, guild_id, period_start) DO UPDATE
+                SET meets_requirements = EXCLUDED.meets_requirements
+            ''', records)
+        except Exception as e:
+            logger.error(f"Erro ao registrar verificações de período em lote: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def create_bulk_check_run(self, guild_id: int, role_id: Optional[int], requested_by: int,
+                                    member_ids: List[int]) -> int:
+        """Registra uma nova execução do /force_check_bulk e retorna seu id"""
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            return await conn.fetchval('''
+                INSERT INTO bulk_check_runs (guild_id, role_id, requested_by, member_ids)
+                VALUES ($1, $2, $3, $4)
+                RETURNING id
+            ''', guild_id, role_id, requested_by, member_ids)
+        except Exception as e:
+            logger.error(f"Erro ao registrar execução de verificação em massa: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def update_bulk_check_run(self, run_id: int, position: int, processed: int,
+                                    removed: int, warnings: int, status: str):
+        """Atualiza o progresso de uma execução do /force_check_bulk"""
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            await conn.execute('''
+                UPDATE bulk_check_runs
+                SET position = $2, processed = $3, removed = $4, warnings = $5,
+                    status = $6, updated_at = NOW()
+                WHERE id = $1
+            ''', run_id, position, processed, removed, warnings, status)
+        except Exception as e:
+            logger.error(f"Erro ao atualizar execução de verificação em massa {run_id}: {e}", exc_info=True)
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def get_resumable_bulk_check_run(self, guild_id: int) -> Optional[Dict]:
+        """Última execução da guilda que foi cancelada ou interrompida antes do fim"""
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            result = await conn.fetchrow('''
+                SELECT id, role_id, requested_by, member_ids, position,
+                       processed, removed, warnings, status, started_at
+                FROM bulk_check_runs
+                WHERE guild_id = $1
+                AND status IN ('running', 'cancelled')
+                AND position < COALESCE(array_length(member_ids, 1), 0)
+                ORDER BY started_at DESC
+                LIMIT 1
+            ''', guild_id)
+            return dict(result) if result else None
+        except Exception as e:
+            logger.error(f"Erro ao buscar execução de verificação em massa pendente: {e}", exc_info=True)
+            return None
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
     async def cleanup_old_data(self, days: int = 60) -> str:
         """Limpa dados antigos do banco de dados"""
         conn = None
@@ -1376,6 +2017,7 @@ class Database:
                 rate_limits_deleted = await conn.execute("DELETE FROM rate_limit_logs WHERE log_date < NOW() - $1 * INTERVAL '1 day'", days)
                 pending_events_deleted = await conn.execute("DELETE FROM pending_voice_events WHERE event_time < NOW() - $1 * INTERVAL '1 day'", days)
                 role_assignments_deleted = await conn.execute("DELETE FROM role_assignments WHERE assigned_at < NOW() - $1 * INTERVAL '1 day'", days)
+                occupancy_deleted = await conn.execute("DELETE FROM voice_occupancy WHERE bucket_start < NOW() - $1 * INTERVAL '1 day'", days)
                 
                 log_message = (
                     f"Limpeza de dados antigos concluída: "
@@ -1385,7 +2027,8 @@ class Database:
                     f"Expulsões: {kicks_deleted.split()[1]}, "
                     f"Rate limits: {rate_limits_deleted.split()[1]}, "
                     f"Eventos pendentes: {pending_events_deleted.split()[1]}, "
-                    f"Atribuições: {role_assignments_deleted.split()[1]}"
+                    f"Atribuições: {role_assignments_deleted.split()[1]}, "
+                    f"Ocupação de voz: {occupancy_deleted.split()[1]}"
                 )
                 logger.info(log_message)
                 return log_message
@@ -1399,6 +2042,47 @@ class Database:
             if conn:
                 await self.pool.release(conn)
 
+    async def insert_voice_occupancy(self, records: List[Tuple]):
+        """Grava linhas de ocupação: (guild_id, channel_id, início, fim, amostras, pico, média)"""
+        if not records:
+            return
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            await conn.copy_records_to_table(
+                'voice_occupancy', records=records,
+                columns=['guild_id', 'channel_id', 'bucket_start', 'bucket_end', 'samples', 'peak', 'average']
+            )
+        except Exception as e:
+            logger.error(f"Erro ao gravar ocupação de voz: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def get_voice_occupancy(self, guild_id: int, channel_id: int, start_date: datetime,
+                                  bucket_seconds: int) -> List[Dict]:
+        """Pico e média (ponderada pelas amostras) da ocupação em intervalos de `bucket_seconds`"""
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            results = await conn.fetch('''
+                SELECT to_timestamp(floor(EXTRACT(EPOCH FROM bucket_start) / $4) * $4) AS bucket,
+                       MAX(peak) AS peak,
+                       SUM(average * samples) / NULLIF(SUM(samples), 0) AS average
+                FROM voice_occupancy
+                WHERE guild_id = $1 AND channel_id = $2 AND bucket_start >= $3
+                GROUP BY 1
+                ORDER BY 1
+            ''', guild_id, channel_id, start_date, bucket_seconds)
+            return [dict(row) for row in results]
+        except Exception as e:
+            logger.error(f"Erro ao obter ocupação de voz da guilda {guild_id}: {e}", exc_info=True)
+            return []
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
     async def get_rate_limit_history(self, guild_id: int, hours: int = 24) -> List[Dict]:
         """Obtém histórico de rate limits para uma guild"""
         conn = None
@@ -1423,6 +2107,77 @@ class Database:
             if conn:
                 await self.pool.release(conn)
 
+    async def insert_rate_limit_logs(self, records: List[Tuple]):
+        """Grava observações de rate limit em lote via COPY.
+        Cada registro: (guild_id, bucket, limit_count, remaining, reset_at, scope,
+        endpoint, retry_after, log_date, sample_weight)"""
+        if not records:
+            return
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            await conn.copy_records_to_table(
+                'rate_limit_logs',
+                records=records,
+                columns=['guild_id', 'bucket', 'limit_count', 'remaining', 'reset_at', 'scope',
+                         'endpoint', 'retry_after', 'log_date', 'sample_weight']
+            )
+        except (ConnectionError, TimeoutError) as e:
+            logger.error(f"Não foi possível gravar logs de rate limit: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao gravar logs de rate limit: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def get_rate_limit_report(self, guild_id: Optional[int], hours: int = 24, limit: int = 50) -> Dict[str, List[Dict]]:
+        """Agrega as observações de rate limit.
+        Retorna {'endpoints': totais por endpoint (todos), 'hourly': por endpoint e hora (até `limit` linhas)}.
+        Inclui as rotas sem guilda (DMs, interações) junto com as da guilda informada."""
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            endpoints = await conn.fetch('''
+                SELECT endpoint,
+                       SUM(sample_weight) AS estimated_requests,
+                       COUNT(*) AS observations,
+                       COUNT(*) FILTER (WHERE retry_after IS NOT NULL) AS rate_limited,
+                       MIN(remaining) AS min_remaining,
+                       MAX(limit_count) AS limit_count
+                FROM rate_limit_logs
+                WHERE log_date >= NOW() - $2 * INTERVAL '1 hour'
+                  AND ($1::bigint IS NULL OR guild_id = $1 OR guild_id IS NULL)
+                GROUP BY endpoint
+                ORDER BY rate_limited DESC, estimated_requests DESC
+            ''', guild_id, hours)
+            hourly = await conn.fetch('''
+                SELECT date_trunc('hour', log_date) AS hour,
+                       endpoint,
+                       SUM(sample_weight) AS estimated_requests,
+                       COUNT(*) AS observations,
+                       COUNT(*) FILTER (WHERE retry_after IS NOT NULL) AS rate_limited,
+                       MIN(remaining) AS min_remaining,
+                       MAX(limit_count) AS limit_count
+                FROM rate_limit_logs
+                WHERE log_date >= NOW() - $2 * INTERVAL '1 hour'
+                  AND ($1::bigint IS NULL OR guild_id = $1 OR guild_id IS NULL)
+                GROUP BY 1, 2
+                ORDER BY 1 DESC, estimated_requests DESC
+                LIMIT $3
+            ''', guild_id, hours, limit)
+            return {
+                'endpoints': [dict(row) for row in endpoints],
+                'hourly': [dict(row) for row in hourly]
+            }
+        except Exception as e:
+            logger.error(f"Erro ao gerar relatório de rate limits: {e}", exc_info=True)
+            return {'endpoints': [], 'hourly': []}
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
     async def cleanup_rate_limit_logs(self, days: int = 7):
         """Limpa logs de rate limit antigos"""
         conn = None
@@ -1490,6 +2245,77 @@ class Database:
             if conn:
                 await self.pool.release(conn)
 
+    async def get_task_executions(self, task_names: List[str]) -> Dict[str, datetime]:
+        """Última execução de cada task (as que nunca rodaram ficam de fora)"""
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            rows = await conn.fetch('''
+                SELECT task_name, last_execution
+                FROM task_executions
+                WHERE task_name = ANY($1) AND last_execution IS NOT NULL
+            ''', task_names)
+            return {row['task_name']: row['last_execution'] for row in rows}
+        except Exception as e:
+            logger.error(f"Erro ao obter execuções das tasks: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def claim_task_execution(self, task_name: str, execution_time: datetime,
+                                   not_after: datetime, monitoring_period: int) -> Optional[Dict]:
+        """
+        Registra `execution_time` como última execução da task somente se a anterior for
+        de até `not_after` (ou não existir), num único comando. Retorna None se outra
+        execução já ocupou o intervalo; senão um dict com a execução anterior
+        ('previous_execution'), usada por release_task_execution.
+        """
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            row = await conn.fetchrow('''
+                WITH previous AS (
+                    SELECT last_execution FROM task_executions WHERE task_name = $1
+                )
+                INSERT INTO task_executions (task_name, last_execution, monitoring_period)
+                VALUES ($1, $2, $4)
+                ON CONFLICT (task_name) DO UPDATE
+                SET last_execution = EXCLUDED.last_execution,
+                    monitoring_period = EXCLUDED.monitoring_period
+                WHERE task_executions.last_execution IS NULL
+                   OR task_executions.last_execution <= $3
+                RETURNING (SELECT last_execution FROM previous) AS previous_execution
+            ''', task_name, execution_time, not_after, monitoring_period)
+            return dict(row) if row else None
+        except (ConnectionError, TimeoutError) as e:
+            logger.error(f"Não foi possível registrar execução da task: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao registrar execução da task: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def release_task_execution(self, task_name: str, execution_time: datetime,
+                                     previous_execution: Optional[datetime]):
+        """Desfaz uma execução registrada por claim_task_execution (se ninguém a substituiu)"""
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            await conn.execute('''
+                UPDATE task_executions
+                SET last_execution = $3
+                WHERE task_name = $1 AND last_execution = $2
+            ''', task_name, execution_time, previous_execution)
+        except Exception as e:
+            logger.error(f"Erro ao desfazer execução da task: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
     async def sync_task_periods(self, monitoring_period: int):
         """Sincroniza os períodos de monitoramento em todas as tasks"""
         conn = None
@@ -1681,4 +2507,131 @@ class Database:
             raise
         finally:
             if conn:
-                await self.pool.release(conn)
\ No newline at end of file
+                await self.pool.release(conn)
+
+    async def save_outbound_messages(self, records: List[Tuple]):
+        """Persiste em lote mensagens da fila de saída.
+        Cada registro: (dedupe_key, priority, dest_type, dest_id, payload, created_at, expires_at)"""
+        if not records:
+            return
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            await conn.executemany('''
+                INSERT INTO outbound_messages
+                (dedupe_key, priority, dest_type, dest_id, payload, created_at, expires_at)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
+                ON CONFLICT (dedupe_key) DO NOTHING
+            ''', records)
+        except Exception as e:
+            logger.error(f"Erro ao persistir mensagens da fila de saída: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def ack_outbound_messages(self, dedupe_keys: List[str]):
+        """Remove da fila persistente as mensagens já entregues"""
+        if not dedupe_keys:
+            return
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            await conn.execute(
+                "DELETE FROM outbound_messages WHERE dedupe_key = ANY($1::text[])",
+                list(dedupe_keys)
+            )
+        except Exception as e:
+            logger.error(f"Erro ao confirmar mensagens da fila de saída: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def load_pending_outbound_messages(self) -> List[Dict]:
+        """Descarta mensagens expiradas e retorna as pendentes em ordem de criação"""
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            async with conn.transaction():
+                expired = await conn.execute(
+                    "DELETE FROM outbound_messages WHERE expires_at <= NOW()"
+                )
+                rows = await conn.fetch('''
+                    SELECT dedupe_key, priority, dest_type, dest_id, payload, created_at
+                    FROM outbound_messages
+                    ORDER BY created_at
+                ''')
+            expired_count = int(expired.split()[-1]) if expired else 0
+            if expired_count:
+                logger.info(f"{expired_count} mensagens expiradas descartadas da fila de saída")
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Erro ao carregar mensagens pendentes da fila de saída: {e}", exc_info=True)
+            return []
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def save_bot_messages(self, records: List[Tuple[int, int, Optional[int], datetime]]):
+        """Registra em lote mensagens enviadas pelo bot: (message_id, channel_id, guild_id, created_at)"""
+        if not records:
+            return
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            await conn.executemany('''
+                INSERT INTO bot_messages (message_id, channel_id, guild_id, created_at)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (message_id) DO NOTHING
+            ''', records)
+        except Exception as e:
+            logger.error(f"Erro ao registrar mensagens do bot: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def get_bot_messages_between(self, channel_id: int, start: datetime, end: datetime, limit: int = 1000) -> List[int]:
+        """IDs de mensagens do bot no canal criadas entre start e end (mais antigas primeiro)"""
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            rows = await conn.fetch('''
+                SELECT message_id FROM bot_messages
+                WHERE channel_id = $1 AND created_at >= $2 AND created_at < $3
+                ORDER BY created_at
+                LIMIT $4
+            ''', channel_id, start, end, limit)
+            return [row['message_id'] for row in rows]
+        except Exception as e:
+            logger.error(f"Erro ao buscar mensagens do bot para limpeza: {e}", exc_info=True)
+            return []
+        finally:
+            if conn:
+                await self.pool.release(conn)
+
+    async def delete_bot_message_records(self, message_ids: List[int] = None, before: datetime = None) -> int:
+        """Remove registros de mensagens (por ID ou todas anteriores a `before`). Retorna a quantidade removida."""
+        if not message_ids and before is None:
+            return 0
+        conn = None
+        try:
+            conn = await self.acquire_connection()
+            if message_ids:
+                result = await conn.execute(
+                    "DELETE FROM bot_messages WHERE message_id = ANY($1::bigint[])",
+                    list(message_ids)
+                )
+            else:
+                result = await conn.execute(
+                    "DELETE FROM bot_messages WHERE created_at < $1",
+                    before
+                )
+            return int(result.split()[-1]) if result else 0
+        except Exception as e:
+            logger.error(f"Erro ao remover registros de mensagens do bot: {e}", exc_info=True)
+            return 0
+        finally:
+            if conn:
+                await self.pool.release(conn)
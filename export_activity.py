@@ -0,0 +1,213 @@
+# export_activity.py
+"""
+Exportação em massa dos dados de atividade de uma guilda.
+
+Os dados saem do Postgres por COPY ... TO STDOUT em blocos e são gravados como
+CSV compactado (gzip) diretamente em arquivos temporários, sem materializar as
+linhas em memória. Quando um arquivo atinge o tamanho máximo ele é fechado numa
+quebra de linha e a exportação continua na parte seguinte.
+
+Uso pela linha de comando:
+    python export_activity.py --guild 123 --days 90 --out ./export
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pytz
+
+logger = logging.getLogger('inactivity_bot')
+
+# Consultas de exportação: $1 = guild_id, $2 = início, $3 = fim
+EXPORT_QUERIES: Dict[str, str] = {
+    'voice_sessions': '''
+        SELECT user_id, guild_id, join_time, leave_time, duration
+        FROM voice_sessions
+        WHERE guild_id = $1 AND join_time >= $2 AND join_time < $3
+        ORDER BY join_time
+    ''',
+    'user_activity': '''
+        SELECT user_id, guild_id, last_voice_join, last_voice_leave, voice_sessions, total_voice_time
+        FROM user_activity
+        WHERE guild_id = $1
+        AND COALESCE(last_voice_leave, last_voice_join) >= $2
+        AND COALESCE(last_voice_leave, last_voice_join) < $3
+        ORDER BY user_id
+    ''',
+    'user_warnings': '''
+        SELECT user_id, guild_id, warning_type, warning_date
+        FROM user_warnings
+        WHERE guild_id = $1 AND warning_date >= $2 AND warning_date < $3
+        ORDER BY warning_date
+    ''',
+}
+
+class GzipPartWriter:
+    """
+    Grava blocos de CSV em arquivos .csv.gz de no máximo `max_part_bytes` (compactados).
+    As partes são cortadas sempre após uma quebra de linha e todas repetem o cabeçalho.
+    Antes de cada escrita confere se os dados cabem mesmo sem compressão nenhuma; só uma
+    linha maior que uma parte inteira pode passar do limite (vai sozinha na sua parte).
+    """
+    # Cabeçalho/trailer do gzip e marcadores de flush do deflate
+    GZIP_OVERHEAD = 64
+
+    def __init__(self, directory: str, prefix: str, max_part_bytes: int):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_part_bytes = max_part_bytes
+        self.paths: List[str] = []
+        self.rows = 0
+        self._header = None
+        self._tail = b''  # Linha incompleta do último bloco, gravada junto com o próximo
+        self._part_bytes = 0
+        self._unflushed = 0
+        self._flush_every = min(1024 * 1024, max(1, max_part_bytes // 4))
+        self._raw = None
+        self._gzip = None
+
+    def _open_part(self):
+        path = os.path.join(self.directory, f"{self.prefix}.part{len(self.paths) + 1:03d}.csv.gz")
+        self._raw = open(path, 'wb')
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=6)
+        self.paths.append(path)
+        self._part_bytes = 0
+        self._unflushed = 0
+        if len(self.paths) > 1 and self._header:
+            self._write(self._header)
+            self._part_bytes = 0
+
+    def _close_part(self):
+        if self._gzip is not None:
+            self._gzip.close()
+            self._raw.close()
+            self._gzip = self._raw = None
+
+    def _write(self, data: bytes):
+        self._gzip.write(data)
+        self._part_bytes += len(data)
+        self._unflushed += len(data)
+        if self._unflushed >= self._flush_every:
+            self._flush()
+
+    def _flush(self):
+        self._gzip.flush()
+        self._unflushed = 0
+
+    def _room(self) -> int:
+        """Bytes de CSV que certamente cabem na parte atual (pior caso: deflate sem compressão)"""
+        free = self.max_part_bytes - self._raw.tell() - self.GZIP_OVERHEAD
+        # Blocos armazenados do deflate custam 5 bytes a cada até 64 KiB; 1/1000 cobre com folga
+        return max(0, free - free // 1000 - self._unflushed)
+
+    def _write_lines(self, data: bytes):
+        """Grava linhas completas, trocando de parte quando a próxima não cabe"""
+        while data:
+            room = self._room()
+            if len(data) > room and self._unflushed:
+                # O tamanho em disco só é exato após um flush do compressor
+                self._flush()
+                room = self._room()
+            if len(data) <= room:
+                self._write(data)
+                return
+            cut = data.rfind(b'\n', 0, room) + 1
+            if not cut and not self._part_bytes:
+                # Linha maior que uma parte inteira: vai sozinha, acima do limite
+                cut = data.find(b'\n') + 1 or len(data)
+            if cut:
+                self._write(data[:cut])
+                data = data[cut:]
+            else:
+                self._close_part()
+                self._open_part()
+
+    def write(self, chunk: bytes):
+        if self._gzip is None:
+            self._open_part()
+
+        self.rows += chunk.count(b'\n')
+        data = self._tail + chunk
+        cut = data.rfind(b'\n') + 1
+        self._tail = data[cut:]
+        if self._header is None and cut:
+            self._header = data[:data.find(b'\n') + 1]
+        self._write_lines(data[:cut])
+
+    def close(self):
+        if self._tail and self._gzip is not None:
+            self._write_lines(self._tail)
+            self._tail = b''
+        self._close_part()
+
+async def export_table(db, table: str, guild_id: int, start_date: datetime, end_date: datetime,
+                       directory: str, max_part_bytes: int) -> GzipPartWriter:
+    """Exporta uma tabela da guilda para partes .csv.gz em `directory`"""
+    writer = GzipPartWriter(directory, table, max_part_bytes)
+
+    async def sink(chunk: bytes):
+        # Compressão e escrita fora do event loop
+        await asyncio.to_thread(writer.write, chunk)
+
+    try:
+        await db.copy_query_to(EXPORT_QUERIES[table], guild_id, start_date, end_date, output=sink)
+    finally:
+        await asyncio.to_thread(writer.close)
+    return writer
+
+async def export_guild_activity(db, guild_id: int, start_date: datetime, end_date: datetime,
+                                directory: str, tables: Optional[List[str]] = None,
+                                max_part_bytes: int = 8 * 1024 * 1024) -> Dict[str, GzipPartWriter]:
+    """Exporta as tabelas de atividade da guilda; retorna o writer (partes e linhas) de cada tabela"""
+    results = {}
+    for table in tables or list(EXPORT_QUERIES):
+        results[table] = await export_table(db, table, guild_id, start_date, end_date, directory, max_part_bytes)
+        logger.info(
+            f"Exportação de {table} (guilda {guild_id}): "
+            f"{max(0, results[table].rows - 1)} linhas em {len(results[table].paths)} parte(s)"
+        )
+    return results
+
+async def _run_cli(args):
+    import asyncpg
+    from database import Database
+
+    dsn = args.dsn or os.getenv('DATABASE_URL')
+    if not dsn:
+        raise SystemExit("Informe --dsn ou DATABASE_URL")
+
+    end_date = datetime.now(pytz.utc)
+    start_date = end_date - timedelta(days=args.days)
+    os.makedirs(args.out, exist_ok=True)
+
+    db = Database()
+    db.pool = await asyncpg.create_pool(dsn, min_size=1, max_size=2)
+    try:
+        results = await export_guild_activity(
+            db, args.guild, start_date, end_date, args.out,
+            tables=args.tables, max_part_bytes=args.max_part_mb * 1024 * 1024
+        )
+    finally:
+        await db.pool.close()
+
+    for table, writer in results.items():
+        print(f"{table}: {max(0, writer.rows - 1)} linhas")
+        for path in writer.paths:
+            print(f"  {path} ({os.path.getsize(path) / 1024:.0f} KB)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta dados de atividade de uma guilda em CSV compactado")
+    parser.add_argument('--guild', type=int, required=True)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--out', default='export')
+    parser.add_argument('--tables', nargs='+', choices=list(EXPORT_QUERIES))
+    parser.add_argument('--max-part-mb', type=int, default=512)
+    parser.add_argument('--dsn')
+    asyncio.run(_run_cli(parser.parse_args()))
+
+if __name__ == '__main__':
+    main()
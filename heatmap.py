@@ -0,0 +1,131 @@
+# heatmap.py
+"""
+Mapa de calor de atividade por hora da semana (7 dias x 24 horas, fuso da guilda).
+
+A matriz é calculada no Postgres (Database.get_hour_of_week_totals divide cada
+sessão nas horas locais que ela cobre) e fica em memória. Cada sessão gravada
+depois disso é somada na matriz em cache (Database.add_session_listener), então
+um novo pedido não volta ao banco; após MAX_AGE a entrada é recalculada para que
+os dados mais antigos saiam da janela. A entrada também guarda o último PNG
+renderizado, válido enquanto nenhuma sessão nova alterar a matriz.
+"""
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+
+from database import PendingSessions
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger('inactivity_bot')
+
+def add_session_hours(matrix: 'np.ndarray', join_time: datetime, leave_time: datetime, tz):
+    """Soma em `matrix` (7x24, segundos) o tempo da sessão em cada hora local, como a consulta do banco"""
+    local_join = join_time.astimezone(tz).replace(tzinfo=None)
+    local_leave = leave_time.astimezone(tz).replace(tzinfo=None)
+    hour = local_join.replace(minute=0, second=0, microsecond=0)
+    while hour < local_leave:
+        next_hour = hour + timedelta(hours=1)
+        matrix[hour.weekday(), hour.hour] += (min(local_leave, next_hour) - max(local_join, hour)).total_seconds()
+        hour = next_hour
+
+class _HeatmapEntry:
+    __slots__ = ('matrix', 'since', 'computed_at', 'version', 'png', 'png_key')
+
+    def __init__(self, matrix: 'np.ndarray', since: datetime, computed_at: float):
+        self.matrix = matrix            # Segundos por (dia da semana, hora)
+        self.since = since              # Início da janela
+        self.computed_at = computed_at  # time.monotonic() da consulta
+        self.version = 0                # Incrementado a cada sessão somada
+        self.png = None
+        self.png_key = None             # (versão, título) do PNG guardado
+
+    @property
+    def minutes(self) -> 'np.ndarray':
+        return self.matrix / 60
+
+    def cached_png(self, title: str) -> Optional[bytes]:
+        return self.png if self.png_key == (self.version, title) else None
+
+    def store_png(self, version: int, title: str, png: bytes):
+        self.png, self.png_key = png, (version, title)
+
+class ActivityHeatmaps:
+    MAX_AGE = 3600
+    MAX_ENTRIES = 128
+
+    def __init__(self, db, timezone=pytz.utc):
+        self.db = db
+        self.timezone = timezone
+        self._entries: 'OrderedDict[Tuple[int, int, int], _HeatmapEntry]' = OrderedDict()  # (guild, usuário ou 0, dias)
+        self._loading: Dict[Tuple[int, int, int], List[PendingSessions]] = {}  # Um buffer por carga em andamento
+        self.stats = {'hits': 0, 'misses': 0, 'updates': 0}
+
+    def set_timezone(self, timezone):
+        if timezone != self.timezone:
+            self.timezone = timezone
+            # As horas locais mudam: as matrizes precisam ser recalculadas
+            self._entries.clear()
+
+    def record_session(self, user_id: int, guild_id: int, join_time: datetime,
+                       leave_time: datetime, duration: int, session_id: Optional[int] = None):
+        """Listener de sessões gravadas (Database.add_session_listener)"""
+        for key in list(self._loading) + list(self._entries):
+            if key[0] != guild_id or key[1] not in (0, user_id):
+                continue
+            if key in self._loading:
+                for pending in self._loading[key]:
+                    pending.add(session_id, join_time, leave_time)
+                continue
+            entry = self._entries[key]
+            if leave_time > entry.since:
+                add_session_hours(entry.matrix, max(join_time, entry.since), leave_time, self.timezone)
+                entry.version += 1
+                self.stats['updates'] += 1
+
+    async def _load(self, key: Tuple[int, int, int]) -> _HeatmapEntry:
+        guild_id, user_id, days = key
+        since = datetime.now(pytz.utc) - timedelta(days=days)
+        pending = PendingSessions()
+        self._loading.setdefault(key, []).append(pending)
+        try:
+            rows = await self.db.get_hour_of_week_totals(
+                guild_id, since, str(self.timezone), user_id or None, pending=pending
+            )
+            matrix = np.zeros((7, 24), dtype=np.float64)
+            for row in rows:
+                matrix[row['weekday'], row['hour']] = float(row['seconds'])
+            # Sessões gravadas enquanto a consulta rodava e que o snapshot dela não incluía
+            for join_time, leave_time in pending.unseen():
+                if leave_time > since:
+                    add_session_hours(matrix, max(join_time, since), leave_time, self.timezone)
+        finally:
+            self._loading[key].remove(pending)
+            if not self._loading[key]:
+                del self._loading[key]
+
+        entry = _HeatmapEntry(matrix, since, time.monotonic())
+        self._entries[key] = entry
+        while len(self._entries) > self.MAX_ENTRIES:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def get(self, guild_id: int, days: int, user_id: Optional[int] = None) -> _HeatmapEntry:
+        """Matriz dos últimos `days` dias (da guilda ou de um usuário), do cache ou do banco"""
+        key = (guild_id, user_id or 0, days)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.computed_at < self.MAX_AGE:
+            self.stats['hits'] += 1
+            self._entries.move_to_end(key)
+        else:
+            self.stats['misses'] += 1
+            entry = await self._load(key)
+        return entry
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats, entries=len(self._entries))
@@ -0,0 +1,63 @@
+# lazy_imports.py
+"""
+Carregamento preguiçoso de dependências pesadas.
+
+`lazy_import('numpy')` devolve um proxy que só importa o módulo no primeiro acesso
+a um atributo. Assim numpy, Flask etc. não pesam no tempo de inicialização do bot
+quando a funcionalidade que os usa ainda não foi chamada.
+"""
+import importlib
+import logging
+import sys
+import threading
+import time
+from typing import Dict
+
+logger = logging.getLogger('inactivity_bot')
+
+# Tempo (s) gasto no primeiro carregamento de cada módulo preguiçoso
+IMPORT_TIMINGS: Dict[str, float] = {}
+
+_import_lock = threading.Lock()
+
+class LazyModule:
+    """Proxy de um módulo que é importado no primeiro acesso a um atributo"""
+
+    def __init__(self, name: str):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is not None:
+            return module
+
+        with _import_lock:
+            module = self.__dict__['_module']
+            if module is None:
+                name = self.__dict__['_name']
+                already_loaded = name in sys.modules
+                start = time.perf_counter()
+                module = importlib.import_module(name)
+                if not already_loaded:
+                    IMPORT_TIMINGS[name] = time.perf_counter() - start
+                    logger.debug(f"Módulo '{name}' carregado sob demanda em {IMPORT_TIMINGS[name] * 1000:.0f}ms")
+                self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'carregado' if self.__dict__['_module'] is not None else 'não carregado'
+        return f"<LazyModule '{self.__dict__['_name']}' ({state})>"
+
+def lazy_import(name: str) -> LazyModule:
+    """Retorna um proxy preguiçoso para o módulo `name`"""
+    return LazyModule(name)
+
+def is_loaded(name: str) -> bool:
+    return name in sys.modules
@@ -0,0 +1,154 @@
+# leaderboard.py
+"""
+Ranking de atividade mantido incrementalmente.
+
+Para cada guilda guarda agregados diários (dia local -> usuário -> [segundos, sessões])
+dos últimos MAX_DAYS dias. Cada sessão gravada no banco atualiza o bucket do dia do
+seu join_time; um ranking de N dias soma no máximo N dicionários pequenos e extrai
+o top-K com heapq. `rebuild` recarrega os buckets do banco para garantir consistência.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pytz
+
+from database import PendingSessions
+
+logger = logging.getLogger('inactivity_bot')
+
+class ActivityLeaderboard:
+    MAX_DAYS = 30
+
+    def __init__(self, db, timezone=pytz.utc):
+        self.db = db
+        self.timezone = timezone
+        self._days: Dict[int, Dict[int, Dict[int, List[int]]]] = {}  # guild -> dia -> usuário -> [segundos, sessões]
+        self._ready = set()
+        self._rebuilding: Dict[int, PendingSessions] = {}  # guild -> sessões recebidas durante o rebuild
+        self._lock = asyncio.Lock()
+        self.last_rebuild: Dict[int, float] = {}
+
+    def set_timezone(self, timezone):
+        if timezone != self.timezone:
+            self.timezone = timezone
+            # Os dias mudam de fronteira: os buckets precisam ser recalculados
+            self._ready.clear()
+
+    def is_ready(self, guild_id: int) -> bool:
+        return guild_id in self._ready
+
+    def _day_of(self, moment: datetime) -> int:
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=pytz.utc)
+        return moment.astimezone(self.timezone).date().toordinal()
+
+    def _today(self) -> int:
+        return datetime.now(self.timezone).date().toordinal()
+
+    def _add(self, days: Dict, day: int, user_id: int, seconds: int, sessions: int = 1):
+        bucket = days.setdefault(day, {})
+        totals = bucket.get(user_id)
+        if totals is None:
+            bucket[user_id] = [seconds, sessions]
+        else:
+            totals[0] += seconds
+            totals[1] += sessions
+
+    def _prune(self, days: Dict):
+        oldest = self._today() - self.MAX_DAYS
+        for day in [day for day in days if day <= oldest]:
+            del days[day]
+
+    def record_session(self, user_id: int, guild_id: int, join_time: datetime,
+                       leave_time: datetime, duration: int, session_id: Optional[int] = None):
+        """Listener de sessões gravadas (Database.add_session_listener)"""
+        if guild_id in self._rebuilding:
+            self._rebuilding[guild_id].add(session_id, user_id, join_time, duration)
+            return
+        if guild_id not in self._ready:
+            return
+
+        day = self._day_of(join_time)
+        if day <= self._today() - self.MAX_DAYS:
+            return
+        days = self._days.setdefault(guild_id, {})
+        self._add(days, day, user_id, int(duration))
+        self._prune(days)
+
+    async def rebuild(self, guild_id: int):
+        """Recarrega os buckets diários da guilda a partir de voice_sessions"""
+        async with self._lock:
+            since_day = datetime.fromordinal(self._today() - self.MAX_DAYS + 1)
+            since = self.timezone.localize(since_day)
+
+            pending = self._rebuilding[guild_id] = PendingSessions()
+            try:
+                rows = await self.db.get_daily_session_totals(guild_id, since, None, str(self.timezone),
+                                                              pending=pending)
+                days = {}
+                for row in rows:
+                    self._add(days, row['day'].toordinal(), row['user_id'], int(row['total_time']), int(row['session_count']))
+
+                # Sessões gravadas enquanto a consulta rodava e que o snapshot dela não incluía
+                for user_id, join_time, duration in pending.unseen():
+                    if join_time >= since:
+                        self._add(days, self._day_of(join_time), user_id, int(duration))
+
+                self._prune(days)
+                self._days[guild_id] = days
+                self._ready.add(guild_id)
+                self.last_rebuild[guild_id] = time.time()
+            except Exception as e:
+                logger.error(f"Erro ao reconstruir ranking da guilda {guild_id}: {e}", exc_info=True)
+            finally:
+                self._rebuilding.pop(guild_id, None)
+
+    async def rebuild_all(self, guild_ids: List[int]):
+        for guild_id in guild_ids:
+            await self.rebuild(guild_id)
+
+    def _window_totals(self, guild_id: int, window_days: int) -> Dict[int, List[int]]:
+        """Soma os buckets da janela: usuário -> [segundos, sessões, dias ativos]"""
+        days = self._days.get(guild_id, {})
+        today = self._today()
+        totals: Dict[int, List[int]] = {}
+        for day in range(today - min(window_days, self.MAX_DAYS) + 1, today + 1):
+            for user_id, (seconds, sessions) in days.get(day, {}).items():
+                entry = totals.get(user_id)
+                if entry is None:
+                    totals[user_id] = [seconds, sessions, 1]
+                else:
+                    entry[0] += seconds
+                    entry[1] += sessions
+                    entry[2] += 1
+        return totals
+
+    def get_ranking(self, guild_id: int, window_days: int, limit: int) -> Optional[Dict]:
+        """Top-K por tempo total nos últimos `window_days` dias (None se a guilda não estiver carregada)"""
+        if guild_id not in self._ready:
+            return None
+
+        totals = self._window_totals(guild_id, window_days)
+        top = heapq.nlargest(limit, totals.items(), key=lambda item: item[1][0])
+        total_time = sum(entry[0] for entry in totals.values())
+        total_sessions = sum(entry[1] for entry in totals.values())
+
+        return {
+            'top': [
+                {
+                    'user_id': user_id,
+                    'total_time': seconds,
+                    'active_days': active_days,
+                    'session_count': sessions,
+                    'avg_duration': seconds / sessions if sessions else 0
+                }
+                for user_id, (seconds, sessions, active_days) in top
+            ],
+            'total_users': len(totals),
+            'total_sessions': total_sessions,
+            'total_time': total_time
+        }
@@ -1,4 +1,7 @@
 # main.py
+import time
+PROCESS_START = time.perf_counter()  # Referência para medir o tempo até o on_ready
+
 import discord
 from discord.ext import commands
 import pytz
@@ -8,22 +11,29 @@ import logging
 from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
 import asyncio
-import time
 from datetime import datetime, timedelta
 from typing import Optional, List
+from contextlib import asynccontextmanager
 from discord.ext import tasks
 import random
 from collections import defaultdict
 from collections import deque
 import sys
 import traceback
+import hashlib
+import string
+import re
+import heapq
 from io import BytesIO
-# Adições para o servidor web
-from flask import Flask
 from threading import Thread
 
 # Importe sua classe Database
 from database import Database
+from leaderboard import ActivityLeaderboard
+from activity_cache import RollingActivityCache
+from heatmap import ActivityHeatmaps
+from scheduler import PersistentScheduler
+from occupancy import VoiceOccupancySampler
 
 # Configuração do logger
 def setup_logger():
@@ -65,12 +75,43 @@ def log_with_context(message, level=logging.INFO, guild_id=None, user_id=None):
     extra = {'guild_id': guild_id or 'N/A', 'user_id': user_id or 'N/A'}
     logger.log(level, message, extra=extra)
 
+_SNOWFLAKE_RE = re.compile(r'\d{15,21}')
+_MAJOR_PARAMS = ('channels', 'guilds', 'webhooks')
+
+def normalize_route(path: str) -> str:
+    """
+    Normaliza um caminho da API para a chave de rate limit: mantém os parâmetros
+    principais (canal, guilda, webhook) e troca os demais IDs por ':id'.
+    """
+    path = path.split('?', 1)[0]
+    if '/api/v' in path:
+        path = '/' + path.split('/api/v', 1)[1].split('/', 1)[-1]
+    parts = path.strip('/').split('/')
+    normalized = []
+    for i, part in enumerate(parts):
+        if _SNOWFLAKE_RE.fullmatch(part) and not (i > 0 and parts[i - 1] in _MAJOR_PARAMS):
+            normalized.append(':id')
+        elif i > 1 and parts[i - 2] in ('webhooks', 'interactions') and _SNOWFLAKE_RE.fullmatch(parts[i - 1]):
+            normalized.append(':token')  # Tokens de webhook/interação nunca vão para logs/chaves
+        else:
+            normalized.append(part)
+    return '/' + '/'.join(normalized)
+
 class RateLimitMonitor:
+    """
+    Acompanha os rate limits reais do Discord a partir dos headers X-RateLimit-*
+    de cada resposta (via TraceConfig do aiohttp passado ao discord.py como http_trace).
+    acquire() espera, apenas com asyncio.sleep, até a rota ter cota disponível.
+    """
+    GLOBAL_LIMIT_PER_SECOND = 50
+    GLOBAL_SAFETY_MARGIN = 5
+
     def __init__(self):
         self.buckets = {}
+        self.routes = {}
         self.global_limits = {
-            'limit': 50,
-            'remaining': 50,
+            'limit': self.GLOBAL_LIMIT_PER_SECOND,
+            'remaining': self.GLOBAL_LIMIT_PER_SECOND,
             'reset_at': 0
         }
         self.last_updated = 0
@@ -79,35 +120,96 @@ class RateLimitMonitor:
         self.max_delay = 30.0  # Aumentado para 30 segundos
         self.cooldown_until = 0
         self.cloudflare_blocked_until = 0
+        self.global_blocked_until = 0
+        self.rate_limited_count = 0
+        self._recent_requests = deque()
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Registra um callback chamado com cada observação de rate limit (dict)"""
+        self._listeners.append(callback)
+
+    def build_trace_config(self):
+        """TraceConfig do aiohttp que alimenta o monitor com os headers de todas as respostas"""
+        import aiohttp
+
+        async def on_request_end(session, trace_ctx, params):
+            try:
+                self.update_from_headers(
+                    params.response.headers,
+                    route=f"{params.method} {normalize_route(params.url.path)}",
+                    status=params.response.status
+                )
+            except Exception as e:
+                logger.debug(f"Falha ao processar headers de rate limit: {e}")
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
     
-    def update_from_headers(self, headers):
+    def update_from_headers(self, headers, route: str = 'unknown', status: int = 200):
         now = time.time()
-        bucket = headers.get('X-RateLimit-Bucket', 'global')
-        limit = int(headers.get('X-RateLimit-Limit', 50))
-        remaining = int(headers.get('X-RateLimit-Remaining', limit))
-        reset_at = float(headers.get('X-RateLimit-Reset', now + 60))
-        
-        if bucket == 'global':
-            self.global_limits = {
-                'limit': limit,
-                'remaining': remaining,
-                'reset_at': reset_at
-            }
-        else:
-            self.buckets[bucket] = {
+        self._note_request(now)
+
+        bucket = headers.get('X-RateLimit-Bucket')
+        retry_after = None
+        scope = headers.get('X-RateLimit-Scope')
+        is_global = headers.get('X-RateLimit-Global', '').lower() == 'true' or scope == 'global'
+
+        if status == 429:
+            self.rate_limited_count += 1
+            retry_after = float(headers.get('Retry-After', 1))
+            if bucket is None and 'X-RateLimit-Limit' not in headers:
+                # 429 sem headers da API: bloqueio do Cloudflare
+                self.handle_cloudflare_block()
+            elif is_global:
+                self.global_blocked_until = max(self.global_blocked_until, now + retry_after)
+                logger.warning(f"Rate limit GLOBAL atingido. Pausando requisições por {retry_after:.2f}s")
+            else:
+                self.adaptive_delay = min(self.max_delay, self.adaptive_delay * 1.5)
+                logger.warning(f"Rate limit atingido em {route} (scope={scope}). retry_after={retry_after:.2f}s")
+
+        if bucket is not None and 'X-RateLimit-Limit' in headers:
+            limit = int(headers.get('X-RateLimit-Limit'))
+            remaining = int(headers.get('X-RateLimit-Remaining', limit))
+            reset_after = float(headers.get('X-RateLimit-Reset-After', 0))
+            reset_at = now + (retry_after if status == 429 and retry_after else reset_after)
+
+            self.routes[route] = bucket
+            self.buckets[route] = {
+                'bucket': bucket,
                 'limit': limit,
-                'remaining': remaining,
+                'remaining': 0 if status == 429 else remaining,
                 'reset_at': reset_at,
                 'last_updated': now
             }
-        
+        elif status != 429:
+            return
+
         self.last_updated = now
-        self.history.append({
+        observation = {
             'time': now,
-            'bucket': bucket,
-            'remaining': remaining,
-            'endpoint': str(headers.get('endpoint', 'unknown'))
-        })
+            'bucket': bucket or ('global' if is_global else 'unknown'),
+            'limit': self.buckets.get(route, {}).get('limit'),
+            'remaining': self.buckets.get(route, {}).get('remaining'),
+            'reset_at': self.buckets.get(route, {}).get('reset_at'),
+            'scope': scope or ('global' if is_global else 'user'),
+            'endpoint': route,
+            'retry_after': retry_after,
+            'status': status
+        }
+        self.history.append(observation)
+        for callback in self._listeners:
+            try:
+                callback(observation)
+            except Exception as e:
+                logger.debug(f"Erro em listener de rate limit: {e}")
+
+    def _note_request(self, now: float):
+        self._recent_requests.append(now)
+        self._note_request_window(now)
+        self.global_limits['remaining'] = max(0, self.GLOBAL_LIMIT_PER_SECOND - len(self._recent_requests))
+        self.global_limits['reset_at'] = (self._recent_requests[0] + 1.0) if self._recent_requests else now
     
     def handle_cloudflare_block(self):
         """Lida com bloqueio do Cloudflare (Error 1015)"""
@@ -115,40 +217,62 @@ class RateLimitMonitor:
         self.cloudflare_blocked_until = now + 60  # Bloqueio por 1 minuto
         self.adaptive_delay = min(self.max_delay, self.adaptive_delay * 2)
         logger.warning("Bloqueio do Cloudflare detectado. Entrando em modo de resfriamento por 60 segundos.")
+
+    def _blocked_for(self, now: float) -> float:
+        """Segundos até que bloqueios globais (Cloudflare, 429 global, cooldown) terminem"""
+        return max(0.0, self.cloudflare_blocked_until - now, self.global_blocked_until - now, self.cooldown_until - now)
+
+    async def acquire(self, path: str, method: str = 'GET'):
+        """
+        Aguarda até haver cota para a rota (ex.: '/channels/123/messages', 'POST')
+        e reserva uma requisição no bucket conhecido. Usa somente asyncio.sleep.
+        """
+        route = f"{method.upper()} {normalize_route(path)}"
+        while True:
+            now = time.time()
+            wait = self._blocked_for(now)
+
+            # Limite global (~50 req/s): espera a janela de 1s liberar
+            self._note_request_window(now)
+            if len(self._recent_requests) >= self.GLOBAL_LIMIT_PER_SECOND - self.GLOBAL_SAFETY_MARGIN:
+                wait = max(wait, self._recent_requests[0] + 1.0 - now)
+
+            data = self.buckets.get(route)
+            if data and data['remaining'] <= 0 and now < data['reset_at']:
+                wait = max(wait, data['reset_at'] - now)
+
+            if wait <= 0:
+                break
+            await asyncio.sleep(min(wait, self.max_delay))
+
+        data = self.buckets.get(route)
+        if data:
+            if time.time() >= data['reset_at']:
+                data['remaining'] = data['limit']
+                data['reset_at'] = time.time() + 1.0
+            data['remaining'] -= 1
+
+    async def acquire_role_edit(self, member, roles, add: bool = False):
+        """Reserva cota para adicionar/remover cargos (o discord.py faz uma requisição por cargo)"""
+        for role in roles:
+            await self.acquire(f"/guilds/{member.guild.id}/members/{member.id}/roles/{role.id}",
+                               'PUT' if add else 'DELETE')
+
+    async def acquire_kick(self, member):
+        await self.acquire(f"/guilds/{member.guild.id}/members/{member.id}", 'DELETE')
+
+    def _note_request_window(self, now: float):
+        while self._recent_requests and now - self._recent_requests[0] > 1.0:
+            self._recent_requests.popleft()
     
     def should_delay(self):
+        """Não bloqueia: apenas indica se o chamador deve aguardar `adaptive_delay`"""
         now = time.time()
         
-        # Verificar se estamos bloqueados pelo Cloudflare
-        if now < self.cloudflare_blocked_until:
-            return True
-            
-        if now < self.cooldown_until:
+        # Buckets de rotas específicas são tratados em acquire(); aqui só os bloqueios globais
+        if self._blocked_for(now) > 0:
             return True
         
-        # Lógica proativa: se restarem poucas requisições, espere um pouco
-        if self.global_limits['remaining'] < 5:
-            # Calcula um pequeno delay para distribuir as requisições restantes
-            time_to_reset = self.global_limits['reset_at'] - now
-            if time_to_reset > 0:
-                # Espera uma fração do tempo restante
-                proactive_delay = time_to_reset / (self.global_limits['remaining'] + 1)
-                logger.info(f"Rate limit global baixo ({self.global_limits['remaining']}). Ativando delay proativo de {proactive_delay:.2f}s.")
-                time.sleep(proactive_delay)
-        
-        # Lógica reativa (original) - Mantenha para o caso de estourar o limite mesmo assim
-        if self.global_limits['remaining'] < 5 and now < self.global_limits['reset_at']:
-            self.adaptive_delay = min(self.max_delay, self.adaptive_delay * 1.5)
-            self.cooldown_until = now + self.adaptive_delay
-            return True
-        
-        # Verificar outros buckets importantes
-        for bucket, data in self.buckets.items():
-            if data['remaining'] < 2 and now < data['reset_at']:
-                self.adaptive_delay = min(self.max_delay, self.adaptive_delay * 1.2)
-                self.cooldown_until = now + self.adaptive_delay
-                return True
-        
         # Reduzir gradualmente o delay quando não há rate limits
         if self.adaptive_delay > 1.0:
             self.adaptive_delay = max(1.0, self.adaptive_delay * 0.9)
@@ -157,18 +281,24 @@ class RateLimitMonitor:
     
     def get_status_report(self):
         now = time.time()
+        self._note_request_window(now)
         report = {
             'global': {
                 **self.global_limits,
-                'seconds_until_reset': max(0, self.global_limits['reset_at'] - now)
+                'requests_last_second': len(self._recent_requests),
+                'seconds_until_reset': max(0, self.global_limits['reset_at'] - now),
+                'blocked_for': max(0, self.global_blocked_until - now)
             },
+            'cloudflare_blocked_for': max(0, self.cloudflare_blocked_until - now),
             'adaptive_delay': self.adaptive_delay,
             'cooldown_until': max(0, self.cooldown_until - now),
+            'rate_limited_count': self.rate_limited_count,
             'buckets': {}
         }
         
-        for bucket, data in self.buckets.items():
-            report['buckets'][bucket] = {
+        for route, data in self.buckets.items():
+            report['buckets'][route] = {
+                'bucket': data['bucket'],
                 'limit': data['limit'],
                 'remaining': data['remaining'],
                 'seconds_until_reset': max(0, data['reset_at'] - now)
@@ -176,6 +306,362 @@ class RateLimitMonitor:
         
         return report
 
+class ApiBudget:
+    """
+    Orçamento global de requisições à API compartilhado entre as tarefas do bot.
+    Um token bucket limita a vazão total; quando há disputa, os pedidos são
+    atendidos por weighted fair queuing (tempo virtual), de modo que consumidores
+    de maior peso recebem mais capacidade sem que os demais parem por completo.
+    Um consumidor sozinho usa a vazão inteira.
+    """
+    CONSUMER_WEIGHTS = {
+        'interactive': 16,
+        'dm': 8,
+        'roles': 4,
+        'logs': 2,
+        'cleanup': 1
+    }
+
+    def __init__(self, bot, rate: float = 10.0, burst: float = 20.0):
+        self.bot = bot
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._last_refill = time.monotonic()
+        self._virtual_time = 0.0
+        self._last_finish = defaultdict(float)
+        self._waiters = []
+        self._sequence = 0
+        self._dispatcher = None
+        self.usage = defaultdict(lambda: {'granted': 0, 'requests': 0, 'wait_total': 0.0, 'wait_max': 0.0})
+        self._since = time.time()
+
+    def configure(self, settings: dict):
+        self.rate = max(0.5, float(settings.get('rate', self.rate)))
+        self.burst = max(1.0, float(settings.get('burst', self.burst)))
+        self.tokens = min(self.tokens, self.burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _record(self, consumer: str, cost: int, waited: float):
+        usage = self.usage[consumer]
+        usage['granted'] += cost
+        usage['requests'] += 1
+        usage['wait_total'] += waited
+        usage['wait_max'] = max(usage['wait_max'], waited)
+
+    async def acquire(self, consumer: str, cost: int = 1):
+        """Aguarda até o consumidor receber `cost` tokens do orçamento global"""
+        cost = max(1, int(cost))
+        weight = self.CONSUMER_WEIGHTS.get(consumer, 1)
+        started = time.monotonic()
+
+        self._refill()
+        if not self._waiters and self.tokens >= cost and self.bot.rate_limit_monitor._blocked_for(time.time()) <= 0:
+            self.tokens -= cost
+            self._last_finish[consumer] = max(self._virtual_time, self._last_finish[consumer]) + cost / weight
+            self._record(consumer, cost, 0.0)
+            return
+
+        finish_tag = max(self._virtual_time, self._last_finish[consumer]) + cost / weight
+        self._last_finish[consumer] = finish_tag
+        self._sequence += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (finish_tag, self._sequence, cost, future))
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch(), name='api_budget_dispatcher')
+
+        await future
+        self._record(consumer, cost, time.monotonic() - started)
+
+    async def _dispatch(self):
+        while self._waiters:
+            finish_tag, _, cost, future = self._waiters[0]
+            if future.cancelled():
+                heapq.heappop(self._waiters)
+                continue
+
+            # Bloqueios globais (429 global, Cloudflare) suspendem todo o orçamento
+            blocked = self.bot.rate_limit_monitor._blocked_for(time.time())
+            if blocked > 0:
+                await asyncio.sleep(blocked)
+                continue
+
+            self._refill()
+            needed = min(cost, self.burst)
+            if self.tokens < needed:
+                await asyncio.sleep((needed - self.tokens) / self.rate)
+                continue
+
+            heapq.heappop(self._waiters)
+            self.tokens -= needed
+            self._virtual_time = finish_tag
+            future.set_result(True)
+
+    def get_usage(self) -> dict:
+        elapsed = max(1.0, time.time() - self._since)
+        report = {}
+        for consumer, usage in sorted(self.usage.items()):
+            report[consumer] = {
+                'tokens': usage['granted'],
+                'requests': usage['requests'],
+                'tokens_per_minute': round(usage['granted'] * 60 / elapsed, 2),
+                'avg_wait': round(usage['wait_total'] / usage['requests'], 3) if usage['requests'] else 0.0,
+                'max_wait': round(usage['wait_max'], 3)
+            }
+        return report
+
+    def reset_usage(self):
+        self.usage.clear()
+        self._since = time.time()
+
+def guild_id_from_route(bot, endpoint: str) -> Optional[int]:
+    """Descobre a guilda de uma rota normalizada ('METHOD /guilds/<id>/...' ou '/channels/<id>/...')"""
+    parts = endpoint.split(' ', 1)[-1].strip('/').split('/')
+    if len(parts) > 1 and parts[1].isdigit():
+        if parts[0] == 'guilds':
+            return int(parts[1])
+        if parts[0] == 'channels':
+            channel = bot.get_channel(int(parts[1]))
+            guild = getattr(channel, 'guild', None)
+            return guild.id if guild else None
+    return None
+
+class _SlotTiming:
+    """Início da medição de latência de uma vaga do AIMDController"""
+    __slots__ = ('started',)
+
+    def __init__(self):
+        self.started = time.monotonic()
+
+    def start(self):
+        self.started = time.monotonic()
+
+class AIMDController:
+    """
+    Controle de concorrência AIMD (aumento aditivo, redução multiplicativa) por guilda
+    para mutações em massa (remoção/devolução de cargos, expulsões).
+    Cada operação bem-sucedida abaixo da latência alvo aumenta o limite em 1/limite
+    (≈ +1 por "janela"); um 429 na guilda corta o limite pela metade.
+    As mudanças de limite ficam registradas em `trace`.
+    """
+    DECREASE_FACTOR = 0.5
+    DECREASE_COOLDOWN = 2.0
+
+    def __init__(self, bot, initial: int = 3, min_limit: int = 1, max_limit: int = 10, latency_target: float = 1.5):
+        self.bot = bot
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self._guilds = {}
+        self.trace = deque(maxlen=500)
+        bot.rate_limit_monitor.add_listener(self._on_rate_limit_observation)
+
+    def configure(self, settings: dict):
+        self.initial = int(settings.get('initial', self.initial))
+        self.min_limit = max(1, int(settings.get('min_limit', self.min_limit)))
+        self.max_limit = max(self.min_limit, int(settings.get('max_limit', self.max_limit)))
+        self.latency_target = float(settings.get('latency_target', self.latency_target))
+        for state in self._guilds.values():
+            state['limit'] = min(self.max_limit, max(self.min_limit, state['limit']))
+
+    def _state(self, guild_id: int) -> dict:
+        state = self._guilds.get(guild_id)
+        if state is None:
+            state = {
+                'limit': float(min(self.max_limit, max(self.min_limit, self.initial))),
+                'in_flight': 0,
+                'waiters': deque(),
+                'last_decrease': 0.0,
+                'ops': 0,
+                'rate_limited': 0
+            }
+            self._guilds[guild_id] = state
+        return state
+
+    def limit(self, guild_id: int) -> int:
+        return int(self._state(guild_id)['limit'])
+
+    def _set_limit(self, guild_id: int, state: dict, new_limit: float, reason: str):
+        new_limit = min(float(self.max_limit), max(float(self.min_limit), new_limit))
+        old = int(state['limit'])
+        state['limit'] = new_limit
+        if int(new_limit) != old:
+            decision = {
+                'time': time.time(),
+                'guild_id': guild_id,
+                'from': old,
+                'to': int(new_limit),
+                'reason': reason
+            }
+            self.trace.append(decision)
+            logger.debug(f"Concorrência AIMD na guilda {guild_id}: {old} -> {int(new_limit)} ({reason})")
+            self._wake(state)
+
+    def _wake(self, state: dict):
+        while state['waiters'] and state['in_flight'] < int(state['limit']):
+            future = state['waiters'].popleft()
+            if not future.done():
+                state['in_flight'] += 1
+                future.set_result(True)
+
+    def _decrease(self, guild_id: int, reason: str):
+        state = self._state(guild_id)
+        now = time.monotonic()
+        # Vários 429 da mesma rajada contam como um único sinal
+        if now - state['last_decrease'] < self.DECREASE_COOLDOWN:
+            return
+        state['last_decrease'] = now
+        state['rate_limited'] += 1
+        self._set_limit(guild_id, state, state['limit'] * self.DECREASE_FACTOR, reason)
+
+    def _on_rate_limit_observation(self, observation: dict):
+        if observation.get('status') != 429:
+            return
+        guild_id = guild_id_from_route(self.bot, observation.get('endpoint') or '')
+        if guild_id in self._guilds:
+            self._decrease(guild_id, f"429 em {observation.get('endpoint')}")
+
+    def _observe(self, guild_id: int, state: dict, latency: float, success: bool):
+        state['ops'] += 1
+        if not success:
+            return
+        if latency > self.latency_target * 2:
+            self._set_limit(guild_id, state, state['limit'] - 1, f"latência {latency:.2f}s")
+        elif latency <= self.latency_target:
+            self._set_limit(guild_id, state, state['limit'] + 1 / max(1.0, state['limit']), "sucesso")
+
+    @asynccontextmanager
+    async def slot(self, guild_id: int):
+        """Ocupa uma vaga de concorrência da guilda durante a mutação.
+        A latência observada conta a partir de `start()` do objeto retornado, chamado logo
+        antes da requisição, para não incluir as esperas do orçamento e do limitador."""
+        state = self._state(guild_id)
+        if state['in_flight'] < int(state['limit']) and not state['waiters']:
+            state['in_flight'] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            state['waiters'].append(future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    state['in_flight'] -= 1
+                    self._wake(state)
+                raise
+
+        timing = _SlotTiming()
+        success = False
+        try:
+            yield timing
+            success = True
+        except discord.HTTPException as e:
+            if e.status == 429:
+                self._decrease(guild_id, "429 na operação")
+            raise
+        finally:
+            state['in_flight'] -= 1
+            self._observe(guild_id, state, time.monotonic() - timing.started, success)
+            self._wake(state)
+
+    def get_report(self) -> dict:
+        return {
+            guild_id: {
+                'limit': int(state['limit']),
+                'in_flight': state['in_flight'],
+                'waiting': len(state['waiters']),
+                'operations': state['ops'],
+                'rate_limited': state['rate_limited']
+            }
+            for guild_id, state in self._guilds.items()
+        }
+
+class RateLimitTelemetry:
+    """
+    Coleta as observações do RateLimitMonitor em um buffer circular e grava em
+    rate_limit_logs com um único COPY por intervalo. Respostas 429 e buckets perto
+    do limite são sempre gravados; as demais são amostradas (com peso 1/sample_rate).
+    """
+    BUFFER_SIZE = 5000
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.buffer = deque(maxlen=self.BUFFER_SIZE)
+        self.stats = {'observed': 0, 'sampled': 0, 'dropped': 0, 'written': 0}
+
+    @property
+    def settings(self) -> dict:
+        config = getattr(self.bot, 'config', None) or {}
+        return {**DEFAULT_CONFIG['rate_limit_telemetry'], **(config.get('rate_limit_telemetry') or {})}
+
+    def observe(self, observation: dict):
+        settings = self.settings
+        if not settings.get('enabled', True):
+            return
+        self.stats['observed'] += 1
+
+        limit, remaining = observation.get('limit'), observation.get('remaining')
+        near_limit = bool(limit) and remaining is not None and remaining / limit <= settings['near_limit_ratio']
+        if observation.get('status') == 429 or near_limit:
+            weight = 1.0
+        else:
+            sample_rate = max(0.0, min(1.0, float(settings['sample_rate'])))
+            if sample_rate <= 0 or random.random() >= sample_rate:
+                return
+            weight = 1.0 / sample_rate
+
+        if len(self.buffer) == self.buffer.maxlen:
+            self.stats['dropped'] += 1
+        self.stats['sampled'] += 1
+        self.buffer.append((observation, weight))
+
+    def _to_record(self, observation: dict, weight: float) -> tuple:
+        endpoint = observation.get('endpoint') or 'unknown'
+        reset_at = observation.get('reset_at')
+        return (
+            guild_id_from_route(self.bot, endpoint),
+            (observation.get('bucket') or 'unknown')[:100],
+            observation.get('limit'),
+            observation.get('remaining'),
+            datetime.fromtimestamp(reset_at, pytz.UTC) if reset_at else None,
+            (observation.get('scope') or 'user')[:50],
+            endpoint[:255],
+            observation.get('retry_after'),
+            datetime.fromtimestamp(observation['time'], pytz.UTC),
+            weight
+        )
+
+    async def flush(self):
+        db = getattr(self.bot, 'db', None)
+        if not self.buffer or not db or not getattr(db, '_is_initialized', False):
+            return
+        pending = list(self.buffer)
+        self.buffer.clear()
+        records = [self._to_record(observation, weight) for observation, weight in pending]
+        try:
+            await db.insert_rate_limit_logs(records)
+            self.stats['written'] += len(records)
+        except Exception:
+            # Devolve ao buffer; se encher, as mais antigas são descartadas
+            self.buffer.extendleft(reversed(pending))
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            try:
+                await asyncio.sleep(max(5, int(self.settings.get('flush_interval', 60))))
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro ao gravar telemetria de rate limit: {e}")
+                await asyncio.sleep(30)
+
 # Configurações iniciais
 CONFIG_FILE = 'config.json'
 
@@ -190,6 +676,33 @@ DEFAULT_CONFIG = {
     "notification_roles_dm": [],
     "timezone": "America/Sao_Paulo",
     "absence_channel": None,
+    "chart_backend": "matplotlib",
+    "log_webhooks": {
+        "enabled": False,
+        "count": 2
+    },
+    "api_budget": {
+        "rate": 10,
+        "burst": 20
+    },
+    "mutation_concurrency": {
+        "initial": 3,
+        "min_limit": 1,
+        "max_limit": 10,
+        "latency_target": 1.5
+    },
+    "activity_cache": {
+        "window_days": 35,
+        "max_users": 20000,
+        "verify_sample": 50
+    },
+    "voice_occupancy": dict(VoiceOccupancySampler.DEFAULTS),
+    "rate_limit_telemetry": {
+        "enabled": True,
+        "sample_rate": 0.05,
+        "near_limit_ratio": 0.2,
+        "flush_interval": 60
+    },
     "allowed_roles": [],
     "whitelist": {
         "users": [],
@@ -224,8 +737,432 @@ DEFAULT_CONFIG = {
     }
 }
 
-class SmartPriorityQueue:
+class LatencyHistogram:
+    """Histograma de latência com buckets fixos (memória constante)"""
+    BOUNDS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000, 900000)
+
+    __slots__ = ('counts', 'total', 'sum_ms', 'max_ms')
+
     def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float):
+        index = len(self.BOUNDS_MS)
+        for i, bound in enumerate(self.BOUNDS_MS):
+            if value_ms <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.total += 1
+        self.sum_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def percentile(self, q: float) -> float:
+        """Limite superior do bucket que contém o percentil q (0-1)"""
+        if not self.total:
+            return 0.0
+        target = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return float(self.BOUNDS_MS[i]) if i < len(self.BOUNDS_MS) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.total,
+            'avg_ms': round(self.sum_ms / self.total, 1) if self.total else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 1),
+            'buckets': dict(zip([str(b) for b in self.BOUNDS_MS] + ['inf'], self.counts))
+        }
+
+class OutboundTelemetry:
+    """
+    Métricas do caminho de saída por (prioridade, tipo de destino):
+    espera na fila, latência do envio HTTP, enviados, retentativas, 429 e falhas.
+    """
+    DEST_TYPES = ('log_channel', 'notification_channel', 'dm', 'channel', 'webhook')
+
+    def __init__(self):
+        self._series = {}
+        self.since = time.time()
+
+    def _get(self, priority: str, dest_type: str) -> dict:
+        key = (priority, dest_type)
+        series = self._series.get(key)
+        if series is None:
+            series = {
+                'wait': LatencyHistogram(),
+                'send': LatencyHistogram(),
+                'sent': 0,
+                'retries': 0,
+                'rate_limited': 0,
+                'failed': 0
+            }
+            self._series[key] = series
+        return series
+
+    def classify(self, destination, config: dict) -> str:
+        if isinstance(destination, (discord.User, discord.Member)):
+            return 'dm'
+        channel_id = getattr(destination, 'id', None)
+        if channel_id and channel_id == config.get('log_channel'):
+            return 'log_channel'
+        if channel_id and channel_id == config.get('notification_channel'):
+            return 'notification_channel'
+        return 'channel'
+
+    def record_wait(self, priority: str, dest_type: str, seconds: float):
+        self._get(priority, dest_type)['wait'].observe(seconds * 1000)
+
+    def record_send(self, priority: str, dest_type: str, seconds: float, count: int = 1):
+        series = self._get(priority, dest_type)
+        series['send'].observe(seconds * 1000)
+        series['sent'] += count
+
+    def record_retry(self, priority: str, dest_type: str, rate_limited: bool = False):
+        series = self._get(priority, dest_type)
+        series['retries'] += 1
+        if rate_limited:
+            series['rate_limited'] += 1
+
+    def record_failure(self, priority: str, dest_type: str):
+        self._get(priority, dest_type)['failed'] += 1
+
+    def snapshot(self) -> dict:
+        """Estado atual em formato serializável (JSON)"""
+        series = []
+        for (priority, dest_type), data in sorted(list(self._series.items())):
+            attempts = data['sent'] + data['failed'] + data['retries']
+            series.append({
+                'priority': priority,
+                'dest_type': dest_type,
+                'sent': data['sent'],
+                'retries': data['retries'],
+                'rate_limited': data['rate_limited'],
+                'failed': data['failed'],
+                'rate_limited_ratio': round(data['rate_limited'] / attempts, 4) if attempts else 0.0,
+                'queue_wait': data['wait'].snapshot(),
+                'send_latency': data['send'].snapshot()
+            })
+        return {
+            'since': datetime.fromtimestamp(self.since, pytz.UTC).isoformat(),
+            'window_seconds': round(time.time() - self.since, 1),
+            'series': series
+        }
+
+    def format_report(self) -> str:
+        lines = []
+        for data in self.snapshot()['series']:
+            wait, send = data['queue_wait'], data['send_latency']
+            lines.append(
+                f"**{data['priority']}/{data['dest_type']}**: {data['sent']} enviadas, "
+                f"{data['retries']} retentativas, {data['rate_limited']} 429, {data['failed']} falhas\n"
+                f"- Espera na fila p50/p95/máx: {wait['p50_ms'] / 1000:.1f}s / {wait['p95_ms'] / 1000:.1f}s / {wait['max_ms'] / 1000:.1f}s\n"
+                f"- Envio HTTP p50/p95/máx: {send['p50_ms']:.0f}ms / {send['p95_ms']:.0f}ms / {send['max_ms']:.0f}ms"
+            )
+        return "\n".join(lines) if lines else "Nenhuma mensagem enviada no período."
+
+    def reset(self):
+        self._series = {}
+        self.since = time.time()
+
+class BotMessageTracker:
+    """
+    Guarda (em lotes, na tabela bot_messages) os IDs das mensagens que o bot envia
+    nos canais de log e notificação, para que a limpeza apague por ID sem varrer histórico.
+    """
+    FLUSH_INTERVAL = 60
+    MAX_BUFFER = 10000
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._buffer = []
+
+    def _tracked_channels(self) -> set:
+        config = getattr(self.bot, 'config', None) or {}
+        return {cid for cid in (config.get('log_channel'), config.get('notification_channel')) if cid}
+
+    def track(self, message):
+        if message is None or getattr(message, 'channel', None) is None:
+            return
+        if message.channel.id not in self._tracked_channels():
+            return
+        if len(self._buffer) >= self.MAX_BUFFER:
+            return
+        guild_id = message.guild.id if message.guild else None
+        self._buffer.append((message.id, message.channel.id, guild_id, message.created_at))
+
+    async def flush(self):
+        db = getattr(self.bot, 'db', None)
+        if not self._buffer or not db or not getattr(db, '_is_initialized', False):
+            return
+        records, self._buffer = self._buffer, []
+        try:
+            await db.save_bot_messages(records)
+        except Exception:
+            self._buffer = records + self._buffer
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            try:
+                await asyncio.sleep(self.FLUSH_INTERVAL)
+                await self.flush()
+            except asyncio.CancelledError:
+                await self.flush()
+                raise
+            except Exception as e:
+                logger.error(f"Erro ao registrar mensagens enviadas pelo bot: {e}")
+                await asyncio.sleep(30)
+
+class CompiledWarningTemplate:
+    """
+    Template de aviso já analisado por string.Formatter: os campos fixos da guilda
+    são formatados uma vez e só os campos por membro são resolvidos em render().
+    """
+    _formatter = string.Formatter()
+
+    def __init__(self, template: str, static_args: dict):
+        self.template = template
+        self.parts = []
+        try:
+            for literal, field_name, format_spec, conversion in self._formatter.parse(template):
+                if literal:
+                    self.parts.append(literal)
+                if field_name is None:
+                    continue
+                try:
+                    self.parts.append(self._format(field_name, format_spec, conversion, static_args))
+                except (KeyError, IndexError, AttributeError):
+                    self.parts.append((field_name, format_spec, conversion))
+        except ValueError as e:
+            logger.warning(f"Template de aviso inválido, será enviado sem formatação: {e}")
+            self.parts = [template]
+
+    def _format(self, field_name, format_spec, conversion, args):
+        value, _ = self._formatter.get_field(field_name, (), args)
+        value = self._formatter.convert_field(value, conversion)
+        return self._formatter.format_field(value, format_spec or '')
+
+    def render(self, args: dict) -> str:
+        try:
+            return ''.join(
+                part if isinstance(part, str) else self._format(*part, args)
+                for part in self.parts
+            )
+        except (KeyError, IndexError, AttributeError) as e:
+            # Fallback se o template exigir uma chave que falhou
+            logger.warning(f"Erro de formatação na mensagem de aviso (chave faltando): {e}")
+            return self.template
+
+class QueuedMessage:
+    """Entrada da fila de mensagens: o item original e sua chave na fila persistente"""
+    __slots__ = ('item', 'key', 'enqueued_at', 'on_done')
+
+    def __init__(self, item, key: Optional[str] = None, on_done=None):
+        self.item = item
+        self.key = key
+        self.enqueued_at = time.time()
+        # Callback opcional chamado com True/False após a tentativa de envio
+        self.on_done = on_done
+
+    def finish(self, delivered: bool):
+        if self.on_done is None:
+            return
+        try:
+            self.on_done(delivered)
+        except Exception as e:
+            logger.error(f"Erro no callback de entrega da fila: {e}")
+
+class DurableOutbox:
+    """
+    Espelha a fila de mensagens no banco (tabela outbound_messages).
+    Os itens são gravados como (tipo de destino, id, payload JSON) em lotes e
+    removidos (ack) após o envio; no início do bot, o que ficou pendente é
+    reenfileirado. Anexos não são persistidos.
+    """
+    TTL_HOURS = {
+        'critical': 24,
+        'high': 72,
+        'normal': 24,
+        'low': 72
+    }
+    FLUSH_INTERVAL = 2
+    MAX_BUFFER = 5000
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._pending = set()
+        self._to_insert = {}
+        self._to_ack = set()
+        self._replayed = False
+
+    @staticmethod
+    def _serialize(item):
+        """Converte o item da fila em (dest_type, dest_id, payload) ou None se não for persistível"""
+        if not isinstance(item, tuple):
+            return None
+        if len(item) == 4:
+            destination, content, embed, file = item
+        elif len(item) == 2:
+            destination, embed = item
+            content, file = None, None
+        else:
+            return None
+
+        if file is not None:
+            return None
+        if isinstance(destination, (discord.User, discord.Member)):
+            dest_type = 'user'
+        elif isinstance(destination, discord.abc.Messageable) and hasattr(destination, 'guild'):
+            dest_type = 'channel'
+        else:
+            return None
+
+        payload = json.dumps({
+            'content': content,
+            'embed': embed.to_dict() if embed else None
+        }, sort_keys=True, default=str)
+        return dest_type, destination.id, payload
+
+    def make_key(self, item, dedupe_key: Optional[str] = None) -> Optional[str]:
+        serialized = self._serialize(item)
+        if serialized is None:
+            return None
+        if dedupe_key:
+            return dedupe_key
+        dest_type, dest_id, payload = serialized
+        digest = hashlib.sha1(f"{dest_type}:{dest_id}:{payload}".encode('utf-8')).hexdigest()
+        return f"auto:{digest}"
+
+    def is_pending(self, key: str) -> bool:
+        return key in self._pending
+
+    def record(self, key: Optional[str], item, priority: str):
+        if key is None:
+            return
+        dest_type, dest_id, payload = self._serialize(item)
+        now = datetime.now(pytz.UTC)
+        self._pending.add(key)
+        if len(self._to_insert) < self.MAX_BUFFER:
+            self._to_insert[key] = (
+                key, priority, dest_type, dest_id, payload,
+                now, now + timedelta(hours=self.TTL_HOURS.get(priority, 24))
+            )
+        else:
+            logger.warning("Buffer da fila de saída cheio - mensagem mantida apenas em memória")
+
+    def ack(self, key: Optional[str]):
+        if key is None:
+            return
+        self._pending.discard(key)
+        # Se ainda não foi gravada, basta não gravar
+        if self._to_insert.pop(key, None) is None:
+            self._to_ack.add(key)
+
+    def release(self, key: Optional[str]):
+        """Envio falhou: libera a chave para novos envios e mantém o registro no banco para o replay()"""
+        if key is None:
+            return
+        self._pending.discard(key)
+
+    def is_expired(self, entry: QueuedMessage, priority: str) -> bool:
+        ttl = self.TTL_HOURS.get(priority, 24) * 3600
+        return time.time() - entry.enqueued_at > ttl
+
+    async def flush(self):
+        db = getattr(self.bot, 'db', None)
+        if not db or not getattr(db, '_is_initialized', False):
+            return
+
+        if self._to_insert:
+            records = list(self._to_insert.values())
+            self._to_insert.clear()
+            try:
+                await db.save_outbound_messages(records)
+            except Exception:
+                # Devolve ao buffer para a próxima tentativa, sem sobrescrever acks
+                for record in records:
+                    if record[0] in self._pending:
+                        self._to_insert.setdefault(record[0], record)
+
+        if self._to_ack:
+            keys = list(self._to_ack)
+            self._to_ack.clear()
+            try:
+                await db.ack_outbound_messages(keys)
+            except Exception:
+                self._to_ack.update(keys)
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            try:
+                await asyncio.sleep(self.FLUSH_INTERVAL)
+                await self.flush()
+            except asyncio.CancelledError:
+                await self.flush()
+                raise
+            except Exception as e:
+                logger.error(f"Erro ao sincronizar fila de saída persistente: {e}")
+                await asyncio.sleep(10)
+
+    async def _resolve_destination(self, dest_type: str, dest_id: int):
+        try:
+            if dest_type == 'user':
+                return self.bot.get_user(dest_id) or await self.bot.fetch_user(dest_id)
+            return self.bot.get_channel(dest_id) or await self.bot.fetch_channel(dest_id)
+        except (discord.NotFound, discord.Forbidden):
+            return None
+
+    async def replay(self):
+        """Reenfileira as mensagens que ficaram pendentes no banco"""
+        if self._replayed:
+            return
+        self._replayed = True
+
+        db = getattr(self.bot, 'db', None)
+        if not db or not getattr(db, '_is_initialized', False):
+            return
+
+        rows = await db.load_pending_outbound_messages()
+        replayed = 0
+        for row in rows:
+            key = row['dedupe_key']
+            if key in self._pending:
+                continue
+            try:
+                destination = await self._resolve_destination(row['dest_type'], row['dest_id'])
+                if destination is None:
+                    logger.warning(f"Destino {row['dest_type']}:{row['dest_id']} não existe mais. Descartando mensagem pendente.")
+                    self._to_ack.add(key)
+                    continue
+
+                payload = json.loads(row['payload'])
+                embed = discord.Embed.from_dict(payload['embed']) if payload.get('embed') else None
+                priority = row['priority'] if row['priority'] in self.TTL_HOURS else 'normal'
+
+                entry = QueuedMessage((destination, payload.get('content'), embed, None), key)
+                entry.enqueued_at = row['created_at'].timestamp()
+                self._pending.add(key)
+                await self.bot.message_queue.put_entry(entry, priority)
+                replayed += 1
+            except Exception as e:
+                logger.error(f"Erro ao reenfileirar mensagem pendente {key}: {e}")
+
+        if replayed:
+            logger.info(f"{replayed} mensagens pendentes reenfileiradas da fila persistente")
+
+class SmartPriorityQueue:
+    def __init__(self, outbox: Optional[DurableOutbox] = None):
         self.queues = {
             'critical': asyncio.Queue(maxsize=20),
             'high': asyncio.Queue(maxsize=100),
@@ -239,6 +1176,7 @@ class SmartPriorityQueue:
             'low': 0.5
         }
         self.last_sent = {priority: 0 for priority in self.queues}
+        self.outbox = outbox
         self._adaptive_batch_size = 5  # Tamanho inicial do lote
         self._min_batch_size = 1
         self._max_batch_size = 10
@@ -257,6 +1195,7 @@ class SmartPriorityQueue:
             )
     
     async def get_next_message(self):
+        """Retorna (QueuedMessage, prioridade) respeitando o ritmo de cada fila"""
         now = time.time()
         for priority in ['critical', 'high', 'normal', 'low']:
             if not self.queues[priority].empty():
@@ -265,19 +1204,263 @@ class SmartPriorityQueue:
                     return await self.queues[priority].get(), priority
         return None, None
     
-    async def put(self, item, priority='normal'):
-        await self.queues[priority].put(item)
+    def prepare(self, item, priority='normal', dedupe_key: Optional[str] = None,
+                on_done=None) -> Optional['QueuedMessage']:
+        """Registra o item na fila persistente e retorna a entrada (None se for duplicada)"""
+        key = None
+        if self.outbox is not None:
+            key = self.outbox.make_key(item, dedupe_key)
+            if key and self.outbox.is_pending(key):
+                logger.debug(f"Mensagem duplicada ignorada na fila ({key})")
+                return None
+            self.outbox.record(key, item, priority)
+        return QueuedMessage(item, key, on_done)
+
+    async def put(self, item, priority='normal', dedupe_key: Optional[str] = None, on_done=None) -> bool:
+        """Enfileira o item; retorna False se foi descartado como duplicado"""
+        entry = self.prepare(item, priority, dedupe_key, on_done)
+        if entry is None:
+            return False
+        await self.queues[priority].put(entry)
+        return True
+
+    async def put_entry(self, entry: 'QueuedMessage', priority='normal'):
+        """Enfileira uma entrada já persistida (usado na reprodução da fila de saída)"""
+        await self.queues[priority].put(entry)
     
     def task_done(self, priority):
         self.queues[priority].task_done()
     
     def qsize(self):
         return {priority: q.qsize() for priority, q in self.queues.items()}
+
+    def estimate_drain_seconds(self, priority: str, extra: int = 0) -> float:
+        """Tempo estimado para a fila da prioridade enviar o que já tem mais `extra` itens"""
+        return (self.queues[priority].qsize() + extra) / self.bucket_limits[priority]
     
     @property
     def batch_size(self):
         return self._adaptive_batch_size
 
+class WebhookLogSink:
+    """
+    Envia os embeds de log por webhooks criados no canal de logs.
+    Webhooks têm rate limit próprio, então o tráfego de logs não disputa
+    com DMs, edição de cargos e expulsões. Sem webhooks, volta para a fila normal.
+    """
+    WEBHOOK_NAME_PREFIX = 'Inactivity Log'
+    MAX_EMBEDS_PER_MESSAGE = 10
+    MAX_CHARS_PER_MESSAGE = 6000
+    MAX_WEBHOOKS = 5
+    WEBHOOK_MIN_INTERVAL = 0.4  # ~5 requisições a cada 2s por webhook
+    UNAVAILABLE_BACKOFF = 600
+
+    def __init__(self, bot, max_buffer: int = 1000):
+        self.bot = bot
+        self.buffer = deque()
+        self.max_buffer = max_buffer
+        self._webhooks = {}
+        self._next_available = {}
+        self._unavailable_until = {}
+        self._round_robin = 0
+        self._wakeup = asyncio.Event()
+        self.stats = {
+            'embeds_sent': 0,
+            'messages_sent': 0,
+            'fallbacks': 0,
+            'errors': 0
+        }
+        self._stats_since = time.time()
+
+    @property
+    def enabled(self) -> bool:
+        config = getattr(self.bot, 'config', None) or {}
+        return bool((config.get('log_webhooks') or {}).get('enabled'))
+
+    def accepts(self, channel) -> bool:
+        """Indica se o sink pode receber embeds para o canal (senão, usar a fila normal)"""
+        if not self.enabled or channel is None:
+            return False
+        if time.time() < self._unavailable_until.get(channel.id, 0):
+            return False
+        return len(self.buffer) < self.max_buffer
+
+    def submit(self, entry: QueuedMessage):
+        """Coloca no buffer uma entrada (canal, None, embed, None) da fila de mensagens"""
+        self.buffer.append(entry)
+        self._wakeup.set()
+
+    def invalidate(self, channel_id: int = None):
+        """Descarta os webhooks em cache (todos ou de um canal)."""
+        if channel_id is None:
+            self._webhooks.clear()
+        else:
+            self._webhooks.pop(channel_id, None)
+
+    def get_stats(self) -> dict:
+        elapsed_min = max((time.time() - self._stats_since) / 60, 1 / 60)
+        messages = self.stats['messages_sent']
+        return {
+            **self.stats,
+            'buffered': len(self.buffer),
+            'embeds_per_minute': self.stats['embeds_sent'] / elapsed_min,
+            'messages_per_minute': messages / elapsed_min,
+            'embeds_per_message': self.stats['embeds_sent'] / messages if messages else 0,
+            'webhooks': sum(len(hooks) for hooks in self._webhooks.values())
+        }
+
+    def reset_stats(self):
+        for key in self.stats:
+            self.stats[key] = 0
+        self._stats_since = time.time()
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            try:
+                if not self.buffer:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                await self._flush_once()
+            except Exception as e:
+                logger.error(f"Erro no sink de logs por webhook: {e}", exc_info=True)
+                await asyncio.sleep(5)
+
+    def _take_packed(self):
+        """Retira do buffer um pacote de embeds do mesmo canal que cabe em uma única mensagem."""
+        channel = self.buffer[0].item[0]
+        entries = []
+        total_chars = 0
+        while self.buffer and len(entries) < self.MAX_EMBEDS_PER_MESSAGE:
+            next_channel, _, embed, _ = self.buffer[0].item
+            if next_channel.id != channel.id:
+                break
+            size = len(embed)
+            if entries and total_chars + size > self.MAX_CHARS_PER_MESSAGE:
+                break
+            entries.append(self.buffer.popleft())
+            total_chars += size
+        return channel, entries
+
+    async def _flush_once(self):
+        channel, entries = self._take_packed()
+        embeds = [entry.item[2] for entry in entries]
+
+        webhooks = await self._get_webhooks(channel)
+        if not webhooks:
+            await self._fallback(entries)
+            return
+
+        webhook = self._pick_webhook(webhooks)
+        wait_time = self._next_available.get(webhook.id, 0) - time.time()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        await self.bot.api_budget.acquire('logs')
+
+        telemetry = self.bot.outbound_telemetry
+        now = time.time()
+        for entry in entries:
+            telemetry.record_wait('high', 'webhook', now - entry.enqueued_at)
+
+        started = time.perf_counter()
+        try:
+            message = await webhook.send(
+                embeds=embeds,
+                username=self.bot.user.display_name if self.bot.user else None,
+                avatar_url=self.bot.user.display_avatar.url if self.bot.user else None,
+                wait=True
+            )
+            self.bot.message_tracker.track(message)
+            self._next_available[webhook.id] = time.time() + self.WEBHOOK_MIN_INTERVAL
+            self.stats['messages_sent'] += 1
+            self.stats['embeds_sent'] += len(embeds)
+            telemetry.record_send('high', 'webhook', time.perf_counter() - started, count=len(embeds))
+            for entry in entries:
+                self.bot.outbox.ack(entry.key)
+        except discord.NotFound:
+            # Webhook apagado manualmente: recriar na próxima rodada
+            logger.warning(f"Webhook de logs {webhook.id} não existe mais. Recriando...")
+            self.invalidate(channel.id)
+            self.buffer.extendleft(reversed(entries))
+        except discord.Forbidden:
+            self._mark_unavailable(channel.id, "permissão negada ao usar o webhook")
+            await self._fallback(entries)
+        except discord.HTTPException as e:
+            self.stats['errors'] += 1
+            if e.status == 429:
+                telemetry.record_retry('high', 'webhook', rate_limited=True)
+                retry_after = float(e.response.headers.get('Retry-After', 2)) if e.response else 2.0
+                self._next_available[webhook.id] = time.time() + retry_after
+                self.buffer.extendleft(reversed(entries))
+            else:
+                logger.error(f"Erro HTTP ao enviar logs por webhook: {e}")
+                telemetry.record_failure('high', 'webhook')
+                await self._fallback(entries)
+
+    def _pick_webhook(self, webhooks):
+        """Round-robin, preferindo o próximo webhook que já está livre."""
+        now = time.time()
+        for offset in range(len(webhooks)):
+            webhook = webhooks[(self._round_robin + offset) % len(webhooks)]
+            if self._next_available.get(webhook.id, 0) <= now:
+                self._round_robin = (self._round_robin + offset + 1) % len(webhooks)
+                return webhook
+        webhook = min(webhooks, key=lambda w: self._next_available.get(w.id, 0))
+        self._round_robin = (webhooks.index(webhook) + 1) % len(webhooks)
+        return webhook
+
+    async def _get_webhooks(self, channel):
+        cached = self._webhooks.get(channel.id)
+        if cached:
+            return cached
+
+        if time.time() < self._unavailable_until.get(channel.id, 0):
+            return []
+
+        if not isinstance(channel, discord.TextChannel) or not self.bot.user:
+            return []
+
+        if not channel.permissions_for(channel.guild.me).manage_webhooks:
+            self._mark_unavailable(channel.id, "o bot não tem a permissão Gerenciar Webhooks")
+            return []
+
+        config = self.bot.config.get('log_webhooks') or {}
+        count = max(1, min(int(config.get('count', 2)), self.MAX_WEBHOOKS))
+
+        try:
+            webhooks = [
+                wh for wh in await channel.webhooks()
+                if wh.token and wh.user and wh.user.id == self.bot.user.id
+                and wh.name and wh.name.startswith(self.WEBHOOK_NAME_PREFIX)
+            ]
+            for index in range(len(webhooks), count):
+                webhooks.append(await channel.create_webhook(
+                    name=f"{self.WEBHOOK_NAME_PREFIX} {index + 1}",
+                    reason="Sink de logs do bot de inatividade"
+                ))
+        except discord.Forbidden:
+            self._mark_unavailable(channel.id, "permissão negada ao gerenciar webhooks")
+            return []
+        except discord.HTTPException as e:
+            logger.error(f"Erro ao preparar webhooks de log no canal {channel.id}: {e}")
+            self._mark_unavailable(channel.id, f"erro HTTP {e.status}")
+            return []
+
+        self._webhooks[channel.id] = webhooks[:count]
+        logger.info(f"Sink de logs usando {len(self._webhooks[channel.id])} webhook(s) no canal #{channel.name}")
+        return self._webhooks[channel.id]
+
+    def _mark_unavailable(self, channel_id: int, reason: str):
+        self._unavailable_until[channel_id] = time.time() + self.UNAVAILABLE_BACKOFF
+        self.invalidate(channel_id)
+        logger.warning(f"Webhooks de log indisponíveis no canal {channel_id} ({reason}). Usando a fila normal.")
+
+    async def _fallback(self, entries):
+        self.stats['fallbacks'] += len(entries)
+        for entry in entries:
+            await self.bot.message_queue.put_entry(entry, priority='high')
+
 class InactivityBot(commands.Bot):
     def __init__(self, *args, **kwargs):
         member_cache_flags = discord.MemberCacheFlags.from_intents(kwargs.get('intents'))
@@ -298,6 +1481,9 @@ class InactivityBot(commands.Bot):
             'activity': None,
             'status': discord.Status.online,
         })
+        # O monitor precisa existir antes do cliente HTTP para receber os headers de todas as respostas
+        self.rate_limit_monitor = RateLimitMonitor()
+        kwargs.setdefault('http_trace', self.rate_limit_monitor.build_trace_config())
         super().__init__(*args, **kwargs)
         
         self.config = DEFAULT_CONFIG
@@ -305,10 +1491,24 @@ class InactivityBot(commands.Bot):
         self._ready = asyncio.Event()
         
         self.db = None
+        self.leaderboard = None
+        self.activity_cache = None
+        self.heatmaps = None
+        self.bulk_checks = {}  # guild_id -> BulkForceCheck em andamento
         self.db_connection_failed = False
         self.active_sessions = {}
         self.voice_event_queue = asyncio.Queue(maxsize=500)
-        self.message_queue = SmartPriorityQueue()
+        self.outbox = DurableOutbox(self)
+        self.outbound_telemetry = OutboundTelemetry()
+        self.message_tracker = BotMessageTracker(self)
+        self.rate_limit_telemetry = RateLimitTelemetry(self)
+        self.voice_occupancy = VoiceOccupancySampler(self)
+        self.scheduler = PersistentScheduler()
+        self.api_budget = ApiBudget(self, **DEFAULT_CONFIG['api_budget'])
+        self.mutation_concurrency = AIMDController(self, **DEFAULT_CONFIG['mutation_concurrency'])
+        self.rate_limit_monitor.add_listener(self.rate_limit_telemetry.observe)
+        self.message_queue = SmartPriorityQueue(outbox=self.outbox)
+        self.log_sink = WebhookLogSink(self)
         self.voice_event_processor_task = None
         self.queue_processor_task = None
         self.command_processor_task = None
@@ -332,26 +1532,12 @@ class InactivityBot(commands.Bot):
         self.audio_check_task = None
         self.health_check_task = None
         self._tasks_started = False
+        self._warning_templates = {}
         self._is_initialized = False
         
-        self.rate_limit_monitor = RateLimitMonitor()
         self.last_rate_limit_report = 0
         self.rate_limit_report_interval = 300
         
-        self.rate_limit_buckets = {
-            'global': {
-                'limit': 50,
-                'remaining': 50,
-                'reset_at': 0,
-                'last_update': 0
-            },
-            'messages': {
-                'limit': 10,
-                'remaining': 10,
-                'reset_at': 0,
-                'last_update': 0
-            }
-        }
         self.message_cache = {
             'embeds': defaultdict(dict),
             'responses': defaultdict(dict)
@@ -378,7 +1564,8 @@ class InactivityBot(commands.Bot):
             except (asyncio.QueueEmpty, ValueError):
                 pass
         
-        self.message_queue = SmartPriorityQueue()
+        # A fila de mensagens é preservada: ela não depende da sessão do gateway
+        # e está espelhada na fila persistente (outbound_messages)
         
         self.event_counter = 0
         self.last_reconnect_time = datetime.now(pytz.UTC)
@@ -443,6 +1630,15 @@ class InactivityBot(commands.Bot):
                 logger.critical("Falha na inicialização do banco de dados")
                 return False
 
+            self.leaderboard = ActivityLeaderboard(self.db, self.timezone)
+            self.db.add_session_listener(self.leaderboard.record_session)
+            self.activity_cache = RollingActivityCache(self.db, active_sessions=self.active_sessions,
+                                                       **DEFAULT_CONFIG['activity_cache'])
+            self.activity_cache.configure(self.config.get('activity_cache') or {}, self.config['monitoring_period'])
+            self.db.add_session_listener(self.activity_cache.record_session)
+            self.heatmaps = ActivityHeatmaps(self.db, self.timezone)
+            self.db.add_session_listener(self.heatmaps.record_session)
+
             logger.info("Conexão com o banco de dados (via asyncpg) estabelecida com sucesso.")
 
             from database import DatabaseBackup
@@ -532,6 +1728,14 @@ class InactivityBot(commands.Bot):
         
         self.timezone = pytz.timezone(new_config.get('timezone', 'America/Sao_Paulo'))
         self.config = new_config
+        if self.leaderboard:
+            self.leaderboard.set_timezone(self.timezone)
+        if self.heatmaps:
+            self.heatmaps.set_timezone(self.timezone)
+        if self.activity_cache:
+            self.activity_cache.configure(new_config.get('activity_cache') or {}, new_config['monitoring_period'])
+        self.api_budget.configure(new_config.get('api_budget') or {})
+        self.mutation_concurrency.configure(new_config.get('mutation_concurrency') or {})
         logger.info("Configuração atualizada com sucesso")
 
     async def save_config(self, guild_id: int = None):
@@ -580,25 +1784,44 @@ class InactivityBot(commands.Bot):
             logger.critical("Falha na inicialização do banco de dados. As tarefas não serão iniciadas.")
             self.db_connection_failed = True
     
-    async def send_with_fallback(self, destination, content=None, embed=None, file=None):
+    @staticmethod
+    def _message_route(destination) -> str:
+        """Rota de envio de mensagem usada para o rate limit do destino"""
+        if isinstance(destination, (discord.User, discord.Member)):
+            dm_channel = destination.dm_channel
+            return f"/channels/{dm_channel.id}/messages" if dm_channel else "/users/@me/channels"
+        return f"/channels/{destination.id}/messages"
+
+    async def send_with_fallback(self, destination, content=None, embed=None, file=None,
+                                 metrics_key: Optional[tuple] = None):
         max_retries = 3
         base_delay = 2.0
         
+        consumer = 'dm' if isinstance(destination, (discord.User, discord.Member)) else 'logs'
         for attempt in range(max_retries):
+            await self.api_budget.acquire(consumer)
+            await self.rate_limit_monitor.acquire(self._message_route(destination), 'POST')
+            started = time.perf_counter()
             try:
+                message = None
                 if file:
                     if isinstance(file, BytesIO):
                         file.seek(0)
                         file = discord.File(file, filename='activity_report.png')
-                    await destination.send(content=content, embed=embed, file=file)
+                    message = await destination.send(content=content, embed=embed, file=file)
                 elif embed:
-                    await destination.send(embed=embed)
+                    message = await destination.send(embed=embed)
                 elif content:
-                    await destination.send(content)
-                return
+                    message = await destination.send(content)
+                self.message_tracker.track(message)
+                if metrics_key:
+                    self.outbound_telemetry.record_send(*metrics_key, time.perf_counter() - started)
+                return True
                 
             except discord.HTTPException as e:
                 if e.status == 429:
+                    if metrics_key:
+                        self.outbound_telemetry.record_retry(*metrics_key, rate_limited=True)
                     delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
                     logger.warning(f"Rate limit atingido (tentativa {attempt + 1}/{max_retries}). Tentando novamente em {delay:.2f} segundos")
                     
@@ -611,13 +1834,24 @@ class InactivityBot(commands.Bot):
                     continue
                     
                 logger.error(f"Erro HTTP ao enviar mensagem para {destination}: {e}")
+                if metrics_key:
+                    self.outbound_telemetry.record_failure(*metrics_key)
                 raise
                 
             except Exception as e:
                 logger.error(f"Erro inesperado ao enviar mensagem para {destination}: {e}")
+                if metrics_key:
+                    if attempt == max_retries - 1:
+                        self.outbound_telemetry.record_failure(*metrics_key)
+                    else:
+                        self.outbound_telemetry.record_retry(*metrics_key)
                 if attempt == max_retries - 1:
                     raise
 
+        if metrics_key:
+            self.outbound_telemetry.record_failure(*metrics_key)
+        return False
+
     async def on_error(self, event, *args, **kwargs):
         exc_type, exc_value, exc_traceback = sys.exc_info()
         tb_details = "".join(traceback.format_exception(exc_type, exc_value, exc_traceback))
@@ -728,8 +1962,11 @@ class InactivityBot(commands.Bot):
             try:
                 queue_status = self.message_queue.qsize()
                 queue_status['voice_events'] = self.voice_event_queue.qsize()
+                queue_status['log_sink'] = len(self.log_sink.buffer)
                 
                 logger.info(f"Status das filas: {queue_status}")
+                if self.log_sink.enabled:
+                    logger.info(f"Sink de logs por webhook: {self.log_sink.get_stats()}")
                 
                 if queue_status['voice_events'] > 300:
                     logger.warning(f"Fila de eventos de voz grande: {queue_status['voice_events']}")
@@ -763,7 +2000,8 @@ class InactivityBot(commands.Bot):
         while True:
             try:
                 if self.rate_limit_monitor.should_delay():
-                    delay = self.rate_limit_monitor.adaptive_delay
+                    delay = min(self.rate_limit_monitor.adaptive_delay,
+                                max(0.5, self.rate_limit_monitor._blocked_for(time.time())))
                     logger.debug(f"Delay ativado por rate limit. Esperando {delay:.2f} segundos")
                     await asyncio.sleep(delay)
                     continue
@@ -785,19 +2023,30 @@ class InactivityBot(commands.Bot):
                 if item is None:
                     await asyncio.sleep(0.5)
                     continue
-                    
+
+                entry = item
+                item = entry.item
+                # Só remove da fila persistente quando o envio termina de forma definitiva
+                delivered = True
+
                 try:
-                    if isinstance(item, tuple):
+                    if self.outbox.is_expired(entry, priority):
+                        logger.warning(f"Mensagem expirada descartada da fila ({priority})")
+                    elif isinstance(item, tuple):
+                        metrics_key = (priority, self.outbound_telemetry.classify(item[0], self.config))
+                        self.outbound_telemetry.record_wait(*metrics_key, time.time() - entry.enqueued_at)
                         if len(item) == 4:
                             destination, content, embed, file = item
                             if isinstance(destination, (discord.TextChannel, discord.User, discord.Member)):
-                                await self.send_with_fallback(destination, content, embed, file)
+                                delivered = await self.send_with_fallback(destination, content, embed, file,
+                                                                          metrics_key=metrics_key)
                             else:
                                 logger.warning(f"Destino inválido para mensagem: {type(destination)}")
                         elif len(item) == 2:
                             destination, embed = item
                             if isinstance(destination, (discord.TextChannel, discord.User, discord.Member)):
-                                await self.send_with_fallback(destination, embed=embed)
+                                delivered = await self.send_with_fallback(destination, embed=embed,
+                                                                          metrics_key=metrics_key)
                             else:
                                 logger.warning(f"Destino inválido para mensagem: {type(destination)}")
                         else:
@@ -806,10 +2055,20 @@ class InactivityBot(commands.Bot):
                         logger.warning(f"Item da fila é um destino direto, mas não há conteúdo: {item}")
                     else:
                         logger.warning(f"Item da fila não é um destino válido: {type(item)}")
+                except (discord.Forbidden, discord.NotFound) as e:
+                    # Erro permanente (DM fechada, canal apagado): não adianta reenviar
+                    logger.warning(f"Mensagem não entregue e descartada: {e}")
                 except Exception as e:
+                    delivered = False
                     logger.error(f"Erro ao processar item da fila: {e}")
                     if "Cloudflare" in str(e) or "1015" in str(e):
                         self.rate_limit_monitor.handle_cloudflare_block()
+
+                if delivered:
+                    self.outbox.ack(entry.key)
+                else:
+                    self.outbox.release(entry.key)
+                entry.finish(bool(delivered))
                 
                 try:
                     self.message_queue.task_done(priority)
@@ -1228,12 +2487,7 @@ class InactivityBot(commands.Bot):
                 return
                 
             if embed is not None:
-                await self.message_queue.put((
-                    channel,
-                    None,
-                    embed,
-                    file
-                ), priority='high')
+                await self._enqueue_log(channel, embed, file)
                 return
                 
             if action:
@@ -1255,16 +2509,22 @@ class InactivityBot(commands.Bot):
                         details = details[:1021] + "..."
                     embed.add_field(name="Detalhes", value=details, inline=False)
                 
-                await self.message_queue.put((
-                    channel,
-                    None,
-                    embed,
-                    file
-                ), priority='high')
+                await self._enqueue_log(channel, embed, file)
                 
         except Exception as e:
             logger.error(f"Erro ao registrar ação no log: {e}")
 
+    async def _enqueue_log(self, channel, embed: discord.Embed, file: discord.File = None):
+        """Envia o embed pelo sink de webhooks quando possível; anexos e fallback vão para a fila normal"""
+        item = (channel, None, embed, file)
+        if file is None and self.log_sink.accepts(channel):
+            entry = self.message_queue.prepare(item, priority='high')
+            if entry is not None:
+                self.log_sink.submit(entry)
+            return
+
+        await self.message_queue.put(item, priority='high')
+
     async def notify_roles(self, message: str, is_warning: bool = False):
         try:
             channel_id = self.config.get('notification_channel')
@@ -1336,15 +2596,19 @@ class InactivityBot(commands.Bot):
             except Exception as e:
                 logger.error(f"Falha ao enfileirar DM de notificação para {member.display_name} na guilda {guild.name}: {e}")
 
-    async def send_dm(self, member: discord.Member, message_content: str, embed: discord.Embed):
+    def dm_priority(self, embed: Optional[discord.Embed]) -> str:
+        return 'high' if embed and (embed.title.startswith("🚨") or embed.title.startswith("👢")) else 'low'
+
+    async def send_dm(self, member: discord.Member, message_content: str, embed: discord.Embed,
+                      dedupe_key: Optional[str] = None, on_done=None) -> bool:
+        """Enfileira a DM; retorna True se ela entrou na fila (e `on_done` será chamado)"""
         try:
-            priority = 'high' if embed and (embed.title.startswith("🚨") or embed.title.startswith("👢")) else 'low'
-            await self.message_queue.put((
+            return await self.message_queue.put((
                 member,
                 message_content,
                 embed,
                 None
-            ), priority=priority)
+            ), priority=self.dm_priority(embed), dedupe_key=dedupe_key, on_done=on_done)
         except discord.Forbidden:
             logger.warning(f"Não foi possível enviar DM para {member.display_name}. (DMs desabilitadas)")
             await self.log_action(
@@ -1359,6 +2623,138 @@ class InactivityBot(commands.Bot):
                 logger.error(f"Erro ao enviar DM para {member}: {e}")
         except Exception as e:
             logger.error(f"Erro ao enviar DM para {member}: {e}")
+        return False
+
+    def get_warning_template(self, guild: discord.Guild, warning_type: str) -> Optional[CompiledWarningTemplate]:
+        """Retorna o template de aviso pré-compilado para a guilda (com os valores fixos já aplicados)"""
+        warnings_config = self.config.get('warnings', {})
+        template = warnings_config.get('messages', {}).get(warning_type)
+        if not template:
+            return None
+
+        static_args = {
+            'days': warnings_config.get('first_warning', 'N/A'),
+            'monitoring_period': self.config.get('monitoring_period', 'N/A'),
+            'required_minutes': self.config.get('required_minutes', 'N/A'),
+            'required_days': self.config.get('required_days', 'N/A'),
+            'guild': guild.name
+        }
+        cache_key = (guild.id, warning_type, template, tuple(sorted((k, str(v)) for k, v in static_args.items())))
+        compiled = self._warning_templates.get(cache_key)
+        if compiled is None:
+            if len(self._warning_templates) >= 64:
+                self._warning_templates.clear()
+            compiled = CompiledWarningTemplate(template, static_args)
+            self._warning_templates[cache_key] = compiled
+        return compiled
+
+    def build_warning(self, member: discord.Member, warning_type: str,
+                      period_end: Optional[datetime], now: datetime,
+                      template: Optional[CompiledWarningTemplate] = None) -> Optional[dict]:
+        """Monta mensagem e embed de um aviso sem enviar nada"""
+        template = template or self.get_warning_template(member.guild, warning_type)
+        if template is None:
+            logger.warning(f"Template de mensagem de aviso para '{warning_type}' não encontrado.")
+            return None
+
+        time_relative = "em breve"
+        time_full = "data desconhecida"
+        days_remaining_str = "N/A"
+
+        if period_end:
+            if getattr(period_end, 'tzinfo', None) is None:
+                period_end = period_end.replace(tzinfo=pytz.UTC)
+            
+            # Gerar timestamps do Discord
+            timestamp = int(period_end.timestamp())
+            time_relative = f"<t:{timestamp}:R>"
+            time_full = f"<t:{timestamp}:F>"
+            
+            try:
+                days_rem_val = max(0, (period_end - now).days)
+                days_remaining_str = f"{days_rem_val} dias"
+            except Exception:
+                days_remaining_str = "N/A"
+
+        # Listar cargos monitorados que o usuário possui
+        tracked_role_ids = self.config.get('tracked_roles', [])
+        user_tracked_roles = [role.name for role in member.roles if role.id in tracked_role_ids]
+        roles_list = ", ".join(user_tracked_roles) if user_tracked_roles else "seus cargos monitorados"
+
+        message = template.render({
+            'days_remaining': days_remaining_str,
+            'time_relative': time_relative,
+            'time_full': time_full,
+            'roles_list': roles_list
+        })
+
+        # Configuração Visual do Embed
+        if warning_type == 'first':
+            title = "⚠️ Aviso de Inatividade"
+            color = discord.Color.gold()
+        elif warning_type == 'second':
+            title = "🔴 Último Aviso: Risco de Perda"
+            color = discord.Color.orange()
+        else:
+            title = "❌ Cargos Removidos"
+            color = discord.Color.dark_red()
+        
+        embed = discord.Embed(
+            title=title,
+            description=message,
+            color=color,
+            timestamp=now)
+        
+        if member.guild.icon:
+            embed.set_author(name=member.guild.name, icon_url=member.guild.icon.url)
+
+        return {
+            'message': message,
+            'embed': embed,
+            'roles_list': roles_list,
+            'time_full': time_full,
+            # A chave evita aviso duplicado ao reproduzir a fila persistente
+            'dedupe_key': f"warning:{member.guild.id}:{member.id}:{warning_type}:{now.date().isoformat()}"
+        }
+
+    async def _resolve_warning_deadline(self, member: discord.Member, now: datetime) -> Optional[datetime]:
+        """Fallback quando a data final do ciclo não é informada: projeta a partir da última verificação"""
+        if not hasattr(self, 'db') or not self.db:
+            return None
+        try:
+            last_check = await self.db.get_last_period_check(member.id, member.guild.id)
+            if not last_check:
+                return None
+            if isinstance(last_check, dict):
+                period_end = last_check.get('period_end')
+            else:
+                period_end = getattr(last_check, 'period_end', None)
+            
+            # Se pegarmos do banco e já estiver no passado, precisamos projetar o PRÓXIMO fim
+            if period_end and period_end < now:
+                monitoring_days = self.config.get('monitoring_period', 14)
+                # Adiciona dias até ficar no futuro (estimativa simples para fallback)
+                while period_end < now:
+                    period_end += timedelta(days=monitoring_days)
+            return period_end
+        except Exception as e:
+            logger.error(f"Erro ao buscar last_check no fallback: {e}")
+            return None
+
+    def build_warning_admin_embed(self, member: discord.Member, warning_type: str,
+                                  roles_list: str, time_full: str, now: datetime) -> discord.Embed:
+        admin_embed = discord.Embed(
+            title=f"🔔 Relatório de Aviso: {warning_type.capitalize()}",
+            description=f"Um aviso de inatividade foi enviado para {member.mention}.",
+            color=discord.Color.blue(),
+            timestamp=now
+        )
+        admin_embed.set_author(name=f"{member.display_name}", icon_url=member.display_avatar.url)
+        admin_embed.add_field(name="Usuário", value=f"{member.mention} (`{member.id}`)", inline=False)
+        admin_embed.add_field(name="Cargos em Risco", value=roles_list, inline=False)
+        admin_embed.add_field(name="Prazo", value=time_full, inline=False)
+        admin_embed.set_footer(text=f"Servidor: {member.guild.name}")
+        return admin_embed
 
     async def send_warning(self, member: discord.Member, warning_type: str, target_date: datetime = None):
         """
@@ -1366,111 +2762,18 @@ class InactivityBot(commands.Bot):
         :param target_date: A data final do ciclo atual (futuro). Se None, tentamos calcular.
         """
         try:
-            warnings_config = self.config.get('warnings', {})
-            messages = warnings_config.get('messages', {})
-            
-            message_template = messages.get(warning_type)
-            if not message_template:
+            template = self.get_warning_template(member.guild, warning_type)
+            if template is None:
                 logger.warning(f"Template de mensagem de aviso para '{warning_type}' não encontrado.")
                 return
 
-            # Calcular variáveis de tempo
             now = datetime.now(pytz.UTC)
-            time_relative = "em breve"
-            time_full = "data desconhecida"
-            days_remaining_str = "N/A"
-            period_end = None
-
-            # 1. Se recebermos a data alvo diretamente, usamos ela (Ideal)
-            if target_date:
-                period_end = target_date
-            
-            # 2. Fallback: Se não recebermos, tentamos buscar no banco (Pode pegar o ciclo anterior)
-            elif hasattr(self, 'db') and self.db:
-                try:
-                    last_check = await self.db.get_last_period_check(member.id, member.guild.id)
-                    if last_check:
-                        if isinstance(last_check, dict):
-                            period_end = last_check.get('period_end')
-                        else:
-                            period_end = getattr(last_check, 'period_end', None)
-                        
-                        # Se pegarmos do banco e já estiver no passado, precisamos projetar o PRÓXIMO fim
-                        if period_end and period_end < now:
-                            monitoring_days = self.config.get('monitoring_period', 14)
-                            # Adiciona dias até ficar no futuro (estimativa simples para fallback)
-                            while period_end < now:
-                                period_end += timedelta(days=monitoring_days)
-                except Exception as e:
-                    logger.error(f"Erro ao buscar last_check no fallback: {e}")
+            # Se recebermos a data alvo diretamente, usamos ela; senão buscamos no banco
+            period_end = target_date or await self._resolve_warning_deadline(member, now)
 
-            if period_end:
-                if getattr(period_end, 'tzinfo', None) is None:
-                    period_end = period_end.replace(tzinfo=pytz.UTC)
-                
-                # Gerar timestamps do Discord
-                timestamp = int(period_end.timestamp())
-                time_relative = f"<t:{timestamp}:R>"
-                time_full = f"<t:{timestamp}:F>"
-                
-                try:
-                    days_rem_val = max(0, (period_end - now).days)
-                    days_remaining_str = f"{days_rem_val} dias"
-                except Exception:
-                    days_remaining_str = "N/A"
-
-            # Listar cargos monitorados que o usuário possui
-            tracked_role_ids = self.config.get('tracked_roles', [])
-            user_tracked_roles = [role.name for role in member.roles if role.id in tracked_role_ids]
+            warning = self.build_warning(member, warning_type, period_end, now, template=template)
             
-            if not user_tracked_roles:
-                roles_list = "seus cargos monitorados"
-            else:
-                roles_list = ", ".join(user_tracked_roles)
-
-            # Preparar argumentos de formatação
-            format_args = {
-                'days': warnings_config.get('first_warning', 'N/A'),
-                'monitoring_period': self.config.get('monitoring_period', 'N/A'),
-                'required_minutes': self.config.get('required_minutes', 'N/A'),
-                'required_days': self.config.get('required_days', 'N/A'),
-                'guild': member.guild.name,
-                'days_remaining': days_remaining_str,
-                'time_relative': time_relative,
-                'time_full': time_full,
-                'roles_list': roles_list
-            }
-            
-            # Tenta formatar a mensagem
-            try:
-                message = message_template.format(**format_args)
-            except KeyError as e:
-                # Fallback se o template exigir uma chave que falhou
-                logger.warning(f"Erro de formatação na mensagem de aviso (chave faltando): {e}")
-                message = message_template 
-            
-            # Configuração Visual do Embed
-            if warning_type == 'first':
-                title = "⚠️ Aviso de Inatividade"
-                color = discord.Color.gold()
-            elif warning_type == 'second':
-                title = "🔴 Último Aviso: Risco de Perda"
-                color = discord.Color.orange()
-            else:
-                title = "❌ Cargos Removidos"
-                color = discord.Color.dark_red()
-            
-            embed = discord.Embed(
-                title=title,
-                description=message,
-                color=color,
-                timestamp=now)
-            
-            if member.guild.icon:
-                embed.set_author(name=member.guild.name, icon_url=member.guild.icon.url)
-            
-            # Enviar DM
-            await self.send_dm(member, message, embed)
+            await self.send_dm(member, warning['message'], warning['embed'], dedupe_key=warning['dedupe_key'])
             
             # Registrar no Banco
             try:
@@ -1484,18 +2787,9 @@ class InactivityBot(commands.Bot):
             
             # Notificar Admins se necessário
             if warning_type in ['first', 'second']:
-                admin_embed = discord.Embed(
-                    title=f"🔔 Relatório de Aviso: {warning_type.capitalize()}",
-                    description=f"Um aviso de inatividade foi enviado para {member.mention}.",
-                    color=discord.Color.blue(),
-                    timestamp=now
+                admin_embed = self.build_warning_admin_embed(
+                    member, warning_type, warning['roles_list'], warning['time_full'], now
                 )
-                admin_embed.set_author(name=f"{member.display_name}", icon_url=member.display_avatar.url)
-                admin_embed.add_field(name="Usuário", value=f"{member.mention} (`{member.id}`)", inline=False)
-                admin_embed.add_field(name="Cargos em Risco", value=roles_list, inline=False)
-                admin_embed.add_field(name="Prazo", value=time_full, inline=False)
-                admin_embed.set_footer(text=f"Servidor: {member.guild.name}")
-                
                 await self.notify_admins_dm(member.guild, embed=admin_embed)
 
         except Exception as e:
@@ -1668,6 +2962,14 @@ async def on_ready():
 
         logger.info(f'Bot conectado como {bot.user}')
         logger.info(f"Latência: {round(bot.latency * 1000)}ms")
+        bot.startup_timings = {
+            'imports': IMPORTS_DONE - PROCESS_START,
+            'on_ready': time.perf_counter() - PROCESS_START
+        }
+        logger.info(
+            f"Tempo de inicialização: importações {bot.startup_timings['imports']:.2f}s, "
+            f"on_ready {bot.startup_timings['on_ready']:.2f}s"
+        )
 
         try:
             if not hasattr(bot, 'db') or not bot.db or not getattr(bot.db, '_is_initialized', False):
@@ -1701,32 +3003,37 @@ async def on_ready():
                 process_pending_voice_events,
                 check_current_voice_members, detect_missing_voice_leaves,
                 cleanup_ghost_sessions_wrapper, register_role_assignments_wrapper,
-                cleanup_old_bot_messages
+                cleanup_old_bot_messages, leaderboard_maintenance, activity_cache_verifier,
+                run_task_scheduler
             )
             
-            async def start_task_with_jitter(task_coro, name):
-                delay = random.uniform(1, 30)
-                logger.info(f"Agendando a task '{name}' para iniciar em {delay:.2f} segundos.")
-                await asyncio.sleep(delay)
-                bot.loop.create_task(task_coro, name=name)
-
-            await start_task_with_jitter(register_role_assignments_wrapper(), 'register_role_assignments_wrapper')
-            await start_task_with_jitter(inactivity_check(), 'inactivity_check_wrapper')
-            await start_task_with_jitter(cleanup_members(), 'cleanup_members_wrapper')
-            await start_task_with_jitter(database_backup(), 'database_backup_wrapper')
-            await start_task_with_jitter(cleanup_old_data(), 'cleanup_old_data_wrapper')
-            await start_task_with_jitter(monitor_rate_limits(), 'monitor_rate_limits_wrapper')
-            await start_task_with_jitter(report_metrics(), 'report_metrics_wrapper')
-            await start_task_with_jitter(health_check(), 'health_check_wrapper')
+            # Tasks periódicas: todas disparadas por um único agendador com estado em task_executions
+            await register_role_assignments_wrapper()
+            await inactivity_check()
+            await cleanup_members()
+            await database_backup()
+            await cleanup_old_data()
+            await monitor_rate_limits()
+            await report_metrics()
+            await health_check()
+            await cleanup_ghost_sessions_wrapper()
+            bot.scheduler_task = bot.loop.create_task(run_task_scheduler(), name='task_scheduler')
             
             bot.loop.create_task(process_pending_voice_events(), name='process_pending_voice_events')
             bot.loop.create_task(check_current_voice_members(), name='check_current_voice_members')
             bot.loop.create_task(detect_missing_voice_leaves(), name='detect_missing_voice_leaves')
-            bot.loop.create_task(cleanup_ghost_sessions_wrapper(), name='cleanup_ghost_sessions_wrapper')
             
             bot.loop.create_task(cleanup_old_bot_messages(), name='cleanup_old_bot_messages_task')
+            bot.loop.create_task(leaderboard_maintenance(), name='leaderboard_maintenance')
+            bot.loop.create_task(activity_cache_verifier(), name='activity_cache_verifier')
 
             bot.queue_processor_task = bot.loop.create_task(bot.process_queues(), name='queue_processor')
+            bot.log_sink_task = bot.loop.create_task(bot.log_sink.run(), name='log_webhook_sink')
+            bot.outbox_task = bot.loop.create_task(bot.outbox.run(), name='outbox_flush')
+            bot.message_tracker_task = bot.loop.create_task(bot.message_tracker.run(), name='bot_message_tracker')
+            bot.rate_limit_telemetry_task = bot.loop.create_task(bot.rate_limit_telemetry.run(), name='rate_limit_telemetry')
+            bot.voice_occupancy_task = bot.loop.create_task(bot.voice_occupancy.run(), name='voice_occupancy_sampler')
+            bot.loop.create_task(bot.outbox.replay(), name='outbox_replay')
             bot.pool_monitor_task = bot.loop.create_task(bot.monitor_db_pool(), name='db_pool_monitor')
             bot.health_check_task = bot.loop.create_task(bot.periodic_health_check(), name='periodic_health_check')
             bot.audio_check_task = bot.loop.create_task(bot.check_audio_states(), name='audio_state_checker')
@@ -1759,6 +3066,13 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
     if member.bot:
         return
 
+    # Contadores de ocupação refletem o estado real, inclusive logo após reconexões
+    bot.voice_occupancy.on_voice_state(
+        member.guild.id,
+        before.channel.id if before.channel else None,
+        after.channel.id if after.channel else None
+    )
+
     try:
         event_id = bot.generate_event_id()
         event_time = datetime.now(pytz.UTC)
@@ -1779,15 +3093,28 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
         logger.error(f"Erro ao enfileirar evento de voz: {e}")
 
 # --- SERVIDOR WEB ---
-app = Flask(__name__)
+def create_web_app():
+    """Cria o app Flask (importado só quando o servidor web é iniciado)"""
+    from flask import Flask, jsonify
 
-@app.route('/')
-def home():
-    return "Bot de Controle de Atividade está online."
+    app = Flask(__name__)
+
+    @app.route('/')
+    def home():
+        return "Bot de Controle de Atividade está online."
+
+    @app.route('/metrics/outbound')
+    def outbound_metrics():
+        snapshot = bot.outbound_telemetry.snapshot()
+        snapshot['queue_sizes'] = bot.message_queue.qsize()
+        snapshot['log_sink'] = bot.log_sink.get_stats()
+        return jsonify(snapshot)
+
+    return app
 
 def run():
     port = int(os.environ.get("PORT", 10000))
-    app.run(host='0.0.0.0', port=port)
+    create_web_app().run(host='0.0.0.0', port=port)
 
 def start_web_server():
     t = Thread(target=run)
@@ -1798,6 +3125,8 @@ def start_web_server():
 # Importar comandos
 from bot_commands import *
 
+IMPORTS_DONE = time.perf_counter()
+
 async def main():
     load_dotenv()
     DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
@@ -0,0 +1,214 @@
+# occupancy.py
+"""
+Amostragem da ocupação dos canais de voz.
+
+Os contadores por canal são mantidos pelos próprios eventos de voz (entrada,
+saída, troca de canal), então cada amostra custa O(canais ocupados), sem
+percorrer membros nem chamar a API. As amostras ficam num buffer circular NumPy
+por guilda (coluna 0 = total da guilda) e, a cada `flush_interval`, viram uma
+linha compacta por canal (amostras, pico e média) na tabela voice_occupancy.
+Uma recontagem periódica a partir do cache de voice states corrige eventuais
+eventos perdidos (reconexões, reinícios).
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger('inactivity_bot')
+
+class _GuildRing:
+    """Buffer circular de amostras de uma guilda: horários e contagens por coluna (canal)"""
+
+    def __init__(self, capacity: int, max_channels: int):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.counts = np.zeros((capacity, max_channels + 1), dtype=np.uint16)
+        self.columns: Dict[int, int] = {}  # channel_id -> coluna (a coluna 0 é o total)
+        self._free_columns = list(range(max_channels, 0, -1))
+        self.overflow = set()  # Canais ocupados sem coluna livre
+        self.written = 0   # Total de amostras já gravadas no buffer
+        self.flushed = 0   # Total de amostras já enviadas ao banco
+
+    def column_for(self, channel_id: int) -> Optional[int]:
+        column = self.columns.get(channel_id)
+        if column is None:
+            if not self._free_columns:
+                if channel_id not in self.overflow:
+                    self.overflow.add(channel_id)
+                    logger.warning(
+                        f"Sem coluna livre para o canal {channel_id} na amostragem de ocupação "
+                        f"({len(self.columns)} canais); ele entra só no total até o próximo flush"
+                    )
+                return None
+            column = self.columns[channel_id] = self._free_columns.pop()
+        return column
+
+    def reclaim_columns(self, occupied):
+        """Libera as colunas de canais vazios agora e sem amostras pendentes de gravação"""
+        rows = self.pending_rows()
+        peaks = self.counts[rows].max(axis=0) if len(rows) else np.zeros(self.counts.shape[1], dtype=np.uint16)
+        for channel_id, column in list(self.columns.items()):
+            if channel_id not in occupied and not peaks[column]:
+                del self.columns[channel_id]
+                self._free_columns.append(column)
+        self.overflow.clear()
+
+    def append(self, timestamp: int, channel_counts: Dict[int, int]):
+        row = self.written % self.capacity
+        self.timestamps[row] = timestamp
+        self.counts[row] = 0
+        total = 0
+        for channel_id, count in channel_counts.items():
+            total += count
+            column = self.column_for(channel_id)
+            if column is not None:
+                self.counts[row, column] = min(count, 65535)
+        self.counts[row, 0] = min(total, 65535)
+        self.written += 1
+
+    def pending_rows(self) -> 'np.ndarray':
+        """Índices (em ordem) das amostras ainda não gravadas; as mais antigas que a capacidade se perdem"""
+        first = max(self.flushed, self.written - self.capacity)
+        return np.arange(first, self.written) % self.capacity
+
+class VoiceOccupancySampler:
+    DEFAULTS = {
+        'enabled': True,
+        'sample_interval': 30,
+        'flush_interval': 300,
+        'resync_interval': 1800,
+        'capacity': 2880,
+        'max_channels': 63
+    }
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._channel_counts: Dict[int, Dict[int, int]] = {}  # guild -> canal -> pessoas
+        self._rings: Dict[int, _GuildRing] = {}
+        self._last_flush = time.monotonic()
+        self._last_resync = 0.0
+        self._flush_lock = asyncio.Lock()
+        self.stats = {'samples': 0, 'rows_written': 0, 'resyncs': 0, 'corrections': 0}
+
+    @property
+    def settings(self) -> dict:
+        config = getattr(self.bot, 'config', None) or {}
+        return {**self.DEFAULTS, **(config.get('voice_occupancy') or {})}
+
+    def on_voice_state(self, guild_id: int, before_channel_id: Optional[int], after_channel_id: Optional[int]):
+        """Atualiza os contadores a partir de um voice_state_update (chamado para cada evento)"""
+        if before_channel_id == after_channel_id:
+            return
+        counts = self._channel_counts.setdefault(guild_id, {})
+        if before_channel_id is not None:
+            remaining = counts.get(before_channel_id, 0) - 1
+            if remaining > 0:
+                counts[before_channel_id] = remaining
+            else:
+                counts.pop(before_channel_id, None)
+        if after_channel_id is not None:
+            counts[after_channel_id] = counts.get(after_channel_id, 0) + 1
+
+    def resync(self):
+        """Recalcula os contadores a partir do cache de voice states do gateway (sem chamadas à API)"""
+        corrections = 0
+        for guild in self.bot.guilds:
+            counts = {}
+            for channel in list(guild.voice_channels) + list(guild.stage_channels):
+                people = sum(1 for member in channel.members if not member.bot)
+                if people:
+                    counts[channel.id] = people
+            if counts != self._channel_counts.get(guild.id, {}):
+                corrections += 1
+            self._channel_counts[guild.id] = counts
+        self.stats['resyncs'] += 1
+        self.stats['corrections'] += corrections
+        self._last_resync = time.monotonic()
+
+    def _ring(self, guild_id: int) -> _GuildRing:
+        ring = self._rings.get(guild_id)
+        if ring is None:
+            settings = self.settings
+            ring = self._rings[guild_id] = _GuildRing(int(settings['capacity']), int(settings['max_channels']))
+        return ring
+
+    def sample(self, now: Optional[float] = None):
+        """Registra uma amostra de cada guilda: O(canais ocupados)"""
+        timestamp = int(now if now is not None else time.time())
+        for guild in self.bot.guilds:
+            self._ring(guild.id).append(timestamp, self._channel_counts.get(guild.id, {}))
+        self.stats['samples'] += 1
+
+    def _summarize(self, guild_id: int, ring: _GuildRing) -> List[Tuple]:
+        rows = ring.pending_rows()
+        if not len(rows):
+            return []
+        counts = ring.counts[rows].astype(np.int32)
+        peaks = counts.max(axis=0)
+        averages = counts.mean(axis=0)
+        bucket_start = datetime.fromtimestamp(int(ring.timestamps[rows[0]]), pytz.utc)
+        bucket_end = datetime.fromtimestamp(int(ring.timestamps[rows[-1]]), pytz.utc)
+
+        channel_by_column = {column: channel_id for channel_id, column in ring.columns.items()}
+        records = [(guild_id, 0, bucket_start, bucket_end, len(rows), int(peaks[0]), float(averages[0]))]
+        for column in np.flatnonzero(peaks[1:]) + 1:
+            records.append((guild_id, channel_by_column[int(column)], bucket_start, bucket_end,
+                            len(rows), int(peaks[column]), float(averages[column])))
+        return records
+
+    async def flush(self, guild_id: Optional[int] = None):
+        """Grava as amostras pendentes como uma linha por canal ocupado (e uma para o total)"""
+        db = getattr(self.bot, 'db', None)
+        if not db or not getattr(db, '_is_initialized', False):
+            return
+        # Um flush por vez: dois resumos das mesmas amostras antes de `flushed` avançar gravariam linhas duplicadas
+        async with self._flush_lock:
+            if guild_id is None:
+                rings = dict(self._rings)
+            else:
+                rings = {guild_id: self._rings[guild_id]} if guild_id in self._rings else {}
+
+            records, marks = [], []
+            for ring_guild_id, ring in rings.items():
+                records.extend(self._summarize(ring_guild_id, ring))
+                marks.append((ring, ring.written))
+            if not records:
+                return
+
+            await db.insert_voice_occupancy(records)
+            for ring, written in marks:
+                ring.flushed = written
+            for ring_guild_id, ring in rings.items():
+                # Canais apagados ou vazios devolvem a coluna para os que aparecerem depois
+                ring.reclaim_columns(self._channel_counts.get(ring_guild_id, {}))
+            self.stats['rows_written'] += len(records)
+            if guild_id is None:
+                self._last_flush = time.monotonic()
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        self.resync()
+        while True:
+            try:
+                settings = self.settings
+                await asyncio.sleep(max(5, int(settings['sample_interval'])))
+                if not settings.get('enabled', True):
+                    continue
+                if time.monotonic() - self._last_resync >= int(settings['resync_interval']):
+                    self.resync()
+                self.sample()
+                if time.monotonic() - self._last_flush >= int(settings['flush_interval']):
+                    await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro na amostragem de ocupação de voz: {e}", exc_info=True)
+                await asyncio.sleep(30)
@@ -0,0 +1,198 @@
+# raster_charts.py
+"""
+Renderizador leve de gráficos, sem matplotlib.
+
+Desenha o gráfico de barras de atividade diretamente num buffer de pixels NumPy
+(fonte bitmap 5x7 embutida) e codifica o PNG com zlib. Usa poucos MB de memória
+e renderiza em milissegundos; gráficos mais elaborados continuam no matplotlib.
+"""
+import struct
+import unicodedata
+import zlib
+from typing import List, Tuple
+
+import numpy as np
+
+# Fonte bitmap 5x7: cada glifo tem 7 linhas de 5 bits (bit 4 = coluna da esquerda)
+_FONT_5X7 = {
+    '0': (0x0E, 0x11, 0x13, 0x15, 0x19, 0x11, 0x0E),
+    '1': (0x04, 0x0C, 0x04, 0x04, 0x04, 0x04, 0x0E),
+    '2': (0x0E, 0x11, 0x01, 0x02, 0x04, 0x08, 0x1F),
+    '3': (0x1F, 0x02, 0x04, 0x02, 0x01, 0x11, 0x0E),
+    '4': (0x02, 0x06, 0x0A, 0x12, 0x1F, 0x02, 0x02),
+    '5': (0x1F, 0x10, 0x1E, 0x01, 0x01, 0x11, 0x0E),
+    '6': (0x06, 0x08, 0x10, 0x1E, 0x11, 0x11, 0x0E),
+    '7': (0x1F, 0x01, 0x02, 0x04, 0x08, 0x08, 0x08),
+    '8': (0x0E, 0x11, 0x11, 0x0E, 0x11, 0x11, 0x0E),
+    '9': (0x0E, 0x11, 0x11, 0x0F, 0x01, 0x02, 0x0C),
+    'A': (0x0E, 0x11, 0x11, 0x11, 0x1F, 0x11, 0x11),
+    'B': (0x1E, 0x11, 0x11, 0x1E, 0x11, 0x11, 0x1E),
+    'C': (0x0E, 0x11, 0x10, 0x10, 0x10, 0x11, 0x0E),
+    'D': (0x1C, 0x12, 0x11, 0x11, 0x11, 0x12, 0x1C),
+    'E': (0x1F, 0x10, 0x10, 0x1E, 0x10, 0x10, 0x1F),
+    'F': (0x1F, 0x10, 0x10, 0x1E, 0x10, 0x10, 0x10),
+    'G': (0x0E, 0x11, 0x10, 0x17, 0x11, 0x11, 0x0F),
+    'H': (0x11, 0x11, 0x11, 0x1F, 0x11, 0x11, 0x11),
+    'I': (0x0E, 0x04, 0x04, 0x04, 0x04, 0x04, 0x0E),
+    'J': (0x07, 0x02, 0x02, 0x02, 0x02, 0x12, 0x0C),
+    'K': (0x11, 0x12, 0x14, 0x18, 0x14, 0x12, 0x11),
+    'L': (0x10, 0x10, 0x10, 0x10, 0x10, 0x10, 0x1F),
+    'M': (0x11, 0x1B, 0x15, 0x15, 0x11, 0x11, 0x11),
+    'N': (0x11, 0x11, 0x19, 0x15, 0x13, 0x11, 0x11),
+    'O': (0x0E, 0x11, 0x11, 0x11, 0x11, 0x11, 0x0E),
+    'P': (0x1E, 0x11, 0x11, 0x1E, 0x10, 0x10, 0x10),
+    'Q': (0x0E, 0x11, 0x11, 0x11, 0x15, 0x12, 0x0D),
+    'R': (0x1E, 0x11, 0x11, 0x1E, 0x14, 0x12, 0x11),
+    'S': (0x0F, 0x10, 0x10, 0x0E, 0x01, 0x01, 0x1E),
+    'T': (0x1F, 0x04, 0x04, 0x04, 0x04, 0x04, 0x04),
+    'U': (0x11, 0x11, 0x11, 0x11, 0x11, 0x11, 0x0E),
+    'V': (0x11, 0x11, 0x11, 0x11, 0x11, 0x0A, 0x04),
+    'W': (0x11, 0x11, 0x11, 0x15, 0x15, 0x15, 0x0A),
+    'X': (0x11, 0x11, 0x0A, 0x04, 0x0A, 0x11, 0x11),
+    'Y': (0x11, 0x11, 0x11, 0x0A, 0x04, 0x04, 0x04),
+    'Z': (0x1F, 0x01, 0x02, 0x04, 0x08, 0x10, 0x1F),
+    ' ': (0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00),
+    '/': (0x00, 0x01, 0x02, 0x04, 0x08, 0x10, 0x00),
+    ':': (0x00, 0x0C, 0x0C, 0x00, 0x0C, 0x0C, 0x00),
+    '-': (0x00, 0x00, 0x00, 0x1F, 0x00, 0x00, 0x00),
+    '.': (0x00, 0x00, 0x00, 0x00, 0x00, 0x0C, 0x0C),
+    '(': (0x02, 0x04, 0x08, 0x08, 0x08, 0x04, 0x02),
+    ')': (0x08, 0x04, 0x02, 0x02, 0x02, 0x04, 0x08),
+    '_': (0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x1F),
+    '?': (0x0E, 0x11, 0x01, 0x02, 0x04, 0x00, 0x04),
+}
+_GLYPH_W, _GLYPH_H, _GLYPH_SPACING = 5, 7, 1
+
+_BACKGROUND = (255, 255, 255)
+_PLOT_BACKGROUND = (234, 234, 242)
+_GRID = (255, 255, 255)
+_BAR = (88, 101, 242)  # #5865F2
+_TEXT = (40, 40, 40)
+
+def _glyph_masks() -> dict:
+    bits = np.array([1 << (_GLYPH_W - 1 - i) for i in range(_GLYPH_W)])
+    return {
+        char: (np.array(rows)[:, None] & bits) > 0
+        for char, rows in _FONT_5X7.items()
+    }
+
+_GLYPHS = _glyph_masks()
+
+def _normalize_text(text: str) -> str:
+    """Remove acentos e troca caracteres sem glifo por '?'"""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').upper()
+    return ''.join(char if char in _GLYPHS else '?' for char in text)
+
+def text_mask(text: str, scale: int = 1) -> np.ndarray:
+    """Máscara booleana (altura x largura) do texto renderizado na fonte 5x7"""
+    text = _normalize_text(text)
+    if not text:
+        return np.zeros((_GLYPH_H * scale, 0), dtype=bool)
+    spacer = np.zeros((_GLYPH_H, _GLYPH_SPACING), dtype=bool)
+    parts = []
+    for char in text:
+        parts.extend((_GLYPHS[char], spacer))
+    mask = np.hstack(parts[:-1])
+    if scale > 1:
+        mask = np.kron(mask, np.ones((scale, scale), dtype=bool))
+    return mask
+
+def _blit(pixels: np.ndarray, mask: np.ndarray, x: int, y: int, color: Tuple[int, int, int]):
+    """Pinta a máscara na posição (x, y) do canto superior esquerdo, recortando nas bordas"""
+    height, width = pixels.shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + mask.shape[1], width), min(y + mask.shape[0], height)
+    if x0 >= x1 or y0 >= y1:
+        return
+    region = pixels[y0:y1, x0:x1]
+    region[mask[y0 - y:y1 - y, x0 - x:x1 - x]] = color
+
+def _draw_text(pixels: np.ndarray, text: str, x: int, y: int, scale: int = 1,
+               anchor: str = 'left', color: Tuple[int, int, int] = _TEXT, vertical: bool = False):
+    mask = text_mask(text, scale)
+    if vertical:
+        mask = np.rot90(mask)
+    if anchor == 'center':
+        x -= mask.shape[1] // 2
+    elif anchor == 'right':
+        x -= mask.shape[1]
+    _blit(pixels, mask, x, y, color)
+
+def _nice_step(max_value: float, target_ticks: int = 6) -> float:
+    raw = max_value / target_ticks
+    magnitude = 10 ** np.floor(np.log10(raw)) if raw > 0 else 1
+    for factor in (1, 2, 2.5, 5, 10):
+        if factor * magnitude >= raw:
+            return factor * magnitude
+    return 10 * magnitude
+
+def encode_png(pixels: np.ndarray, level: int = 6) -> bytes:
+    """Codifica um buffer RGB uint8 (altura x largura x 3) como PNG"""
+    height, width = pixels.shape[:2]
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), pixels.reshape(height, width * 3)])
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), level)) + chunk(b'IEND', b''))
+
+def render_activity_bar_chart_raster(labels: List[str], values: List[float], title: str,
+                                     xlabel: str = 'Data', ylabel: str = 'Minutos em Voz',
+                                     width: int = 1200, height: int = 600) -> bytes:
+    """Mesmo gráfico de render_activity_bar_chart, desenhado sem matplotlib"""
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[:] = _BACKGROUND
+
+    title_lines = title.split('\n')
+    left, right = 90, width - 30
+    top = 24 + len(title_lines) * 22
+    bottom = height - 70
+    pixels[top:bottom, left:right] = _PLOT_BACKGROUND
+
+    # Título e rótulos dos eixos
+    for i, line in enumerate(title_lines):
+        _draw_text(pixels, line, width // 2, 14 + i * 22, scale=2, anchor='center')
+    _draw_text(pixels, xlabel, (left + right) // 2, height - 24, scale=2, anchor='center')
+    ylabel_width = len(_normalize_text(ylabel)) * (_GLYPH_W + _GLYPH_SPACING) * 2
+    _draw_text(pixels, ylabel, 12, (top + bottom) // 2 - ylabel_width // 2, scale=2, vertical=True)
+
+    # Escala vertical e linhas de grade
+    max_value = max(values) if values else 0
+    y_max = max_value * 1.2 if max_value > 0 else 100
+    step = _nice_step(y_max)
+    plot_height = bottom - top
+    tick = 0.0
+    while tick <= y_max:
+        y = bottom - int(round(tick / y_max * plot_height))
+        if top <= y < bottom:
+            pixels[y, left:right] = _GRID
+        _draw_text(pixels, f"{tick:g}", left - 8, y - 3, anchor='right')
+        tick += step
+
+    # Barras e valores
+    count = len(values)
+    if count:
+        slot = (right - left) / count
+        bar_width = max(1, int(slot * 0.7))
+        label_scale = 2 if slot >= 70 else 1
+        char_width = (_GLYPH_W + _GLYPH_SPACING) * label_scale
+        show_unit = len(f"{int(max_value)} min") * char_width <= slot
+        for i, (label, value) in enumerate(zip(labels, values)):
+            center = left + int(slot * (i + 0.5))
+            x0 = center - bar_width // 2
+            bar_top = bottom - int(round(value / y_max * plot_height))
+            pixels[bar_top:bottom, x0:x0 + bar_width] = _BAR
+
+            if value > 0:
+                value_text = f"{int(value)} min" if show_unit else f"{int(value)}"
+                _draw_text(pixels, value_text, center, bar_top - 7 * label_scale - 3,
+                           scale=label_scale, anchor='center')
+            _draw_text(pixels, label, center, bottom + 8, scale=label_scale, anchor='center')
+
+    # Eixos
+    pixels[bottom, left:right] = _TEXT
+    pixels[top:bottom + 1, left] = _TEXT
+
+    return encode_png(pixels)
@@ -0,0 +1,228 @@
+# scheduler.py
+"""
+Agendador único das tasks periódicas com estado persistente (task_executions).
+
+Uma só corrotina mantém um heap de (próxima execução, task) e dorme exatamente até
+o próximo vencimento (ou até uma task nova ser registrada); não há laço de
+verificação por task. O estado inicial vem do banco: uma task vence em
+last_execution + intervalo. Depois de um período fora do ar as execuções perdidas
+são agrupadas numa só, com um atraso aleatório de até `catchup_jitter` segundos
+para espalhar as tasks atrasadas.
+
+Cada execução é reivindicada no banco antes de começar
+(Database.claim_task_execution: grava o novo last_execution só se o anterior tiver
+pelo menos um intervalo), então uma task roda no máximo uma vez por intervalo mesmo
+com reinícios ou duas instâncias. Se a task falhar a reivindicação é desfeita e ela
+é tentada de novo mais tarde.
+
+O relógio é injetável (`now()` e `sleep_until()`), o que permite testar os horários
+de disparo sem esperar.
+"""
+import asyncio
+import heapq
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import pytz
+
+logger = logging.getLogger('inactivity_bot')
+
+class SystemClock:
+    def now(self) -> datetime:
+        return datetime.now(pytz.utc)
+
+    async def sleep_until(self, when: Optional[datetime], wakeup: asyncio.Event) -> bool:
+        """Dorme até `when` (ou indefinidamente se None); retorna True se acordado por `wakeup`"""
+        while True:
+            timeout = None if when is None else (when - self.now()).total_seconds()
+            if timeout is not None and timeout <= 0:
+                return False
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+                return True
+            except asyncio.TimeoutError:
+                # O relógio do loop e o de parede podem divergir por milissegundos: confere de novo
+                continue
+
+class ScheduledTask:
+    __slots__ = ('name', 'func', 'interval', 'monitoring_period', 'slot', 'next_run', 'running', 'loaded')
+
+    def __init__(self, name: str, func: Callable, interval: timedelta,
+                 monitoring_period: Union[int, Callable[[], int]]):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.monitoring_period = monitoring_period  # Valor gravado em task_executions (ou função que o fornece)
+        self.slot: Optional[datetime] = None      # Vencimento nominal (last_execution + intervalo)
+        self.next_run: Optional[datetime] = None  # Quando vai rodar (vencimento ou atraso de recuperação)
+        self.running = False
+        self.loaded = False
+
+    def period_value(self) -> int:
+        return self.monitoring_period() if callable(self.monitoring_period) else self.monitoring_period
+
+class PersistentScheduler:
+    RETRY_DELAY = timedelta(minutes=5)
+
+    def __init__(self, clock=None, catchup_jitter: float = 30.0, rng: Optional[random.Random] = None):
+        self.clock = clock or SystemClock()
+        self.catchup_jitter = catchup_jitter
+        self.rng = rng or random.Random()
+        self.store = None
+        self._tasks: Dict[str, ScheduledTask] = {}
+        self._heap: List[Tuple[datetime, int, str]] = []
+        self._sequence = 0
+        self._wakeup = asyncio.Event()
+        self._sleeping_until: Optional[datetime] = None
+        self._running: Dict[str, asyncio.Task] = {}
+        self.stats = {'runs': 0, 'failures': 0, 'coalesced': 0, 'lost_claims': 0, 'wakeups': 0, 'idle_wakeups': 0}
+
+    def register(self, name: str, func: Callable, interval: timedelta,
+                 monitoring_period: Union[int, Callable[[], int]] = 1):
+        """Registra (ou atualiza) uma task; o estado persistido é carregado pela corrotina principal"""
+        task = self._tasks.get(name)
+        if task is None:
+            self._tasks[name] = ScheduledTask(name, func, interval, monitoring_period)
+            self._wakeup.set()
+        else:
+            task.func, task.interval, task.monitoring_period = func, interval, monitoring_period
+
+    def _schedule(self, task: ScheduledTask, next_run: datetime, slot: Optional[datetime]):
+        task.next_run = next_run
+        task.slot = slot
+        self._sequence += 1
+        heapq.heappush(self._heap, (next_run, self._sequence, task.name))
+        # Só acorda a corrotina principal se o novo vencimento vier antes do que ela aguarda
+        if self._sleeping_until is None or next_run < self._sleeping_until:
+            self._wakeup.set()
+
+    def _schedule_from_state(self, task: ScheduledTask, last_execution: Optional[datetime], now: datetime):
+        if last_execution is None:
+            slot = now
+        else:
+            if last_execution.tzinfo is None:
+                last_execution = last_execution.replace(tzinfo=pytz.utc)
+            slot = last_execution + task.interval
+        next_run = slot
+        if slot <= now:
+            missed = int((now - slot) / task.interval)
+            if missed:
+                self.stats['coalesced'] += missed
+                logger.info(f"Task {task.name}: {missed} execução(ões) perdida(s) agrupada(s) em uma")
+            next_run = now + timedelta(seconds=self.rng.uniform(0, self.catchup_jitter))
+        task.loaded = True
+        self._schedule(task, next_run, slot)
+
+    async def _load_new_tasks(self):
+        pending = [task for task in self._tasks.values() if not task.loaded]
+        if not pending:
+            return
+        executions = await self.store.get_task_executions([task.name for task in pending])
+        now = self.clock.now()
+        for task in pending:
+            self._schedule_from_state(task, executions.get(task.name), now)
+
+    def _pop_due(self, now: datetime) -> List[ScheduledTask]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            next_run, _, name = heapq.heappop(self._heap)
+            task = self._tasks.get(name)
+            # Entradas substituídas por um novo agendamento ficam no heap e são ignoradas aqui
+            if task is None or task.next_run != next_run:
+                continue
+            task.next_run = None
+            task.running = True
+            due.append(task)
+        return due
+
+    def _next_wakeup(self) -> Optional[datetime]:
+        while self._heap:
+            next_run, _, name = self._heap[0]
+            task = self._tasks.get(name)
+            if task is not None and task.next_run == next_run:
+                return next_run
+            heapq.heappop(self._heap)
+        return None
+
+    async def _execute(self, task: ScheduledTask):
+        now = self.clock.now()
+        # Atraso menor que um intervalo mantém a fase; atraso maior recomeça a contar de agora
+        claimed_at = task.slot if task.slot <= now and now - task.slot < task.interval else now
+        try:
+            claim = await self.store.claim_task_execution(
+                task.name, claimed_at, claimed_at - task.interval, task.period_value()
+            )
+        except Exception as e:
+            logger.error(f"Erro ao reivindicar a execução da task {task.name}: {e}")
+            self._schedule(task, now + self.RETRY_DELAY, task.slot)
+            return
+
+        if claim is None:
+            # Outra instância (ou um registro manual) já executou neste intervalo
+            self.stats['lost_claims'] += 1
+            executions = await self.store.get_task_executions([task.name])
+            self._schedule_from_state(task, executions.get(task.name), self.clock.now())
+            return
+
+        logger.info(f"Executando task {task.name}...")
+        try:
+            await task.func()
+        except Exception as e:
+            self.stats['failures'] += 1
+            logger.error(f"Erro na task {task.name}: {e}", exc_info=True)
+            try:
+                await self.store.release_task_execution(task.name, claimed_at, claim['previous_execution'])
+            except Exception as release_error:
+                logger.error(f"Erro ao desfazer a execução da task {task.name}: {release_error}")
+            retry = self.clock.now() + min(task.interval, self.RETRY_DELAY * 12)
+            self._schedule(task, retry, task.slot)
+            return
+
+        self.stats['runs'] += 1
+        logger.info(f"Task {task.name} concluída com sucesso")
+        slot = claimed_at + task.interval
+        self._schedule(task, max(slot, self.clock.now()), slot)
+
+    async def _run_task(self, task: ScheduledTask):
+        try:
+            await self._execute(task)
+        except Exception as e:
+            logger.error(f"Erro no agendamento da task {task.name}: {e}", exc_info=True)
+            self._schedule(task, self.clock.now() + self.RETRY_DELAY, task.slot)
+        finally:
+            task.running = False
+            self._running.pop(task.name, None)
+
+    async def run(self, store):
+        """Corrotina principal: carrega o estado, dispara as tasks vencidas e dorme até a próxima"""
+        self.store = store
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._load_new_tasks()
+            except Exception as e:
+                logger.error(f"Erro ao carregar o estado das tasks agendadas: {e}")
+                await self.clock.sleep_until(self.clock.now() + self.RETRY_DELAY, asyncio.Event())
+                continue
+
+            for task in self._pop_due(self.clock.now()):
+                self._running[task.name] = asyncio.create_task(self._run_task(task), name=f'scheduled_{task.name}')
+
+            self._sleeping_until = self._next_wakeup()
+            try:
+                woken = await self.clock.sleep_until(self._sleeping_until, self._wakeup)
+            finally:
+                self._sleeping_until = None
+            self.stats['wakeups'] += 1
+            next_run = self._next_wakeup()
+            if not woken and (next_run is None or next_run > self.clock.now()):
+                self.stats['idle_wakeups'] += 1
+
+    def get_schedule(self) -> List[Tuple[str, Optional[datetime], bool]]:
+        """(task, próxima execução, em execução) em ordem de vencimento"""
+        return sorted(
+            ((task.name, task.next_run, task.running) for task in self._tasks.values()),
+            key=lambda item: (item[1] is None, item[1] or datetime.min.replace(tzinfo=pytz.utc))
+        )
@@ -0,0 +1,263 @@
+# session_arrays.py
+"""
+Sessões de voz em formato colunar para análises da guilda inteira.
+
+`load_guild_sessions` traz as sessões de uma guilda e janela direto para arrays
+NumPy (user_id int64, join em epoch int64, duração int32), via COPY ... BINARY
+(linhas de tamanho fixo lidas com np.frombuffer) ou via uma consulta enxuta que
+devolve três arrays agregados. Nenhum Record é criado por sessão.
+
+Os kernels operam sobre esses arrays sem laços em Python: recorte das sessões a
+uma janela, totais por usuário e dias distintos por usuário no fuso da guilda.
+"""
+import struct
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+# $1 = guild_id, $2 = início, $3 = fim (sessões que tocam a janela)
+SESSION_COLUMNS_QUERY = '''
+    SELECT user_id::INT8,
+           EXTRACT(EPOCH FROM join_time)::INT8 AS join_epoch,
+           GREATEST(EXTRACT(EPOCH FROM (leave_time - join_time)), 0)::INT4 AS duration
+    FROM voice_sessions
+    WHERE guild_id = $1 AND join_time < $3 AND leave_time > $2
+'''
+
+_COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+
+@lru_cache(maxsize=1)
+def _copy_row_dtype():
+    # Cada linha: nº de campos (int16) e, por campo, tamanho (int32) + valor
+    return np.dtype([
+        ('fields', '>i2'),
+        ('user_len', '>i4'), ('user_id', '>i8'),
+        ('join_len', '>i4'), ('join_epoch', '>i8'),
+        ('duration_len', '>i4'), ('duration', '>i4'),
+    ])
+
+@lru_cache(maxsize=16)
+def timezone_transitions(tz) -> Tuple['np.ndarray', 'np.ndarray']:
+    """Instantes (epoch UTC) em que o offset do fuso muda e o offset vigente a partir de cada um"""
+    utc_transitions = getattr(tz, '_utc_transition_times', None)
+    if utc_transitions:
+        starts = np.array(utc_transitions, dtype='datetime64[s]').astype(np.int64)
+        offsets = np.array([int(info[0].total_seconds()) for info in tz._transition_info], dtype=np.int64)
+        starts[0] = np.iinfo(np.int64).min
+        return starts, offsets
+
+    # Fuso com offset fixo (UTC, StaticTzInfo, etc.)
+    offset = tz.utcoffset(datetime(2000, 1, 1)) or timedelta(0)
+    return np.array([np.iinfo(np.int64).min], dtype=np.int64), np.array([int(offset.total_seconds())], dtype=np.int64)
+
+def local_days(epochs: 'np.ndarray', tz) -> 'np.ndarray':
+    """Dia local (dias desde 1970-01-01 no fuso `tz`) de cada instante em epoch UTC"""
+    starts, offsets = timezone_transitions(tz)
+    idx = np.searchsorted(starts, epochs, side='right') - 1
+    return (epochs + offsets[np.maximum(idx, 0)]) // 86400
+
+class SessionArrays:
+    """Sessões de voz em colunas: user_id (int64), join_epoch (int64, s) e duration (int32, s)"""
+
+    def __init__(self, user_ids: 'np.ndarray', join_epochs: 'np.ndarray', durations: 'np.ndarray'):
+        self.user_ids = user_ids
+        self.join_epochs = join_epochs
+        self.durations = durations
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @property
+    def leave_epochs(self) -> 'np.ndarray':
+        return self.join_epochs + self.durations
+
+    @property
+    def nbytes(self) -> int:
+        return self.user_ids.nbytes + self.join_epochs.nbytes + self.durations.nbytes
+
+    @classmethod
+    def empty(cls) -> 'SessionArrays':
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32))
+
+    @classmethod
+    def from_columns(cls, user_ids: Optional[List[int]], join_epochs: Optional[List[int]],
+                     durations: Optional[List[int]]) -> 'SessionArrays':
+        return cls(
+            np.array(user_ids or [], dtype=np.int64),
+            np.array(join_epochs or [], dtype=np.int64),
+            np.array(durations or [], dtype=np.int32)
+        )
+
+    @classmethod
+    def from_copy_binary(cls, data: bytes) -> 'SessionArrays':
+        """Interpreta a saída de COPY (SESSION_COLUMNS_QUERY) TO STDOUT WITH (FORMAT binary)"""
+        if not data.startswith(_COPY_SIGNATURE):
+            raise ValueError("Saída de COPY binário inválida (assinatura)")
+        extension_length = struct.unpack_from('>I', data, len(_COPY_SIGNATURE) + 4)[0]
+        offset = len(_COPY_SIGNATURE) + 8 + extension_length
+        body = len(data) - offset - 2  # Trailer: int16 -1
+        dtype = _copy_row_dtype()
+        if body < 0 or body % dtype.itemsize or data[-2:] != b'\xff\xff':
+            raise ValueError("Saída de COPY binário inválida (linhas com tamanho inesperado)")
+
+        rows = np.frombuffer(data, dtype=dtype, count=body // dtype.itemsize, offset=offset)
+        if len(rows) and ((rows['fields'] != 3).any() or (rows['user_len'] != 8).any()
+                          or (rows['join_len'] != 8).any() or (rows['duration_len'] != 4).any()):
+            raise ValueError("Saída de COPY binário inválida (campo nulo ou de tipo inesperado)")
+        return cls(
+            rows['user_id'].astype(np.int64),
+            rows['join_epoch'].astype(np.int64),
+            rows['duration'].astype(np.int32)
+        )
+
+    @classmethod
+    def from_records(cls, rows: List) -> 'SessionArrays':
+        """Converte Records/dicts com user_id, join_time e leave_time (caminho legado)"""
+        if not rows:
+            return cls.empty()
+        join_epochs = np.array([round(row['join_time'].timestamp()) for row in rows], dtype=np.int64)
+        leave_epochs = np.array([round(row['leave_time'].timestamp()) for row in rows], dtype=np.int64)
+        return cls(
+            np.array([row['user_id'] for row in rows], dtype=np.int64),
+            join_epochs,
+            np.maximum(leave_epochs - join_epochs, 0).astype(np.int32)
+        )
+
+async def load_guild_sessions(db, guild_id: int, start_date: datetime, end_date: datetime,
+                              method: str = 'copy') -> SessionArrays:
+    """Sessões da guilda que tocam [start_date, end_date) em arrays; `method` é 'copy' ou 'fetch'"""
+    if method == 'fetch':
+        user_ids, join_epochs, durations = await db.get_session_columns(guild_id, start_date, end_date)
+        return SessionArrays.from_columns(user_ids, join_epochs, durations)
+
+    chunks = []
+
+    async def sink(chunk: bytes):
+        chunks.append(chunk)
+
+    await db.copy_query_to(SESSION_COLUMNS_QUERY, guild_id, start_date, end_date,
+                           output=sink, format='binary', header=None)
+    return SessionArrays.from_copy_binary(b''.join(chunks))
+
+def clip_durations(sessions: SessionArrays, start_epoch: int, end_epoch: int) -> 'np.ndarray':
+    """Segundos de cada sessão dentro da janela [start_epoch, end_epoch) (0 se não houver interseção)"""
+    clipped = np.minimum(sessions.leave_epochs, end_epoch) - np.maximum(sessions.join_epochs, start_epoch)
+    return np.maximum(clipped, 0)
+
+def per_user_totals(user_ids: 'np.ndarray', values: 'np.ndarray') -> Tuple['np.ndarray', 'np.ndarray']:
+    """Soma de `values` por usuário: (usuários ordenados, totais)"""
+    users, inverse = np.unique(user_ids, return_inverse=True)
+    return users, np.bincount(inverse, weights=values, minlength=len(users)).astype(np.int64)
+
+def distinct_days_per_user(sessions: SessionArrays, tz, min_session_seconds: int = 0,
+                           durations: Optional['np.ndarray'] = None) -> Tuple['np.ndarray', 'np.ndarray']:
+    """
+    Dias locais distintos por usuário (dia do join_time no fuso `tz`). Com
+    `min_session_seconds`, só contam dias com alguma sessão dessa duração mínima,
+    a mesma regra de DayBins.count_valid_days.
+    """
+    durations = sessions.durations if durations is None else durations
+    mask = durations >= max(min_session_seconds, 1)
+    if not mask.any():
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    days = local_days(sessions.join_epochs[mask], tz)
+    users, user_index = np.unique(sessions.user_ids[mask], return_inverse=True)
+    span = int(days.max() - days.min()) + 1
+    pairs = np.unique(user_index.astype(np.int64) * span + (days - days.min()))
+    return users, np.bincount(pairs // span, minlength=len(users)).astype(np.int64)
+
+def summarize_by_user(sessions: SessionArrays, start_date: datetime, end_date: datetime,
+                      tz=pytz.utc, min_session_seconds: int = 0) -> Dict[str, 'np.ndarray']:
+    """Segundos na janela, sessões e dias (válidos) por usuário, alinhados pelo array `user_ids`"""
+    durations = clip_durations(sessions, int(start_date.timestamp()), int(end_date.timestamp()))
+    inside = durations > 0
+    users, seconds = per_user_totals(sessions.user_ids[inside], durations[inside])
+    _, counts = per_user_totals(sessions.user_ids[inside], np.ones(int(inside.sum()), dtype=np.int64))
+
+    day_users, day_counts = distinct_days_per_user(sessions, tz, min_session_seconds, durations)
+    days = np.zeros(len(users), dtype=np.int64)
+    days[np.searchsorted(users, day_users)] = day_counts
+    return {'user_ids': users, 'seconds': seconds, 'sessions': counts, 'days': days}
+
+def evaluate_periods(sessions: SessionArrays, users: 'np.ndarray', anchors: 'np.ndarray',
+                     skip_starts: 'np.ndarray', now_epoch: int, period_seconds: int,
+                     min_session_seconds: int, required_days: int, tz) -> Dict[str, 'np.ndarray']:
+    """
+    Reproduz, para vários usuários de uma vez, a avaliação de períodos do
+    BatchProcessor: períodos de `period_seconds` contados a partir da âncora de cada
+    usuário, dias válidos pelo dia local do join_time e a verificação já cumprida
+    (`skip_starts`, epoch do period_start ou -1) pulada como na verificação real.
+
+    `users` deve estar ordenado; os demais arrays seguem a mesma ordem. Retorna, por
+    usuário: 'completed' (períodos concluídos), 'failed' (algum período concluído sem
+    cumprir os requisitos), 'current_days' (dias válidos no período atual) e
+    'current_end' (epoch do fim do período atual).
+    """
+    completed = np.maximum((now_epoch - anchors) // period_seconds, 0)
+    result = {
+        'completed': completed,
+        'failed': np.zeros(len(users), dtype=bool),
+        'current_days': np.zeros(len(users), dtype=np.int64),
+        'current_end': anchors + (completed + 1) * period_seconds
+    }
+
+    # Período já registrado como cumprido: a verificação real não o reavalia
+    offset = skip_starts - anchors
+    skip_period = offset // period_seconds
+    skipped = (skip_starts >= 0) & (offset >= 0) & (offset % period_seconds == 0) & (skip_period < completed)
+
+    if not len(users) or not len(sessions):
+        result['failed'] = completed > skipped
+        return result
+
+    # Sessões dos usuários avaliados que terminam depois da âncora
+    position = np.minimum(np.searchsorted(users, sessions.user_ids), len(users) - 1)
+    known = users[position] == sessions.user_ids
+    owner = position[known]
+    joins = sessions.join_epochs[known]
+    leaves = sessions.leave_epochs[known]
+    keep = leaves > anchors[owner]
+    owner, joins, leaves = owner[keep], joins[keep], leaves[keep]
+    anchor = anchors[owner]
+
+    # Uma peça por (sessão, período tocado); sessões que cruzam a virada do período viram duas ou mais
+    first = np.maximum(joins - anchor, 0) // period_seconds
+    last = (leaves - anchor - 1) // period_seconds
+    spans = last - first + 1
+    piece = np.repeat(np.arange(len(first)), spans)
+    periods = first[piece] + np.arange(len(piece)) - np.repeat(np.cumsum(spans) - spans, spans)
+    period_start = anchor[piece] + periods * period_seconds
+    clipped = np.minimum(leaves[piece], period_start + period_seconds) - np.maximum(joins[piece], period_start)
+
+    valid = (clipped >= max(min_session_seconds, 1)) & (periods <= completed[owner[piece]])
+    piece_owner, periods = owner[piece][valid], periods[valid]
+    days = local_days(joins[piece][valid], tz)
+    if not len(days):
+        result['failed'] = completed > skipped
+        return result
+
+    # Dias distintos por (usuário, período)
+    span = int(completed.max()) + 2
+    day_span = int(days.max() - days.min()) + 1
+    keys = np.unique((piece_owner * span + periods) * day_span + (days - days.min()))
+    groups, group_days = np.unique(keys // day_span, return_counts=True)
+    group_owner, group_period = groups // span, groups % span
+
+    met = group_days >= required_days
+    finished = group_period < completed[group_owner]
+    met_finished = np.bincount(group_owner[met & finished], minlength=len(users))
+
+    # O período pulado que também cumpre pelos dados já está em met_finished
+    skipped &= ~np.isin(np.arange(len(users)) * span + skip_period, groups[met])
+
+    current = group_period == completed[group_owner]
+    result['current_days'][group_owner[current]] = group_days[current]
+    result['failed'] = completed > met_finished + skipped
+    return result
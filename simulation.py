@@ -0,0 +1,113 @@
+# simulation.py
+"""
+Simulação de requisitos de atividade (/simulate_requirements).
+
+Reaplica a avaliação da verificação de inatividade sobre o histórico de
+voice_sessions com valores candidatos de minutos, dias e período, sem nenhuma
+alteração no Discord ou no banco. As âncoras de todos os membros saem de uma
+consulta em lote (Database.load_guild_activity_snapshot sem histórico), as
+sessões da guilda vêm em colunas (session_arrays.load_guild_sessions) e cada
+cenário é avaliado para todos os membros de uma vez por evaluate_periods.
+"""
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import pytz
+
+from lazy_imports import lazy_import
+from session_arrays import SessionArrays, evaluate_periods, load_guild_sessions
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger('inactivity_bot')
+
+def _epoch(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=pytz.UTC)
+    return int(value.timestamp())
+
+def eligible_members(bot, guild) -> List:
+    """Membros que a verificação de inatividade avalia: com cargo monitorado e fora da whitelist"""
+    tracked_role_ids = set(bot.config.get('tracked_roles', []))
+    whitelist = bot.config['whitelist']
+    return [
+        member for member in guild.members
+        if not member.bot
+        and member.id not in whitelist['users']
+        and not any(role.id in whitelist['roles'] for role in member.roles)
+        and any(role.id in tracked_role_ids for role in member.roles)
+    ]
+
+class RequirementsSimulation:
+    """Dados de uma guilda carregados uma vez e avaliados com quantos cenários forem pedidos"""
+
+    def __init__(self, guild_id: int, now: datetime, users: 'np.ndarray', anchors: 'np.ndarray',
+                 skip_starts: 'np.ndarray', sessions: SessionArrays, without_anchor: int, load_seconds: float):
+        self.guild_id = guild_id
+        self.now = now
+        self.users = users
+        self.anchors = anchors
+        self.skip_starts = skip_starts
+        self.sessions = sessions
+        self.without_anchor = without_anchor
+        self.load_seconds = load_seconds
+
+    @classmethod
+    async def load(cls, bot, guild, members: List) -> 'RequirementsSimulation':
+        started = time.perf_counter()
+        now = datetime.now(pytz.utc)
+        tracked_role_ids = bot.config.get('tracked_roles', [])
+        data = await bot.db.load_guild_activity_snapshot(
+            guild.id, [member.id for member in members], tracked_role_ids, include_history=False
+        )
+
+        # Mesma âncora do BatchProcessor: atribuição mais recente de um cargo monitorado atual,
+        # senão o início da última verificação
+        anchored = {}
+        for member in members:
+            assigned = data['role_assignments'].get(member.id, {})
+            times = [assigned[role.id] for role in member.roles if role.id in assigned]
+            last_check = data['last_checks'].get(member.id)
+            if times:
+                anchor = _epoch(max(times))
+            elif last_check:
+                anchor = _epoch(last_check['period_start'])
+            else:
+                continue
+            skip = _epoch(last_check['period_start']) if last_check and last_check['meets_requirements'] else -1
+            anchored[member.id] = (anchor, skip)
+
+        user_ids = sorted(anchored)
+        users = np.array(user_ids, dtype=np.int64)
+        anchors = np.array([anchored[uid][0] for uid in user_ids], dtype=np.int64)
+        skip_starts = np.array([anchored[uid][1] for uid in user_ids], dtype=np.int64)
+
+        if len(users):
+            since = datetime.fromtimestamp(int(anchors.min()), pytz.utc)
+            sessions = await load_guild_sessions(bot.db, guild.id, since, now)
+        else:
+            sessions = SessionArrays.empty()
+
+        return cls(guild.id, now, users, anchors, skip_starts, sessions,
+                   len(members) - len(user_ids), time.perf_counter() - started)
+
+    def run(self, required_minutes: int, required_days: int, monitoring_period: int,
+            first_warning_days: int, tz) -> Dict[str, int]:
+        """Quantos membros cumprem, estão no prazo, receberiam aviso ou perderiam os cargos"""
+        now_epoch = _epoch(self.now)
+        evaluation = evaluate_periods(
+            self.sessions, self.users, self.anchors, self.skip_starts, now_epoch,
+            monitoring_period * 86400, required_minutes * 60, required_days, tz
+        )
+        lose = evaluation['failed']
+        met = ~lose & (evaluation['current_days'] >= required_days)
+        days_remaining = (evaluation['current_end'] - now_epoch) // 86400
+        warn = ~lose & ~met & (days_remaining <= first_warning_days)
+        return {
+            'pass': int(met.sum()),
+            'pending': int((~lose & ~met & ~warn).sum()),
+            'warn': int(warn.sum()),
+            'lose': int(lose.sum())
+        }
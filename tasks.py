@@ -7,13 +7,14 @@ from discord.ext import tasks, commands
 import discord
 from io import BytesIO
 from typing import Optional, Dict, List
-from utils import generate_activity_graph
+from utils import generate_activity_graph, bin_sessions_by_day
+from charts import chart_renderer, graph_cache
+from activity_cache import clip_sessions
 from collections import defaultdict
 import time
 import pytz
 import json
 import os
-import asyncpg  # Necessário para tratar exceções específicas do banco
 
 logger = logging.getLogger('inactivity_bot')
 
@@ -139,62 +140,39 @@ def log_task_metrics(task_name: str):
         return wrapper
     return decorator
 
-class DynamicBatcher:
-    def __init__(self):
-        self.batch_size = 10  # Valor inicial
-        self.min_batch = 5    # Mínimo seguro
-        self.max_batch = 50   # Máximo permitido
-        self.last_rate_limit = None
-
-    async def adjust_batch_size(self):
-        """Ajusta dinamicamente o tamanho do lote."""
-        now = time.time()
-
-        # Se houve rate limit recentemente, reduz o batch
-        if self.last_rate_limit and (now - self.last_rate_limit) < 60:
-            self.batch_size = max(self.min_batch, self.batch_size - 5)
-        else:
-            # Senão, aumenta gradualmente
-            self.batch_size = min(self.max_batch, self.batch_size + 2)
-
-    async def handle_rate_limit(self):
-        """Chamado quando um rate limit é detectado."""
-        self.last_rate_limit = time.time()
-        await self.adjust_batch_size()
-
 class BatchProcessor:
-    def __init__(self, bot):
-        self.bot = bot
-        self.batcher = DynamicBatcher()
-        self.max_concurrent = 5  # Limite de operações concorrentes
+    # Avaliações simultâneas (limitadas pelo pool do banco, max_size=20).
+    # A concorrência das chamadas à API é controlada à parte por bot.mutation_concurrency (AIMD).
+    MAX_CONCURRENT_EVALUATIONS = 10
 
-    async def process_inactivity_batch(self, members: list[discord.Member]):
-        """Processa um lote de membros de uma vez com limite concorrente."""
+    def __init__(self, bot, planner: Optional['WarningDispatchPlanner'] = None,
+                 source: Optional['GuildActivitySnapshot'] = None):
+        self.bot = bot
+        self.planner = planner
+        # Origem das leituras/gravações de verificação: o banco ou um snapshot pré-carregado
+        self.source = source or bot.db
+        # Sessões: do snapshot, se houver; senão do cache em memória, que recorre ao banco quando preciso
+        self.session_source = source or bot.activity_cache or bot.db
+
+    async def process_inactivity_batch(self, members: list[discord.Member],
+                                       cancel_event: Optional[asyncio.Event] = None):
+        """Processa os membros com concorrência limitada; as remoções seguem o limite AIMD da guilda.
+        Membros ainda não iniciados quando `cancel_event` é sinalizado retornam None."""
         if not members:
             return []
             
-        # Usar semáforo para limitar concorrência
-        semaphore = asyncio.Semaphore(self.max_concurrent)
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_EVALUATIONS)
         
         async def process_member(member):
             async with semaphore:
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
                 return await self._process_member_optimized(member)
         
-        # Processar em lotes menores
-        batch_size = min(self.batcher.batch_size, 10)
-        results = []
-        
-        for i in range(0, len(members), batch_size):
-            batch = members[i:i + batch_size]
-            batch_results = await asyncio.gather(
-                *(process_member(member) for member in batch),
-                return_exceptions=True
-            )
-            results.extend(batch_results)
-            # CORREÇÃO APLICADA AQUI
-            await asyncio.sleep(self.bot._api_request_delay)  # Delay entre lotes
-            
-        return results
+        return await asyncio.gather(
+            *(process_member(member) for member in members),
+            return_exceptions=True
+        )
 
     async def _process_member_optimized(self, member):
         """
@@ -222,7 +200,7 @@ class BatchProcessor:
             # 2. Determinar a data âncora (início da contagem)
             # A prioridade é a data de atribuição mais recente de um cargo monitorado
             assigned_times = await asyncio.gather(
-                *[self.bot.db.get_role_assigned_time(member.id, member.guild.id, role.id)
+                *[self.source.get_role_assigned_time(member.id, member.guild.id, role.id)
                     for role in current_member_roles],
                 return_exceptions=True
             )
@@ -233,7 +211,7 @@ class BatchProcessor:
 
             # Se não há data de atribuição, usar a última verificação
             if not anchor_date:
-                last_check = await self.bot.db.get_last_period_check(member.id, member.guild.id)
+                last_check = await self.source.get_last_period_check(member.id, member.guild.id)
                 if last_check:
                     anchor_date = last_check['period_start']
                     if anchor_date.tzinfo is None: anchor_date = anchor_date.replace(tzinfo=pytz.UTC)
@@ -242,7 +220,7 @@ class BatchProcessor:
             if not anchor_date:
                 # Registrar um período inicial para que o membro seja verificado no futuro
                 initial_start = now - period_duration
-                await self.bot.db.log_period_check(member.id, member.guild.id, initial_start, now, False)
+                await self.source.log_period_check(member.id, member.guild.id, initial_start, now, False)
                 logger.info(f"Nenhuma âncora encontrada para {member.display_name}. Definindo período inicial.")
                 return result
             
@@ -252,27 +230,28 @@ class BatchProcessor:
                 period_end = current_period_start + period_duration
 
                 # Verificar se este período já foi avaliado como "cumprido"
-                last_check = await self.bot.db.get_last_period_check(member.id, member.guild.id)
+                last_check = await self.source.get_last_period_check(member.id, member.guild.id)
                 if last_check and last_check['period_start'] == current_period_start and last_check['meets_requirements']:
                     current_period_start += period_duration # Pula para o próximo período
                     continue
 
-                sessions = await self.bot.db.get_voice_sessions(member.id, member.guild.id, current_period_start, period_end)
+                sessions = await self.session_source.get_voice_sessions(member.id, member.guild.id, current_period_start, period_end)
                 required_minutes = self.bot.config['required_minutes']
                 required_days = self.bot.config['required_days']
 
-                valid_days = set()
-                for session in sessions:
-                    if session['duration'] >= required_minutes * 60:
-                        valid_days.add(session['join_time'].date())
+                valid_days = bin_sessions_by_day(sessions, self.bot.timezone).count_valid_days(required_minutes * 60)
                 
-                meets_requirements = len(valid_days) >= required_days
-                await self.bot.db.log_period_check(member.id, member.guild.id, current_period_start, period_end, meets_requirements)
+                meets_requirements = valid_days >= required_days
+                await self.source.log_period_check(member.id, member.guild.id, current_period_start, period_end, meets_requirements)
 
                 if not meets_requirements:
                     try:
                         removed_role_names = [r.name for r in current_member_roles]
-                        await member.remove_roles(*current_member_roles, reason=f"Inatividade no período {current_period_start.date()} a {period_end.date()}")
+                        async with self.bot.mutation_concurrency.slot(member.guild.id) as timing:
+                            await self.bot.api_budget.acquire('roles', cost=len(current_member_roles))
+                            await self.bot.rate_limit_monitor.acquire_role_edit(member, current_member_roles)
+                            timing.start()
+                            await member.remove_roles(*current_member_roles, reason=f"Inatividade no período {current_period_start.date()} a {period_end.date()}")
                         result['removed'] = 1
                         await self.bot.send_warning(member, 'final')
                         await self.bot.db.log_removed_roles(member.id, member.guild.id, [r.id for r in current_member_roles])
@@ -280,7 +259,7 @@ class BatchProcessor:
                         # --- INÍCIO DA MODIFICAÇÃO: Notificações de remoção de cargos ---
                         log_message = (
                             f"Cargos removidos: {', '.join(removed_role_names)}\n"
-                            f"Dias válidos: {len(valid_days)}/{required_days}\n"
+                            f"Dias válidos: {valid_days}/{required_days}\n"
                             f"Período: {current_period_start.strftime('%d/%m/%Y')} a {period_end.strftime('%d/%m/%Y')}"
                         )
                         await self.bot.log_action("Cargo Removido", member, log_message)
@@ -302,7 +281,7 @@ class BatchProcessor:
                         admin_embed.add_field(
                             name="Detalhes da Inatividade", 
                             value=(
-                                f"**Dias Válidos:** {len(valid_days)}/{required_days}\n"
+                                f"**Dias Válidos:** {valid_days}/{required_days}\n"
                                 f"**Período:** {current_period_start.strftime('%d/%m/%Y')} - {period_end.strftime('%d/%m/%Y')}"
                             ), 
                             inline=False
@@ -337,44 +316,43 @@ class BatchProcessor:
                 required_minutes = self.bot.config.get('required_minutes')
                 required_days = self.bot.config.get('required_days')
 
-                sessions_now = await self.bot.db.get_voice_sessions(
+                sessions_now = await self.session_source.get_voice_sessions(
                     member.id, member.guild.id, final_period_start, now
                 )
                 
                 # A lógica aqui deve ser IDÊNTICA à usada para períodos concluídos:
                 # contar dias únicos que tiveram pelo menos UMA sessão com a duração mínima.
-                valid_days_in_current_period = set()
-                if sessions_now:
-                    for session in sessions_now:
-                        if session.get('duration', 0) >= (required_minutes * 60):
-                            join_dt = session.get('join_time')
-                            if join_dt:
-                                valid_days_in_current_period.add(join_dt.date())
+                valid_days_in_current_period = bin_sessions_by_day(
+                    sessions_now or [], self.bot.timezone
+                ).count_valid_days(required_minutes * 60)
 
                 # Se o usuário já cumpre os requisitos no período atual, não envie avisos.
-                if len(valid_days_in_current_period) >= required_days:
+                if valid_days_in_current_period >= required_days:
                     logger.debug(
-                        f"{member.display_name} já cumpre requisitos no período atual ({len(valid_days_in_current_period)}/{required_days} dias) — pulando avisos."
+                        f"{member.display_name} já cumpre requisitos no período atual ({valid_days_in_current_period}/{required_days} dias) — pulando avisos."
                     )
                 else:
                     # Se não cumpre, verifique se é hora de enviar um aviso.
-                    warnings_in_period = await self.bot.db.get_warnings_in_period(
+                    warnings_in_period = await self.source.get_warnings_in_period(
                         member.id, member.guild.id, final_period_start
                     ) or []
 
+                    warning_type = None
                     if days_remaining <= first_warning_days and 'first' not in warnings_in_period:
-                        # --- CORREÇÃO: Passando final_period_end como target_date ---
-                        await self.bot.send_warning(member, 'first', target_date=final_period_end)
-                        
-                        result['warnings']['first'] += 1
-                        logger.info(f"Primeiro aviso enviado para {member.display_name}. Prazo: {final_period_end}")
-                    
+                        warning_type = 'first'
                     elif days_remaining <= second_warning_days and 'second' not in warnings_in_period:
+                        warning_type = 'second'
+
+                    if warning_type:
                         # --- CORREÇÃO: Passando final_period_end como target_date ---
-                        await self.bot.send_warning(member, 'second', target_date=final_period_end)
+                        if self.planner is not None:
+                            # Envio em lote ao final da verificação (ver WarningDispatchPlanner)
+                            self.planner.add(member, warning_type, final_period_end)
+                        else:
+                            await self.bot.send_warning(member, warning_type, target_date=final_period_end)
                         
-                        result['warnings']['second'] += 1
-                        logger.info(f"Segundo aviso enviado para {member.display_name}. Prazo: {final_period_end}")
+                        result['warnings'][warning_type] += 1
+                        logger.info(f"Aviso '{warning_type}' planejado para {member.display_name}. Prazo: {final_period_end}")
             
             except Exception as e:
                 logger.error(f"Erro ao avaliar/decidir avisos para {member.display_name}: {e}", exc_info=True)
@@ -384,6 +362,327 @@ class BatchProcessor:
 
         return result
 
+class GuildActivitySnapshot:
+    """
+    Dados de verificação de um lote de membros carregados de uma vez por
+    Database.load_guild_activity_snapshot. Oferece as mesmas leituras que o
+    BatchProcessor faz no banco (mesmos argumentos e resultados), servidas da
+    memória; as verificações de período gravadas são acumuladas e enviadas ao
+    banco num único comando em flush().
+    """
+
+    def __init__(self, db, guild_id: int, data: Dict):
+        self.db = db
+        self.guild_id = guild_id
+        self.role_assignments = data['role_assignments']
+        self.last_checks = data['last_checks']
+        self.sessions = data['sessions']
+        self.warnings = data['warnings']
+        self._pending_checks = []
+
+    @classmethod
+    async def load(cls, db, guild_id: int, user_ids: List[int], tracked_role_ids: List[int]) -> 'GuildActivitySnapshot':
+        data = await db.load_guild_activity_snapshot(guild_id, user_ids, tracked_role_ids)
+        return cls(db, guild_id, data)
+
+    async def get_role_assigned_time(self, user_id: int, guild_id: int, role_id: int) -> Optional[datetime]:
+        return self.role_assignments.get(user_id, {}).get(role_id)
+
+    async def get_last_period_check(self, user_id: int, guild_id: int) -> Optional[Dict]:
+        last_check = self.last_checks.get(user_id)
+        return dict(last_check) if last_check else None
+
+    async def get_voice_sessions(self, user_id: int, guild_id: int,
+                                 start_date: datetime, end_date: datetime) -> List[Dict]:
+        return clip_sessions(self.sessions.get(user_id, []), start_date, end_date)
+
+    async def get_warnings_in_period(self, user_id: int, guild_id: int, period_start: datetime) -> List[str]:
+        return list({warning_type for warning_type, warning_date in self.warnings.get(user_id, [])
+                     if warning_date >= period_start})
+
+    async def log_period_check(self, user_id: int, guild_id: int, start_date: datetime,
+                               end_date: datetime, meets_requirements: bool):
+        self._pending_checks.append((user_id, guild_id, start_date, end_date, meets_requirements))
+        last_check = self.last_checks.get(user_id)
+        if last_check is None or start_date >= last_check['period_start']:
+            self.last_checks[user_id] = {
+                'period_start': start_date,
+                'period_end': end_date,
+                'meets_requirements': meets_requirements
+            }
+
+    async def flush(self):
+        records, self._pending_checks = self._pending_checks, []
+        await self.db.log_period_checks_bulk(records)
+
+class BulkForceCheck:
+    """
+    Verificação forçada de muitos membros (/force_check_bulk).
+
+    Os membros são avaliados em lotes: cada lote é pré-carregado com
+    GuildActivitySnapshot e passa pelo mesmo BatchProcessor da verificação
+    periódica, então as remoções de cargos seguem o pipeline cadenciado de sempre
+    (mutation_concurrency, api_budget e rate_limit_monitor) e os avisos saem pelo
+    WarningDispatchPlanner. O progresso é gravado em bulk_check_runs após cada lote,
+    o que permite cancelar e retomar a execução depois.
+    """
+    CHUNK_SIZE = 250
+    PROGRESS_INTERVAL = 3.0
+
+    def __init__(self, bot, guild: discord.Guild, run_id: int, member_ids: List[int], position: int = 0,
+                 counters: Optional[Dict[str, int]] = None):
+        self.bot = bot
+        self.guild = guild
+        self.run_id = run_id
+        self.member_ids = member_ids
+        self.position = position
+        self.counters = counters or {'processed': 0, 'removed': 0, 'warnings': 0}
+        self.cancel_event = asyncio.Event()
+        self.status = 'running'
+        self.started = time.monotonic()
+
+    @property
+    def total(self) -> int:
+        return len(self.member_ids)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    async def run(self, on_progress=None) -> str:
+        """Executa a partir de `position`; retorna o status final ('completed', 'cancelled' ou 'failed')"""
+        tracked_role_ids = self.bot.config['tracked_roles']
+        planner = WarningDispatchPlanner(self.bot)
+        last_progress = 0.0
+
+        try:
+            while self.position < self.total and not self.cancel_event.is_set():
+                chunk_ids = self.member_ids[self.position:self.position + self.CHUNK_SIZE]
+                members = [m for m in (self.guild.get_member(uid) for uid in chunk_ids) if m is not None]
+
+                start_time = time.time()
+                snapshot = await GuildActivitySnapshot.load(
+                    self.bot.db, self.guild.id, [m.id for m in members], tracked_role_ids
+                )
+                perf_metrics.record_db_query(time.time() - start_time)
+
+                processor = BatchProcessor(self.bot, planner=planner, source=snapshot)
+                results = await processor.process_inactivity_batch(members, cancel_event=self.cancel_event)
+                await snapshot.flush()
+
+                # Avança até o primeiro membro não iniciado (reavaliar um membro é idempotente)
+                done = len(chunk_ids)
+                for member, res in zip(members, results):
+                    if res is None:
+                        done = chunk_ids.index(member.id)
+                        break
+                    if isinstance(res, dict):
+                        self.counters['processed'] += res.get('processed', 0)
+                        self.counters['removed'] += res.get('removed', 0)
+                        self.counters['warnings'] += sum(res.get('warnings', {}).values())
+                self.position += done
+                await self.bot.db.update_bulk_check_run(
+                    self.run_id, self.position, self.counters['processed'],
+                    self.counters['removed'], self.counters['warnings'], 'running'
+                )
+
+                if on_progress and time.monotonic() - last_progress >= self.PROGRESS_INTERVAL:
+                    last_progress = time.monotonic()
+                    await on_progress(self)
+
+            self.status = 'cancelled' if self.position < self.total else 'completed'
+        except Exception as e:
+            logger.error(f"Erro na verificação em massa {self.run_id} da guilda {self.guild.id}: {e}", exc_info=True)
+            self.status = 'failed'
+        finally:
+            # Uma falha fica gravada como 'running' para que a execução possa ser retomada
+            await self.bot.db.update_bulk_check_run(
+                self.run_id, self.position, self.counters['processed'], self.counters['removed'],
+                self.counters['warnings'], 'running' if self.status == 'failed' else self.status
+            )
+            dispatch_summary = await planner.dispatch()
+            if dispatch_summary['planned']:
+                self.bot.loop.create_task(
+                    report_warning_delivery(planner, dispatch_summary['eta_seconds']),
+                    name=f'bulk_check_delivery_report_{self.run_id}'
+                )
+
+        logger.info(
+            f"Verificação em massa {self.run_id} ({self.guild.name}): {self.status} em "
+            f"{time.monotonic() - self.started:.1f}s — {self.position}/{self.total} membros, "
+            f"{self.counters['removed']} remoções, {self.counters['warnings']} avisos"
+        )
+        return self.status
+
+class WarningDispatchPlanner:
+    """
+    Junta os avisos 'first'/'second' de uma verificação e despacha tudo de uma vez:
+    renderiza com o template pré-compilado da guilda, grava os user_warnings em um
+    único comando, enfileira as DMs com ETA calculado pelo ritmo da fila e envia
+    um resumo por guilda (log e DM para administradores) em vez de um por membro.
+    """
+    MAX_MEMBERS_PER_DIGEST_FIELD = 20
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.plans = []
+        self.planned = 0
+        self.delivered = 0
+        self.failed = 0
+        self._all_done = asyncio.Event()
+
+    def add(self, member: discord.Member, warning_type: str, target_date: datetime):
+        self.plans.append({
+            'member': member,
+            'warning_type': warning_type,
+            'target_date': target_date
+        })
+
+    def _on_delivery(self, delivered: bool):
+        if delivered:
+            self.delivered += 1
+        else:
+            self.failed += 1
+        if self.delivered + self.failed >= self.planned:
+            self._all_done.set()
+
+    def _render(self, now: datetime) -> list:
+        rendered = []
+        for plan in self.plans:
+            member = plan['member']
+            try:
+                template = self.bot.get_warning_template(member.guild, plan['warning_type'])
+                warning = self.bot.build_warning(member, plan['warning_type'], plan['target_date'], now, template=template)
+                if warning:
+                    rendered.append({**plan, **warning})
+            except Exception as e:
+                logger.error(f"Erro ao montar aviso para {member}: {e}")
+        return rendered
+
+    async def dispatch(self) -> dict:
+        """Grava e enfileira todos os avisos planejados. Retorna o resumo do planejamento."""
+        summary = {'planned': 0, 'first': 0, 'second': 0, 'eta_seconds': 0.0}
+        if not self.plans:
+            return summary
+
+        now = datetime.now(pytz.UTC)
+        rendered = self._render(now)
+        if not rendered:
+            return summary
+
+        # 1. Um único comando para todos os registros de aviso
+        try:
+            await self.bot.db.log_warnings_bulk(
+                [(w['member'].id, w['member'].guild.id, w['warning_type']) for w in rendered],
+                warning_date=now
+            )
+        except Exception as e:
+            logger.error(f"Erro ao registrar avisos em lote, usando registro individual: {e}")
+            for w in rendered:
+                try:
+                    await self.bot.db.log_warning(w['member'].id, w['member'].guild.id, w['warning_type'])
+                except Exception as inner:
+                    logger.error(f"Erro ao registrar aviso no DB para {w['member']}: {inner}")
+
+        # 2. Enfileirar DMs com ETA pelo ritmo da fila de mensagens
+        queue = self.bot.message_queue
+        # Reservado antes de enfileirar para que entregas rápidas não encerrem a espera cedo demais
+        self.planned = len(rendered)
+        by_priority = defaultdict(int)
+        queued = []
+        for w in rendered:
+            priority = self.bot.dm_priority(w['embed'])
+            w['eta'] = now + timedelta(seconds=queue.estimate_drain_seconds(priority, extra=1))
+            enqueued = await self.bot.send_dm(
+                w['member'], w['message'], w['embed'],
+                dedupe_key=w['dedupe_key'], on_done=self._on_delivery
+            )
+            if not enqueued:
+                # Duplicado de um aviso ainda pendente na fila (ou erro): não haverá callback de entrega
+                self.planned -= 1
+                logger.debug(f"Aviso '{w['warning_type']}' para {w['member'].display_name} não enfileirado")
+                continue
+            by_priority[priority] += 1
+            logger.debug(f"Aviso '{w['warning_type']}' para {w['member'].display_name} com ETA {w['eta'].isoformat()}")
+            summary[w['warning_type']] += 1
+            queued.append(w)
+
+        if self.delivered + self.failed >= self.planned:
+            self._all_done.set()
+        summary['planned'] = self.planned
+        if not queued:
+            return summary
+        summary['eta_seconds'] = max((w['eta'] - now).total_seconds() for w in queued)
+
+        # 3. Resumo por guilda no lugar de um log e uma DM de admin por membro
+        by_guild = defaultdict(list)
+        for w in queued:
+            by_guild[w['member'].guild].append(w)
+        for guild, warnings in by_guild.items():
+            await self._send_guild_digest(guild, warnings, now, summary['eta_seconds'])
+
+        logger.info(
+            f"Avisos planejados: {self.planned} (primeiro={summary['first']}, segundo={summary['second']}), "
+            f"por prioridade {dict(by_priority)}, entrega estimada em {summary['eta_seconds']:.0f}s"
+        )
+        return summary
+
+    async def _send_guild_digest(self, guild: discord.Guild, warnings: list, now: datetime, eta_seconds: float):
+        for warning_type in ('first', 'second'):
+            typed = [w for w in warnings if w['warning_type'] == warning_type]
+            if not typed:
+                continue
+
+            lines = [f"{w['member'].mention} — {w['roles_list']} — prazo {w['time_full']}" for w in typed]
+            embed = discord.Embed(
+                title=f"🔔 Relatório de Avisos: {warning_type.capitalize()}",
+                description=f"{len(typed)} aviso(s) de inatividade enfileirado(s). Entrega estimada em até {format_eta(eta_seconds)}.",
+                color=discord.Color.blue(),
+                timestamp=now
+            )
+            for i in range(0, min(len(lines), self.MAX_MEMBERS_PER_DIGEST_FIELD * 5), self.MAX_MEMBERS_PER_DIGEST_FIELD):
+                chunk = "\n".join(lines[i:i + self.MAX_MEMBERS_PER_DIGEST_FIELD])
+                if len(chunk) > 1024:
+                    chunk = chunk[:1021] + "..."
+                embed.add_field(name=f"Membros ({i + 1}-{min(i + self.MAX_MEMBERS_PER_DIGEST_FIELD, len(lines))})", value=chunk, inline=False)
+            if len(lines) > self.MAX_MEMBERS_PER_DIGEST_FIELD * 5:
+                embed.add_field(name="...", value=f"e mais {len(lines) - self.MAX_MEMBERS_PER_DIGEST_FIELD * 5} membro(s)", inline=False)
+            embed.set_footer(text=f"Servidor: {guild.name}")
+
+            await self.bot.log_action(None, None, embed=embed)
+            await self.bot.notify_admins_dm(guild, embed=embed)
+
+    async def wait_delivery(self, timeout: float) -> dict:
+        """Aguarda as entregas até o timeout e retorna planejados x entregues"""
+        if self.planned and not self._all_done.is_set():
+            try:
+                await asyncio.wait_for(self._all_done.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return {
+            'planned': self.planned,
+            'delivered': self.delivered,
+            'failed': self.failed,
+            'pending': max(0, self.planned - self.delivered - self.failed)
+        }
+
+def format_eta(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}min"
+    return f"{seconds / 3600:.1f}h"
+
+async def report_warning_delivery(planner: WarningDispatchPlanner, eta_seconds: float):
+    """Registra no log quantos avisos planejados foram de fato entregues"""
+    # Margem para retentativas e para o restante da fila
+    delivery = await planner.wait_delivery(timeout=eta_seconds * 1.5 + 300)
+    await bot.log_action(
+        "Entrega de Avisos",
+        None,
+        f"Planejados: {delivery['planned']} | Entregues: {delivery['delivered']} | "
+        f"Falhas: {delivery['failed']} | Pendentes: {delivery['pending']}"
+    )
+
 def prioritize_members(members: list[discord.Member]) -> list[discord.Member]:
     """Ordena membros para processar os mais prováveis de estarem inativos primeiro."""
     return sorted(
@@ -408,96 +707,29 @@ async def voice_event_processor():
             logger.error(f"Erro no processador de eventos de voz: {e}")
             await asyncio.sleep(1)
 
-async def execute_task_with_persistent_interval(task_name: str, monitoring_period: int, task_func: callable, force_check: bool = False):
-    """Executa a task mantendo intervalo persistente de 24h, de forma mais robusta."""
-    await bot.wait_until_ready()
-    
-    # Loop de espera inicial mais robusto
-    while not hasattr(bot, 'db') or not bot.db or not bot.db._is_initialized:
-        # Aumentado para 60s para reduzir spam no log quando o DB está offline
-        await asyncio.sleep(60)
-        logger.info(f"Task {task_name} aguardando inicialização do banco de dados...")
-    
-    while True:
-        try:
-            # Verificação de segurança da conexão
-            if not bot.db.pool or bot.db.pool.is_closing():
-                logger.warning(f"Task {task_name} pausada: pool de conexões indisponível.")
-                await asyncio.sleep(60) # Espera 1 minuto antes de checar de novo
-                continue
+DAILY = timedelta(hours=24)
 
-            # Verificação de segurança da conexão antes de tentar queries
-            if not bot.db.pool or bot.db.pool.is_closing():
-                logger.warning(f"Task {task_name} pausada: aguardando recuperação do pool de conexões.")
-                await asyncio.sleep(30)
-                continue
+def schedule_persistent_task(task_name: str, monitoring_period, task_func: callable, interval: timedelta = DAILY):
+    """
+    Registra a task no agendador persistente (bot.scheduler). `monitoring_period` é o
+    valor gravado em task_executions: um número ou uma função que o retorna na execução.
+    """
+    async def run():
+        start_time = time.time()
+        await task_func()
+        perf_metrics.record_task_execution(task_name, time.time() - start_time)
 
-            # Verificar última execução
-            last_exec = None
-            try:
-                if hasattr(bot.db, 'get_last_task_execution'):
-                    last_exec = await bot.db.get_last_task_execution(task_name)
-            except Exception as e:
-                logger.warning(f"Erro ao obter última execução para {task_name}: {e}")
-                # Se falhar ao ler o estado, espera um pouco e tenta de novo em vez de executar
-                await asyncio.sleep(60)
-                continue
-            
-            now = datetime.now(pytz.UTC)
-            should_execute = False
-
-            if force_check:
-                should_execute = True
-                logger.info(f"Execução forçada para a task {task_name}")
-            elif not last_exec:  # Primeira execução
-                should_execute = True
-                logger.info(f"Primeira execução da task {task_name}")
-            else:
-                # Garantir que last_exec_time está com timezone (aware)
-                last_exec_time = last_exec['last_execution']
-                if last_exec_time.tzinfo is None:
-                    last_exec_time = last_exec_time.replace(tzinfo=pytz.UTC)
-                
-                # *** INÍCIO DA LÓGICA CORRIGIDA ***
-                next_scheduled_run = last_exec_time + timedelta(hours=24)
-                
-                if now >= next_scheduled_run:
-                    should_execute = True
-                    logger.info(f"Próxima execução agendada ({next_scheduled_run.strftime('%Y-%m-%d %H:%M')}) foi atingida. Executando task {task_name}")
-                else:
-                    # Log reduzido para DEBUG para não poluir
-                    remaining_time = next_scheduled_run - now
-                    logger.debug(f"Task '{task_name}' aguardando. Próxima: {next_scheduled_run}")
-                # *** FIM DA LÓGICA CORRIGIDA ***
+    bot.scheduler.register(task_name, run, interval, monitoring_period)
 
-            if should_execute:
-                logger.info(f"Executando task {task_name}...")
-                start_time = time.time()
-                await task_func()
-                perf_metrics.record_task_execution(task_name, time.time() - start_time)
+async def run_task_scheduler():
+    """Corrotina única que dispara as tasks periódicas registradas"""
+    await bot.wait_until_ready()
 
-                # Registrar a execução com o tempo atual
-                if hasattr(bot.db, 'log_task_execution'):
-                    try:
-                        period_to_log = monitoring_period
-                        if task_name in ['inactivity_check', 'cleanup_members']:
-                            period_to_log = bot.config.get('monitoring_period', monitoring_period)
-                        
-                        await bot.db.log_task_execution(task_name, period_to_log)
-                    except AttributeError:
-                        logger.warning(f"Método log_task_execution não disponível no banco de dados")
-                
-                logger.info(f"Task {task_name} concluída com sucesso")
-            
-            # Esperar 1h antes de verificar novamente (evita loops muito rápidos)
-            await asyncio.sleep(3600)
-                
-        except (ConnectionError, asyncpg.PostgresError) as db_err:
-            logger.error(f"Erro de Banco de Dados na task {task_name}: {db_err}.")
-            await asyncio.sleep(300) # Espera 5 minutos em caso de erro de DB
-        except Exception as e:
-            logger.error(f"Erro genérico na task {task_name}: {e}", exc_info=True)
-            await asyncio.sleep(3600)  # Esperar 1h antes de tentar novamente
+    while not hasattr(bot, 'db') or not bot.db or not bot.db._is_initialized:
+        await asyncio.sleep(60)
+        logger.info("Agendador de tasks aguardando inicialização do banco de dados...")
+
+    await bot.scheduler.run(bot.db)
 
 async def execute_task_with_retry(task_name: str, task_func: callable, max_retries: int = 3):
     """Executa uma task com tentativas de recuperação."""
@@ -523,7 +755,11 @@ async def on_shutdown():
     """Executa ações de limpeza antes do desligamento do bot."""
     logger.info("Bot está sendo desligado - executando limpeza...")
     await bot.log_action("Desligamento", None, "Bot está sendo desligado")
-    await save_task_states()
+    await bot.outbox.flush()
+    await bot.message_tracker.flush()
+    await bot.rate_limit_telemetry.flush()
+    await bot.voice_occupancy.flush()
+    chart_renderer.shutdown()
     await emergency_backup()
 
 @bot.event
@@ -535,10 +771,10 @@ async def on_resumed():
     await check_current_voice_members()
     await detect_missing_voice_leaves()  # Limpar sessões fantasma
     
-    # Limpar filas e reinicializar contadores
+    # Limpar filas de eventos e reinicializar contadores (mensagens pendentes são mantidas)
     await bot.clear_queues()
     
-    await bot.log_action("Reconexão", None, "Bot reconectado após queda - Filas reinicializadas")
+    await bot.log_action("Reconexão", None, "Bot reconectado após queda - Filas de eventos reinicializadas")
     await process_pending_voice_events()
 
 @bot.event
@@ -562,38 +798,6 @@ async def on_disconnect():
 
     await emergency_backup()
 
-async def save_task_states():
-    """Salva o estado atual das tasks no banco de dados."""
-    try:
-        # Verificar se o banco de dados está disponível
-        if not hasattr(bot, 'db') or not bot.db or not bot.db._is_initialized:
-            logger.error("Banco de dados não inicializado - pulando salvamento de estados")
-            return
-
-        for task_name in ['inactivity_check', 'cleanup_members']:
-            last_exec = await bot.db.get_last_task_execution(task_name)
-            if last_exec:
-                await bot.db.log_task_execution(task_name, last_exec['monitoring_period'])
-        logger.info("Estados das tasks salvos com sucesso.")
-    except Exception as e:
-        logger.error(f"Erro ao salvar estados das tasks: {e}")
-
-async def load_task_states():
-    """Carrega o estado das tasks do banco de dados."""
-    try:
-        # Verificar se o banco de dados está disponível
-        if not hasattr(bot, 'db') or not bot.db or not bot.db._is_initialized:
-            logger.error("Banco de dados não inicializado - pulando carregamento de estados")
-            return
-
-        for task_name in ['inactivity_check', 'cleanup_members']:
-            last_exec = await bot.db.get_last_task_execution(task_name)
-            if last_exec:
-                await bot.db.log_task_execution(task_name, last_exec['monitoring_period'])
-        logger.info("Estados das tasks carregados com sucesso.")
-    except Exception as e:
-        logger.error(f"Erro ao carregar estados das tasks: {e}")
-
 def serialize_sessions(sessions):
     """Converte o dicionário de sessões ativas para um formato serializável."""
     serializable_sessions = {}
@@ -656,12 +860,8 @@ async def emergency_backup():
         return False
 
 async def health_check():
-    """Wrapper para a task com intervalo persistente"""
-    await execute_task_with_persistent_interval(
-        "health_check",
-        1,  # Verifica a cada hora
-        _health_check
-    )
+    """Agenda a verificação de saúde no agendador persistente"""
+    schedule_persistent_task("health_check", 1, _health_check)
 
 async def _health_check():
     """Verifica a saúde do bot e reinicia tasks se necessário."""
@@ -695,43 +895,44 @@ async def _health_check():
         active_tasks = {t.get_name() for t in asyncio.all_tasks() if t.get_name()}
         
         expected_tasks = {
-            'inactivity_check_wrapper',
-            'cleanup_members_wrapper',
-            'database_backup_wrapper',
-            'cleanup_old_data_wrapper',
-            'monitor_rate_limits_wrapper',
-            'report_metrics_wrapper',
-            'health_check_wrapper',
+            'task_scheduler',
             'queue_processor',
+            'log_webhook_sink',
+            'outbox_flush',
+            'bot_message_tracker',
+            'rate_limit_telemetry',
+            'voice_occupancy_sampler',
+            'leaderboard_maintenance',
+            'activity_cache_verifier',
             'db_pool_monitor',
             'periodic_health_check',
             'audio_state_checker',
             'process_pending_voice_events',
             'check_current_voice_members',
-            'detect_missing_voice_leaves',
-            'cleanup_ghost_sessions_wrapper',
-            'register_role_assignments_wrapper'
+            'detect_missing_voice_leaves'
         }
 
         for task_name in expected_tasks:
             if task_name not in active_tasks:
                 logger.warning(f"Task {task_name} não está ativa - reiniciando...")
-                if task_name == 'inactivity_check_wrapper':
-                    asyncio.create_task(inactivity_check(), name='inactivity_check_wrapper')
-                elif task_name == 'cleanup_members_wrapper':
-                    asyncio.create_task(cleanup_members(), name='cleanup_members_wrapper')
-                elif task_name == 'database_backup_wrapper':
-                    asyncio.create_task(database_backup(), name='database_backup_wrapper')
-                elif task_name == 'cleanup_old_data_wrapper':
-                    asyncio.create_task(cleanup_old_data(), name='cleanup_old_data_wrapper')
-                elif task_name == 'monitor_rate_limits_wrapper':
-                    asyncio.create_task(monitor_rate_limits(), name='monitor_rate_limits_wrapper')
-                elif task_name == 'report_metrics_wrapper':
-                    asyncio.create_task(report_metrics(), name='report_metrics_wrapper')
-                elif task_name == 'health_check_wrapper':
-                    asyncio.create_task(health_check(), name='health_check_wrapper')
+                if task_name == 'task_scheduler':
+                    asyncio.create_task(run_task_scheduler(), name='task_scheduler')
                 elif task_name == 'queue_processor':
                     asyncio.create_task(bot.process_queues(), name='queue_processor')
+                elif task_name == 'log_webhook_sink':
+                    asyncio.create_task(bot.log_sink.run(), name='log_webhook_sink')
+                elif task_name == 'outbox_flush':
+                    asyncio.create_task(bot.outbox.run(), name='outbox_flush')
+                elif task_name == 'bot_message_tracker':
+                    asyncio.create_task(bot.message_tracker.run(), name='bot_message_tracker')
+                elif task_name == 'rate_limit_telemetry':
+                    asyncio.create_task(bot.rate_limit_telemetry.run(), name='rate_limit_telemetry')
+                elif task_name == 'voice_occupancy_sampler':
+                    asyncio.create_task(bot.voice_occupancy.run(), name='voice_occupancy_sampler')
+                elif task_name == 'leaderboard_maintenance':
+                    asyncio.create_task(leaderboard_maintenance(), name='leaderboard_maintenance')
+                elif task_name == 'activity_cache_verifier':
+                    asyncio.create_task(activity_cache_verifier(), name='activity_cache_verifier')
                 elif task_name == 'db_pool_monitor':
                     asyncio.create_task(bot.monitor_db_pool(), name='db_pool_monitor')
                 elif task_name == 'periodic_health_check':
@@ -744,10 +945,6 @@ async def _health_check():
                     asyncio.create_task(check_current_voice_members(), name='check_current_voice_members')
                 elif task_name == 'detect_missing_voice_leaves':
                     asyncio.create_task(detect_missing_voice_leaves(), name='detect_missing_voice_leaves')
-                elif task_name == 'cleanup_ghost_sessions_wrapper':
-                    asyncio.create_task(cleanup_ghost_sessions(), name='cleanup_ghost_sessions_wrapper')
-                elif task_name == 'register_role_assignments_wrapper':
-                    asyncio.create_task(register_role_assignments(), name='register_role_assignments_wrapper')
 
         await bot.log_action("Verificação de Saúde", None, f"Tasks ativas: {', '.join(t for t in active_tasks if t)}")
     except Exception as e:
@@ -794,10 +991,19 @@ async def _inactivity_check():
 
             # Priorizar membros para processamento
             prioritized_members = prioritize_members(members_to_check)
-            processor = BatchProcessor(bot)
+            planner = WarningDispatchPlanner(bot)
+            processor = BatchProcessor(bot, planner=planner)
             
             # Processar em lotes otimizados
             results = await processor.process_inactivity_batch(prioritized_members)
+
+            # Despachar os avisos coletados de uma vez
+            dispatch_summary = await planner.dispatch()
+            if dispatch_summary['planned']:
+                bot.loop.create_task(
+                    report_warning_delivery(planner, dispatch_summary['eta_seconds']),
+                    name=f'warning_delivery_report_{guild.id}'
+                )
             
             # Atualizar contadores
             for res in results:
@@ -811,20 +1017,11 @@ async def _inactivity_check():
             logger.error(f"Erro ao verificar inatividade na guild {guild.name}: {e}")
             continue
     
-    logger.info(f"Verificação de inatividade concluída. Membros processados: {processed_members}, Cargos removidos: {members_with_roles_removed}, Avisos enviados: Primeiro={warnings_sent['first']}, Segundo={warnings_sent['second']}")
+    logger.info(f"Verificação de inatividade concluída. Membros processados: {processed_members}, Cargos removidos: {members_with_roles_removed}, Avisos planejados: Primeiro={warnings_sent['first']}, Segundo={warnings_sent['second']}")
 
 async def inactivity_check():
-    """Wrapper para a task com intervalo de 24h"""
-    monitoring_period = bot.config['monitoring_period']
-    task = bot.loop.create_task(
-        execute_task_with_persistent_interval(
-            "inactivity_check", 
-            monitoring_period,
-            _inactivity_check
-        ), 
-        name='inactivity_check_wrapper'
-    )
-    return task
+    """Agenda a verificação de inatividade (a cada 24h) no agendador persistente"""
+    schedule_persistent_task("inactivity_check", lambda: bot.config['monitoring_period'], _inactivity_check)
 
 @log_task_metrics("cleanup_members")
 async def _cleanup_members(force_check: bool = False):
@@ -858,22 +1055,16 @@ async def _cleanup_members(force_check: bool = False):
             ])
             
             members_kicked += sum(results)  # Soma os resultados booleanos (True = 1, False = 0)
-            
-            # CORREÇÃO APLICADA AQUI
-            await asyncio.sleep(bot._api_request_delay)
+            # A expulsão pede cota ao bot.api_budget; membros sem ação não precisam de pausa
     
     logger.info(f"Limpeza de membros concluída. Membros expulsos: {members_kicked}")
 
 async def cleanup_members(force_check: bool = False):
-    """Wrapper para a task com intervalo persistente"""
-    monitoring_period = bot.config['monitoring_period']
-    task = bot.loop.create_task(execute_task_with_persistent_interval(
-        "cleanup_members", 
-        monitoring_period,
-        _cleanup_members,
-        force_check=force_check
-    ), name='cleanup_members_wrapper')
-    return task
+    """Agenda a limpeza de membros no agendador persistente; `force_check` também executa agora"""
+    schedule_persistent_task("cleanup_members", lambda: bot.config['monitoring_period'], _cleanup_members)
+    if force_check:
+        logger.info("Execução forçada para a task cleanup_members")
+        return bot.loop.create_task(_cleanup_members(force_check=True), name='cleanup_members_forced')
 
 async def process_member_cleanup(member: discord.Member, guild: discord.Guild, kick_after_days: int) -> bool:
     """
@@ -946,7 +1137,11 @@ async def process_member_cleanup(member: discord.Member, guild: discord.Guild, k
                     await bot.notify_admins_dm(guild, embed=admin_embed)
                     
                     # 2. Expulsar o membro
-                    await member.kick(reason=f"Sem cargos por mais de {kick_after_days} dias.")
+                    async with bot.mutation_concurrency.slot(guild.id) as timing:
+                        await bot.api_budget.acquire('roles')
+                        await bot.rate_limit_monitor.acquire_kick(member)
+                        timing.start()
+                        await member.kick(reason=f"Sem cargos por mais de {kick_after_days} dias.")
                     
                     # 3. Registrar a expulsão no banco de dados
                     await bot.db.log_kicked_member(member.id, guild.id, f"Sem cargos por mais de {kick_after_days} dias")
@@ -1027,14 +1222,8 @@ async def _database_backup():
         await bot.log_action("Erro no Backup", None, f"Falha ao criar backup: {str(e)}")
 
 async def database_backup():
-    """Wrapper para a task com intervalo persistente"""
-    monitoring_period = 1  # Backup should run daily regardless of monitoring period
-    task = bot.loop.create_task(execute_task_with_persistent_interval(
-        "database_backup", 
-        monitoring_period,
-        _database_backup
-    ), name='database_backup_wrapper')
-    return task
+    """Agenda o backup diário no agendador persistente"""
+    schedule_persistent_task("database_backup", 1, _database_backup)
 
 @log_task_metrics("cleanup_old_data")
 async def _cleanup_old_data():
@@ -1101,14 +1290,8 @@ async def _cleanup_old_data():
         )
 
 async def cleanup_old_data():
-    """Wrapper para a task com intervalo persistente"""
-    monitoring_period = 7  # Limpeza de dados deve rodar semanalmente
-    task = bot.loop.create_task(execute_task_with_persistent_interval(
-        "cleanup_old_data",
-        monitoring_period,
-        _cleanup_old_data
-    ), name='cleanup_old_data_wrapper')
-    return task
+    """Agenda a limpeza de dados antigos no agendador persistente"""
+    schedule_persistent_task("cleanup_old_data", 7, _cleanup_old_data)
 
 @log_task_metrics("monitor_rate_limits")
 async def _monitor_rate_limits():
@@ -1116,14 +1299,27 @@ async def _monitor_rate_limits():
     await bot.wait_until_ready()
     
     try:
-        # Verificar uso atual
-        global_bucket = bot.rate_limit_buckets['global']
-        global_usage = 1 - (global_bucket['remaining'] / global_bucket['limit'])
+        # Verificar uso atual com os dados reais dos headers (ver RateLimitMonitor)
+        status = bot.rate_limit_monitor.get_status_report()
+        global_status = status['global']
+        global_usage = 1 - (global_status['remaining'] / global_status['limit'])
+
+        # Uso do bucket mais pressionado entre os que ainda não resetaram
+        busiest_route, busiest_usage = None, 0.0
+        for route, data in status['buckets'].items():
+            if data['seconds_until_reset'] <= 0 or not data['limit']:
+                continue
+            usage = 1 - (data['remaining'] / data['limit'])
+            if usage > busiest_usage:
+                busiest_route, busiest_usage = route, usage
+
+        rate_limited = status['rate_limited_count'] - getattr(bot, '_last_rate_limited_count', 0)
+        bot._last_rate_limited_count = status['rate_limited_count']
         
         # Ajustar dinamicamente o tamanho dos lotes
         previous_batch_size = bot._batch_processing_size
         
-        if global_usage > 0.8:  # Se estiver usando mais de 80% do rate limit
+        if rate_limited > 0 or global_usage > 0.8:  # 429 desde a última execução ou mais de 80% do limite global
             bot._batch_processing_size = max(5, bot._batch_processing_size - 2)
         elif global_usage < 0.3:  # Se estiver usando menos de 30%
             bot._batch_processing_size = min(20, bot._batch_processing_size + 2)
@@ -1140,15 +1336,23 @@ async def _monitor_rate_limits():
                 f"Tamanho do lote alterado de {previous_batch_size} para {bot._batch_processing_size}\n"
             )
         
-        # Verificar se está próximo do limite global
-        if global_usage > 0.7:
+        if rate_limited > 0:
+            should_notify = True
+            notification_message += f"🚫 **Respostas 429 desde a última verificação:** {rate_limited}\n"
+
+        # Verificar se está próximo do limite global ou de algum bucket
+        if global_usage > 0.7 or busiest_usage > 0.9:
             should_notify = True
             notification_message += (
                 f"⚠️ **Alerta de Uso Elevado**\n"
-                f"Uso global: {global_usage*100:.1f}%\n"
-                f"Remaining: {global_bucket['remaining']}/{global_bucket['limit']}\n"
-                f"Reset em: {max(0, global_bucket['reset_at'] - time.time()):.0f}s\n"
+                f"Uso global: {global_usage*100:.1f}% ({global_status['requests_last_second']} req/s)\n"
             )
+            if busiest_route:
+                busiest = status['buckets'][busiest_route]
+                notification_message += (
+                    f"Bucket mais usado: `{busiest_route}` "
+                    f"({busiest['remaining']}/{busiest['limit']}, reset em {busiest['seconds_until_reset']:.0f}s)\n"
+                )
         
         # Enviar notificação se necessário
         if should_notify:
@@ -1164,14 +1368,8 @@ async def _monitor_rate_limits():
         logger.error(f"Erro no monitoramento de rate limits: {e}")
 
 async def monitor_rate_limits():
-    """Wrapper para a task com intervalo persistente"""
-    monitoring_period = 1  # Rate limit monitoring should run frequently regardless of monitoring period
-    task = bot.loop.create_task(execute_task_with_persistent_interval(
-        "monitor_rate_limits", 
-        monitoring_period,
-        _monitor_rate_limits
-    ), name='monitor_rate_limits_wrapper')
-    return task
+    """Agenda o monitoramento de rate limits no agendador persistente"""
+    schedule_persistent_task("monitor_rate_limits", 1, _monitor_rate_limits)
 
 @log_task_metrics("report_metrics")
 async def _report_metrics():
@@ -1197,10 +1395,94 @@ async def _report_metrics():
                 f"- Últimas 10 execuções: {metrics['last_10_avg']:.2f}s\n"
             )
         
+        sink_stats = bot.log_sink.get_stats()
+        metrics_report.append(
+            f"**log_webhook_sink** ({'ativo' if bot.log_sink.enabled else 'desativado'}):\n"
+            f"- Embeds enviados: {sink_stats['embeds_sent']} em {sink_stats['messages_sent']} mensagens "
+            f"({sink_stats['embeds_per_message']:.1f} embeds/mensagem)\n"
+            f"- Vazão: {sink_stats['embeds_per_minute']:.1f} embeds/min\n"
+            f"- Fallbacks para a fila: {sink_stats['fallbacks']} | Erros: {sink_stats['errors']}\n"
+        )
+        bot.log_sink.reset_stats()
+
+        budget_usage = bot.api_budget.get_usage()
+        if budget_usage:
+            metrics_report.append(
+                f"**Orçamento de API** ({bot.api_budget.rate:.0f} req/s, rajada {bot.api_budget.burst:.0f}):\n" +
+                "\n".join(
+                    f"- {consumer}: {usage['tokens']} tokens em {usage['requests']} pedidos, "
+                    f"espera média {usage['avg_wait']:.2f}s (máx {usage['max_wait']:.1f}s)"
+                    for consumer, usage in budget_usage.items()
+                ) + "\n"
+            )
+        bot.api_budget.reset_usage()
+
+        concurrency = bot.mutation_concurrency.get_report()
+        if concurrency:
+            decisions = list(bot.mutation_concurrency.trace)
+            metrics_report.append(
+                "**Concorrência AIMD (mutações)**:\n" +
+                "\n".join(
+                    f"- Guilda {guild_id}: limite {data['limit']}, {data['operations']} operações, "
+                    f"{data['rate_limited']} reduções por 429"
+                    for guild_id, data in concurrency.items()
+                ) + f"\n- Decisões registradas: {len(decisions)}\n"
+            )
+            if decisions:
+                logger.info(f"Trace de concorrência AIMD: {json.dumps(decisions)}")
+            bot.mutation_concurrency.trace.clear()
+
+        if bot.activity_cache:
+            activity_stats = bot.activity_cache.get_stats()
+            metrics_report.append(
+                f"**Cache de atividade**:\n"
+                f"- Acertos: {activity_stats['hits']} | Carregamentos: {activity_stats['misses']} | "
+                f"Fora da janela: {activity_stats['bypass']}\n"
+                f"- Usuários: {activity_stats['entries']} ({activity_stats['sessions']} sessões), "
+                f"{activity_stats['evictions']} descartados\n"
+                f"- Verificados: {activity_stats['verified']} | Divergências: {activity_stats['mismatches']}\n"
+            )
+
+        if bot.heatmaps:
+            heatmap_stats = bot.heatmaps.get_stats()
+            metrics_report.append(
+                f"**Mapas de calor**:\n"
+                f"- Acertos: {heatmap_stats['hits']} | Consultas: {heatmap_stats['misses']} | "
+                f"Sessões somadas: {heatmap_stats['updates']} | Entradas: {heatmap_stats['entries']}\n"
+            )
+
+        scheduler_stats = bot.scheduler.stats
+        upcoming = ", ".join(
+            f"{name} {next_run.astimezone(bot.timezone).strftime('%d/%m %H:%M') if next_run else '(em execução)'}"
+            for name, next_run, _ in bot.scheduler.get_schedule()[:3]
+        )
+        metrics_report.append(
+            f"**Agendador de tasks**:\n"
+            f"- Execuções: {scheduler_stats['runs']} | Falhas: {scheduler_stats['failures']} | "
+            f"Perdidas agrupadas: {scheduler_stats['coalesced']} | Já executadas por outra instância: {scheduler_stats['lost_claims']}\n"
+            f"- Despertares: {scheduler_stats['wakeups']} (ociosos: {scheduler_stats['idle_wakeups']})\n"
+            f"- Próximas: {upcoming or 'nenhuma'}\n"
+        )
+
+        cache_stats = graph_cache.get_stats()
+        metrics_report.append(
+            f"**Cache de gráficos**:\n"
+            f"- Acertos: {cache_stats['hits']} (disco: {cache_stats['disk_hits']}) | Renderizações: {cache_stats['misses']}\n"
+            f"- Entradas: {cache_stats['entries']} ({cache_stats['bytes'] / 1024:.0f} KB), {cache_stats['evictions']} descartadas\n"
+        )
+        
         await bot.log_action(
             "Relatório de Métricas Diárias",
             None,
             "\n".join(metrics_report))
+
+        # Telemetria da fila de saída: resumo no canal de logs e snapshot completo no log do bot
+        await bot.log_action(
+            "Telemetria da Fila de Saída (24h)",
+            None,
+            bot.outbound_telemetry.format_report())
+        logger.info(f"Telemetria de saída: {json.dumps(bot.outbound_telemetry.snapshot())}")
+        bot.outbound_telemetry.reset()
         
         # Reset counts for the new day
         task_metrics.error_counts.clear()
@@ -1209,14 +1491,8 @@ async def _report_metrics():
         logger.error(f"Erro ao gerar relatório de métricas: {e}")
 
 async def report_metrics():
-    """Wrapper para a task com intervalo persistente"""
-    monitoring_period = 1  # Metrics reporting should run daily regardless of monitoring period
-    task = bot.loop.create_task(execute_task_with_persistent_interval(
-        "report_metrics", 
-        monitoring_period,
-        _report_metrics
-    ), name='report_metrics_wrapper')
-    return task
+    """Agenda o relatório diário de métricas no agendador persistente"""
+    schedule_persistent_task("report_metrics", 1, _report_metrics)
 
 async def generate_activity_report(member: discord.Member, sessions: list) -> Optional[discord.File]:
     """Gera um relatório gráfico de atividade e retorna como discord.File"""
@@ -1248,20 +1524,12 @@ async def _execute_force_check(member: discord.Member):
         
         # Obter sessões de voz no período
         start_time = time.time()
-        sessions = await bot.db.get_voice_sessions(member.id, guild.id, period_start, period_end)
+        sessions = await (bot.activity_cache or bot.db).get_voice_sessions(member.id, guild.id, period_start, period_end)
         perf_metrics.record_db_query(time.time() - start_time)
         
         # Verificar requisitos
-        meets_requirements = False
-        valid_days = set()
-        
-        if sessions:
-            for session in sessions:
-                if session['duration'] >= required_minutes * 60:
-                    day = session['join_time'].date()  # Já está em UTC
-                    valid_days.add(day)
-            
-            meets_requirements = len(valid_days) >= required_days
+        valid_days = bin_sessions_by_day(sessions, bot.timezone).count_valid_days(required_minutes * 60)
+        meets_requirements = valid_days >= required_days
         
         # Registrar verificação
         start_time = time.time()
@@ -1270,11 +1538,12 @@ async def _execute_force_check(member: discord.Member):
         
         return {
             'meets_requirements': meets_requirements,
-            'valid_days': len(valid_days),
+            'valid_days': valid_days,
             'required_days': required_days,
             'sessions_count': len(sessions),
             'period_start': period_start,
-            'period_end': period_end
+            'period_end': period_end,
+            'active_since': bot.activity_cache.get_active_since(member.id, guild.id) if bot.activity_cache else None
         }
         
     except Exception as e:
@@ -1577,31 +1846,68 @@ async def cleanup_ghost_sessions():
                         if join_time.tzinfo is None:
                             join_time = join_time.replace(tzinfo=pytz.UTC)
                             
-                        await conn.execute('''
+                        session_id = await conn.fetchval('''
                             INSERT INTO voice_sessions
                             (user_id, guild_id, join_time, leave_time, duration)
                             VALUES ($1, $2, $3, $4, $5)
+                            RETURNING id
                         ''', 
                         session['user_id'], 
                         session['guild_id'],
                         join_time,
                         join_time + timedelta(hours=1),
                         3600)
+                        bot.db.notify_session_recorded(
+                            session['user_id'], session['guild_id'],
+                            join_time, join_time + timedelta(hours=1), 3600, session_id
+                        )
                     except Exception as e:
                         logger.error(f"Erro ao registrar sessão fantasma: {e}")
                         continue
     except Exception as e:
         logger.error(f"Erro na limpeza de sessões fantasmas: {e}")
 
+LEADERBOARD_REBUILD_INTERVAL = 6 * 3600  # Reconstrução periódica para consistência com o banco
+
+async def leaderboard_maintenance():
+    """Carrega o ranking incremental de cada guilda e o reconstrói periodicamente"""
+    await bot.wait_until_ready()
+
+    while True:
+        try:
+            if bot.leaderboard and bot.db and bot.db._is_initialized:
+                start_time = time.time()
+                await bot.leaderboard.rebuild_all([guild.id for guild in bot.guilds])
+                logger.info(f"Ranking de atividade reconstruído para {len(bot.guilds)} guildas em {time.time() - start_time:.2f}s")
+        except Exception as e:
+            logger.error(f"Erro na manutenção do ranking de atividade: {e}", exc_info=True)
+
+        await asyncio.sleep(LEADERBOARD_REBUILD_INTERVAL)
+
+ACTIVITY_CACHE_VERIFY_INTERVAL = 15 * 60
+
+async def activity_cache_verifier():
+    """Compara periodicamente uma amostra dos resumos em memória com voice_sessions"""
+    await bot.wait_until_ready()
+
+    while True:
+        await asyncio.sleep(ACTIVITY_CACHE_VERIFY_INTERVAL)
+        try:
+            if bot.activity_cache and bot.db and bot.db._is_initialized:
+                result = await bot.activity_cache.verify()
+                if result['mismatches']:
+                    logger.warning(
+                        f"Verificador do cache de atividade: {result['mismatches']} de "
+                        f"{result['checked']} resumos divergentes foram corrigidos"
+                    )
+                else:
+                    logger.debug(f"Verificador do cache de atividade: {result['checked']} resumos conferidos")
+        except Exception as e:
+            logger.error(f"Erro ao verificar o cache de atividade: {e}", exc_info=True)
+
 async def cleanup_ghost_sessions_wrapper():
-    """Wrapper para a task de limpeza de sessões fantasmas"""
-    monitoring_period = 1  # Executar diariamente
-    task = bot.loop.create_task(execute_task_with_persistent_interval(
-        "cleanup_ghost_sessions",
-        monitoring_period,
-        cleanup_ghost_sessions
-    ), name='cleanup_ghost_sessions_wrapper')
-    return task
+    """Agenda a limpeza diária de sessões fantasmas no agendador persistente"""
+    schedule_persistent_task("cleanup_ghost_sessions", 1, cleanup_ghost_sessions)
 
 @log_task_metrics("register_role_assignments")
 async def register_role_assignments():
@@ -1702,21 +2008,68 @@ async def process_member_role_assignments(member: discord.Member, tracked_roles:
         logger.error(f"Erro ao processar atribuições de cargos para {member.display_name}: {e}")
 
 async def register_role_assignments_wrapper():
-    """Wrapper para a task com intervalo persistente"""
-    monitoring_period = 1  # Executar diariamente
-    task = bot.loop.create_task(execute_task_with_persistent_interval(
-        "register_role_assignments",
-        monitoring_period,
-        register_role_assignments
-    ), name='register_role_assignments_wrapper')
-    return task
+    """Agenda o registro diário de atribuições de cargos no agendador persistente"""
+    schedule_persistent_task("register_role_assignments", 1, register_role_assignments)
 
 # --- NOVA TAREFA PARA LIMPEZA DE MENSAGENS ANTIGAS ---
+BULK_DELETE_MAX_AGE = timedelta(days=14)
+BOT_MESSAGE_RETENTION = timedelta(days=7)
+BOT_MESSAGE_BATCH = 1000
+
+async def _bulk_delete_tracked(channel: discord.TextChannel, message_ids: list) -> int:
+    """Apaga mensagens conhecidas em lotes de 100, respeitando o retry_after em caso de 429.
+    Retorna quantos registros saíram de bot_messages."""
+    deleted = 0
+    for i in range(0, len(message_ids), 100):
+        chunk = message_ids[i:i + 100]
+        for attempt in range(3):
+            # Limpeza tem o menor peso no orçamento global e cede lugar às demais tarefas
+            await bot.api_budget.acquire('cleanup')
+            await bot.rate_limit_monitor.acquire(
+                f"/channels/{channel.id}/messages/bulk-delete" if len(chunk) > 1 else f"/channels/{channel.id}/messages/{chunk[0]}",
+                'POST' if len(chunk) > 1 else 'DELETE'
+            )
+            try:
+                if len(chunk) == 1:
+                    await channel.get_partial_message(chunk[0]).delete()
+                else:
+                    await channel.delete_messages([discord.Object(id=mid) for mid in chunk])
+                break
+            except discord.NotFound:
+                # Já apagada manualmente: basta esquecer o registro
+                break
+            except discord.HTTPException as e:
+                if e.status == 429 and attempt < 2:
+                    retry_after = float(e.response.headers.get('Retry-After', 5)) if e.response else 5.0
+                    logger.warning(f"Rate limit ao apagar mensagens em #{channel.name}. Aguardando {retry_after:.1f}s")
+                    await asyncio.sleep(retry_after)
+                    continue
+                raise
+
+        removed = await bot.db.delete_bot_message_records(chunk)
+        deleted += removed
+        if not removed:
+            # Registro não removido (erro no banco): parar para não reenviar o mesmo lote ao Discord
+            logger.error(f"Falha ao esquecer {len(chunk)} mensagens apagadas em #{channel.name}. Interrompendo a limpeza do canal.")
+            break
+    return deleted
+
 @log_task_metrics("cleanup_old_bot_messages")
 async def _cleanup_old_bot_messages():
-    """Verifica os canais de log e notificação e apaga mensagens do bot mais antigas que 7 dias."""
+    """
+    Apaga mensagens do bot com mais de 7 dias nos canais de log e notificação.
+    Usa os IDs registrados em bot_messages e bulk delete (só aceito até 14 dias),
+    sem paginar o histórico do canal.
+    """
     await bot.wait_until_ready()
 
+    if not hasattr(bot, 'db') or not bot.db or not bot.db._is_initialized:
+        logger.error("Banco de dados não inicializado - pulando limpeza de mensagens do bot")
+        return
+
+    # Garante que as mensagens recentes já estejam registradas
+    await bot.message_tracker.flush()
+
     # Pega os IDs dos canais a partir da configuração do bot
     log_channel_id = bot.config.get('log_channel')
     notification_channel_id = bot.config.get('notification_channel')
@@ -1724,15 +2077,17 @@ async def _cleanup_old_bot_messages():
     channels_to_clean = []
     if log_channel_id:
         channels_to_clean.append(log_channel_id)
-    if notification_channel_id:
+    if notification_channel_id and notification_channel_id != log_channel_id:
         channels_to_clean.append(notification_channel_id)
 
     if not channels_to_clean:
         logger.info("Nenhum canal de log ou notificação configurado para limpeza de mensagens.")
         return
 
-    # Define o ponto de corte: qualquer mensagem antes desta data será apagada
-    cutoff_date = datetime.now(pytz.utc) - timedelta(days=7)
+    now = datetime.now(pytz.utc)
+    cutoff_date = now - BOT_MESSAGE_RETENTION
+    # Margem de 1h para não enviar ao bulk delete mensagens no limite dos 14 dias
+    oldest_deletable = now - BULK_DELETE_MAX_AGE + timedelta(hours=1)
     
     deleted_count_total = 0
 
@@ -1743,41 +2098,35 @@ async def _cleanup_old_bot_messages():
                 logger.warning(f"Não foi possível encontrar o canal de texto com ID {channel_id} para limpeza.")
                 continue
 
-            # A função purge é muito eficiente para apagar múltiplas mensagens
-            # Ela apaga mensagens que são ANTERIORES à data de corte (`before`)
-            # e que passam na verificação (`check`), que no nosso caso é se o autor é o próprio bot.
-            
-            # --- CORREÇÃO APLICADA AQUI ---
-            # limit=None estava causando o rate limit 1015 do Cloudflare.
-            # Limitamos para 100 mensagens por execução, o que é seguro.
-            deleted_messages = await channel.purge(
-                limit=100,  # Alterado de None para 100
-                before=cutoff_date,
-                check=lambda m: m.author == bot.user
-            )
-            # --- FIM DA CORREÇÃO ---
-            
-            if deleted_messages:
-                count = len(deleted_messages)
-                deleted_count_total += count
-                logger.info(f"Limpeza concluída para o canal #{channel.name}: {count} mensagens antigas do bot foram apagadas.")
+            # Em lotes até esvaziar o intervalo: o que sobrasse para a próxima execução
+            # poderia passar do limite de 14 dias do bulk delete
+            count = 0
+            while True:
+                message_ids = await bot.db.get_bot_messages_between(
+                    channel_id, oldest_deletable, cutoff_date, limit=BOT_MESSAGE_BATCH
+                )
+                if not message_ids:
+                    break
+                removed = await _bulk_delete_tracked(channel, message_ids)
+                count += removed
+                # Só avança se o lote inteiro saiu de bot_messages; senão a próxima consulta traria os mesmos IDs
+                if removed < len(message_ids) or len(message_ids) < BOT_MESSAGE_BATCH:
+                    break
+
+            if not count:
+                continue
+            deleted_count_total += count
+            logger.info(f"Limpeza concluída para o canal #{channel.name}: {count} mensagens antigas do bot foram apagadas.")
 
         except discord.Forbidden:
             logger.error(f"Não tenho permissão para apagar mensagens no canal com ID {channel_id}.")
-        
-        # --- INÍCIO DA CORREÇÃO PARA O ERRO 10008 ---
-        except discord.NotFound as e:
-            # Isso é uma condição de corrida (race condition)
-            # A mensagem já foi apagada, mais o purge() tentou apagá-la de novo
-            # ao deletar mensagens com mais de 14 dias (uma por uma).
-            logger.warning(f"Erro 'NotFound' (10008) ao limpar canal {channel_id}. Isso é normal se mensagens são apagadas rapidamente. Erro: {e}")
-        # --- FIM DA CORREÇÃO PARA O ERRO 10008 ---
-
         except Exception as e:
             logger.error(f"Ocorreu um erro ao limpar mensagens no canal ID {channel_id}: {e}", exc_info=True)
-        
-        # Adiciona um pequeno delay para não sobrecarregar a API do Discord
-        await asyncio.sleep(5)
+
+    # Mensagens que passaram dos 14 dias não podem mais ir para o bulk delete: apenas esquecê-las
+    forgotten = await bot.db.delete_bot_message_records(before=oldest_deletable)
+    if forgotten:
+        logger.warning(f"{forgotten} mensagens do bot passaram do limite de 14 dias sem serem apagadas e foram descartadas do registro.")
 
     if deleted_count_total > 0:
         logger.info(f"Limpeza periódica de mensagens concluída. Total de {deleted_count_total} mensagens apagadas.")
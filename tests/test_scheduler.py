@@ -0,0 +1,152 @@
+"""Testes do PersistentScheduler com relógio falso (sem esperas reais)."""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import PersistentScheduler
+
+T0 = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+HOUR = timedelta(hours=1)
+DAY = timedelta(hours=24)
+
+class FakeClock:
+    """Avança o tempo direto para o próximo vencimento em vez de dormir"""
+
+    def __init__(self, start: datetime):
+        self.t = start
+        self.sleeps = []
+
+    def now(self) -> datetime:
+        return self.t
+
+    async def sleep_until(self, when, wakeup: asyncio.Event) -> bool:
+        # Deixa as tasks disparadas terminarem antes de avançar o relógio
+        for _ in range(5):
+            await asyncio.sleep(0)
+        if wakeup.is_set():
+            return True
+        if when is None:
+            await wakeup.wait()
+            return True
+        self.t = max(self.t, when)
+        self.sleeps.append(when)
+        return False
+
+class FakeStore:
+    """Mesma semântica de claim/release de task_executions do Database"""
+
+    def __init__(self, rows: dict):
+        self.rows = dict(rows)
+        self.claims = []
+
+    async def get_task_executions(self, task_names):
+        return {name: self.rows[name] for name in task_names if name in self.rows}
+
+    async def claim_task_execution(self, task_name, execution_time, not_after, monitoring_period):
+        previous = self.rows.get(task_name)
+        if previous is not None and previous > not_after:
+            return None
+        self.rows[task_name] = execution_time
+        self.claims.append((task_name, execution_time))
+        return {'previous_execution': previous}
+
+    async def release_task_execution(self, task_name, execution_time, previous_execution):
+        if self.rows.get(task_name) == execution_time:
+            self.rows[task_name] = previous_execution
+
+async def run_until(scheduler: PersistentScheduler, store: FakeStore, clock: FakeClock, condition):
+    runner = asyncio.create_task(scheduler.run(store))
+    try:
+        for _ in range(100000):
+            if condition():
+                break
+            await asyncio.sleep(0)
+        else:
+            raise AssertionError("agendador não chegou ao estado esperado")
+    finally:
+        runner.cancel()
+        try:
+            await runner
+        except asyncio.CancelledError:
+            pass
+
+def recorder(fired: list, name: str, clock: FakeClock):
+    async def task():
+        fired.append((name, clock.now() - T0))
+    return task
+
+def test_firing_times_and_coalescing():
+    async def scenario():
+        clock = FakeClock(T0)
+        scheduler = PersistentScheduler(clock=clock, catchup_jitter=0)
+        store = FakeStore({'daily_late': T0 - timedelta(days=3), 'daily_due': T0 - timedelta(hours=22)})
+        fired = []
+        scheduler.register('daily_late', recorder(fired, 'daily_late', clock), DAY)
+        scheduler.register('daily_due', recorder(fired, 'daily_due', clock), DAY)
+        scheduler.register('six_hours', recorder(fired, 'six_hours', clock), timedelta(hours=6))
+        await run_until(scheduler, store, clock, lambda: clock.now() >= T0 + timedelta(hours=49))
+        return scheduler, fired
+
+    scheduler, fired = asyncio.run(scenario())
+    # O relógio salta direto para o próximo vencimento: só as execuções até 49h são conferidas
+    times = lambda name: [at for task, at in fired if task == name and at < timedelta(hours=49)]
+    # Três dias fora do ar viram uma execução imediata; depois, a cada 24h exatas
+    assert times('daily_late') == [timedelta(0), DAY, 2 * DAY]
+    assert times('daily_due') == [2 * HOUR, 26 * HOUR]
+    assert times('six_hours') == [timedelta(hours=6 * i) for i in range(9)]
+    assert scheduler.stats['coalesced'] == 2
+    assert scheduler.stats['idle_wakeups'] == 0
+    assert scheduler.stats['failures'] == 0
+
+def test_failure_releases_claim_and_retries():
+    async def scenario():
+        clock = FakeClock(T0)
+        scheduler = PersistentScheduler(clock=clock, catchup_jitter=0)
+        store = FakeStore({'flaky': T0 - timedelta(hours=23)})
+        calls = []
+
+        async def flaky():
+            calls.append(clock.now() - T0)
+            if len(calls) == 1:
+                raise RuntimeError("falha simulada")
+
+        scheduler.register('flaky', flaky, DAY)
+        await run_until(scheduler, store, clock, lambda: len(calls) >= 2)
+        return scheduler, store, calls
+
+    scheduler, store, calls = asyncio.run(scenario())
+    # Vence em 1h, falha, é liberada e tentada de novo 1h depois mantendo o horário nominal
+    assert calls == [HOUR, 2 * HOUR]
+    assert scheduler.stats['failures'] == 1
+    assert scheduler.stats['runs'] == 1
+    assert store.claims == [('flaky', T0 + HOUR), ('flaky', T0 + HOUR)]
+    assert store.rows['flaky'] == T0 + HOUR
+
+def test_lost_claim_reschedules_from_store():
+    store = FakeStore({'shared': T0 - timedelta(hours=23)})
+
+    class OtherInstanceClock(FakeClock):
+        async def sleep_until(self, when, wakeup):
+            if not self.sleeps:
+                # Outra instância executa a task enquanto esta dorme
+                store.rows['shared'] = T0 + timedelta(minutes=30)
+            return await super().sleep_until(when, wakeup)
+
+    async def scenario():
+        clock = OtherInstanceClock(T0)
+        scheduler = PersistentScheduler(clock=clock, catchup_jitter=0)
+        calls = []
+
+        async def shared():
+            calls.append(clock.now() - T0)
+
+        scheduler.register('shared', shared, DAY)
+        await run_until(scheduler, store, clock, lambda: len(calls) >= 1)
+        return scheduler, calls
+
+    scheduler, calls = asyncio.run(scenario())
+    assert scheduler.stats['lost_claims'] == 1
+    assert calls == [DAY + timedelta(minutes=30)]
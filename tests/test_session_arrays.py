@@ -0,0 +1,101 @@
+"""evaluate_periods comparado com a avaliação período a período do BatchProcessor."""
+import os
+import random
+import sys
+from datetime import datetime
+
+import numpy as np
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_arrays import SessionArrays, evaluate_periods
+
+TZ = pytz.timezone('America/Sao_Paulo')
+DAY = 86400
+# Janela com transições de horário de verão em São Paulo
+START = int(datetime(2018, 9, 1, tzinfo=pytz.utc).timestamp())
+
+def local_day(epoch: int) -> int:
+    local = datetime.fromtimestamp(epoch, pytz.utc).astimezone(TZ)
+    return local.toordinal()
+
+def valid_days(sessions, period_start: int, period_end: int, min_seconds: int) -> int:
+    """Mesma regra de get_voice_sessions + bin_sessions_by_day + count_valid_days"""
+    best = {}
+    for join, leave in sessions:
+        if join < period_end and leave > period_start:
+            clipped = min(leave, period_end) - max(join, period_start)
+            day = local_day(join)
+            best[day] = max(best.get(day, 0), clipped)
+    return sum(1 for seconds in best.values() if seconds >= min_seconds)
+
+def replay(sessions, anchor: int, skip_start: int, now: int, period: int, min_seconds: int, required_days: int):
+    """Períodos concluídos avaliados um a um; o último registrado como cumprido é pulado"""
+    failed = False
+    start = anchor
+    while start + period <= now:
+        if start != skip_start:
+            failed |= valid_days(sessions, start, start + period, min_seconds) < required_days
+        start += period
+    return failed, valid_days(sessions, start, start + period, min_seconds)
+
+def check(rng: random.Random, users: int, max_sessions: int, min_seconds: int):
+    period = rng.choice([3, 7, 10]) * DAY
+    required_days = rng.randint(1, 4)
+    now = START + rng.randint(20, 60) * DAY
+    by_user, anchors, skips = {}, [], []
+    for user in range(users):
+        anchor = START + rng.randint(0, 40) * DAY + rng.randint(0, DAY)
+        completed = max((now - anchor) // period, 0)
+        skip = -1
+        if completed and rng.random() < 0.5:
+            skip = anchor + rng.randrange(completed) * period
+        anchors.append(anchor)
+        skips.append(skip)
+        by_user[user] = []
+        for _ in range(rng.randint(0, max_sessions)):
+            join = min(anchor, now) - DAY + rng.randint(0, max(now - anchor, 0) + DAY)
+            leave = min(join + rng.randint(1, 4 * 3600), now)
+            if leave > join:
+                by_user[user].append((join, leave))
+
+    rows = [(user, join, leave - join) for user, pairs in by_user.items() for join, leave in pairs]
+    sessions = SessionArrays(
+        np.array([row[0] for row in rows], dtype=np.int64),
+        np.array([row[1] for row in rows], dtype=np.int64),
+        np.array([row[2] for row in rows], dtype=np.int32)
+    )
+    result = evaluate_periods(
+        sessions, np.arange(users, dtype=np.int64), np.array(anchors, dtype=np.int64),
+        np.array(skips, dtype=np.int64), now, period, min_seconds, required_days, TZ
+    )
+    for user in range(users):
+        failed, current_days = replay(by_user[user], anchors[user], skips[user], now, period,
+                                      min_seconds, required_days)
+        assert bool(result['failed'][user]) == failed, (user, anchors[user], skips[user], by_user[user])
+        assert int(result['current_days'][user]) == current_days
+
+def test_matches_period_by_period_replay():
+    rng = random.Random(1234)
+    for _ in range(300):
+        check(rng, users=rng.randint(1, 8), max_sessions=25, min_seconds=rng.choice([60, 1800, 3600]))
+
+def test_no_qualifying_session_respects_skip():
+    # Minutos candidatos maiores que qualquer sessão: nenhuma peça passa no filtro
+    rng = random.Random(99)
+    for _ in range(100):
+        check(rng, users=rng.randint(1, 8), max_sessions=10, min_seconds=5 * 3600)
+
+def test_skip_only_without_sessions():
+    period = 7 * DAY
+    anchors = np.array([START, START, START], dtype=np.int64)
+    now = START + period + DAY  # Um período concluído
+    skips = np.array([START, -1, START + DAY], dtype=np.int64)
+    result = evaluate_periods(
+        SessionArrays.empty(), np.arange(3, dtype=np.int64), anchors, skips,
+        now, period, 60, 1, TZ
+    )
+    # Só o primeiro tem o período concluído registrado como cumprido (o terceiro não está alinhado)
+    assert result['failed'].tolist() == [False, True, True]
+    assert result['completed'].tolist() == [1, 1, 1]
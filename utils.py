@@ -1,5 +1,4 @@
 # utils.py
-import matplotlib.pyplot as plt
 from io import BytesIO
 import discord
 from typing import List, Dict, Optional, Tuple
@@ -7,173 +6,189 @@ import logging
 import asyncio
 import time
 from datetime import datetime, timedelta
-import numpy as np
 from collections import deque
 import pytz
+from lazy_imports import lazy_import
+from charts import graph_cache, render_activity_chart, ChartQueueFull
+from session_arrays import local_days
+
+np = lazy_import('numpy')
 
 logger = logging.getLogger('inactivity_bot')
 
-# Configurações de rate limit para geração de gráficos
+# Rate limit de renderização: só gráficos fora do cache contam, por usuário
 GRAPH_RATE_LIMIT = {
-    'last_request': 0,
-    'queue': deque(maxlen=5),  # Máximo 5 gráficos por minuto
-    'cooldown': 15  # Segundos mínimos entre requisições
+    'misses_per_minute': 3,  # Renderizações novas por usuário por minuto
+    'users': {}  # user_id -> deque com horários das renderizações
 }
 
-async def check_graph_rate_limit():
-    """Verifica e aplica rate limit para geração de gráficos"""
+def check_graph_rate_limit(user_id: int) -> bool:
+    """Verifica se o usuário ainda pode renderizar um gráfico novo (cache miss)"""
     current_time = time.time()
-    elapsed = current_time - GRAPH_RATE_LIMIT['last_request']
-    
-    # Se ainda estiver no cooldown, esperar
-    if elapsed < GRAPH_RATE_LIMIT['cooldown']:
-        wait_time = GRAPH_RATE_LIMIT['cooldown'] - elapsed
-        await asyncio.sleep(wait_time)
-    
-    # Verificar se atingiu o limite de requisições por minuto
-    if len(GRAPH_RATE_LIMIT['queue']) >= GRAPH_RATE_LIMIT['queue'].maxlen:
-        oldest_request = GRAPH_RATE_LIMIT['queue'][0]
-        if current_time - oldest_request < 60:
-            wait_time = 60 - (current_time - oldest_request)
-            logger.warning(f"Rate limit de gráficos atingido. Aguardando {wait_time:.1f} segundos")
-            await asyncio.sleep(wait_time)
-    
-    # Registrar a nova requisição
-    GRAPH_RATE_LIMIT['queue'].append(current_time)
-    GRAPH_RATE_LIMIT['last_request'] = current_time
+    users = GRAPH_RATE_LIMIT['users']
+    history = users.get(user_id)
+    if history is None:
+        history = users[user_id] = deque(maxlen=GRAPH_RATE_LIMIT['misses_per_minute'])
+
+    while history and current_time - history[0] >= 60:
+        history.popleft()
+
+    if len(history) >= GRAPH_RATE_LIMIT['misses_per_minute']:
+        return False
+
+    history.append(current_time)
+
+    # Descartar históricos expirados para o dicionário não crescer indefinidamente
+    if len(users) > 1000:
+        for uid in [uid for uid, h in users.items() if not h or current_time - h[-1] >= 60]:
+            del users[uid]
     return True
 
-def calculate_most_active_days(sessions: List[Dict], days: int) -> List[Tuple[str, str, int, int]]:
+WEEKDAYS_PT = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+
+def get_configured_timezone():
+    """Fuso horário configurado no bot (define o que é um "dia" nas estatísticas)"""
+    from main import bot  # Importação local para evitar circular imports
+    return bot.timezone
+
+def get_chart_backend() -> str:
+    """Backend de renderização do gráfico de atividade ('matplotlib' ou 'raster')"""
+    from main import bot  # Importação local para evitar circular imports
+    return bot.config.get('chart_backend', 'matplotlib')
+
+def _to_epoch(dt: datetime) -> float:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=pytz.utc)
+    return dt.timestamp()
+
+class DayBins:
+    """Totais de voz por dia local: dias (datetime64[D]), segundos, sessões e maior sessão"""
+
+    def __init__(self, days: 'np.ndarray', total_seconds: 'np.ndarray', counts: 'np.ndarray', max_seconds: 'np.ndarray'):
+        self.days = days
+        self.total_seconds = total_seconds
+        self.counts = counts
+        self.max_seconds = max_seconds
+
+    @classmethod
+    def from_arrays(cls, days: List, total_seconds: List[int], counts: List[int], max_seconds: List[int]) -> 'DayBins':
+        """Monta os bins a partir de agregados já calculados (ex.: no banco)"""
+        return cls(
+            np.array(days or [], dtype='datetime64[D]'),
+            np.array(total_seconds or [], dtype=np.int64),
+            np.array(counts or [], dtype=np.int64),
+            np.array(max_seconds or [], dtype=np.int64)
+        )
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def average_seconds(self) -> 'np.ndarray':
+        return self.total_seconds / np.maximum(self.counts, 1)
+
+    def dates(self) -> List:
+        return self.days.astype(object).tolist()
+
+    def count_valid_days(self, min_session_seconds: int) -> int:
+        """Dias com pelo menos uma sessão de duração mínima (regra de cumprimento dos requisitos)"""
+        return int(np.count_nonzero(self.max_seconds >= min_session_seconds))
+
+def bin_sessions_by_day(sessions: List[Dict], tz=None, since: Optional[datetime] = None) -> DayBins:
+    """
+    Agrupa sessões (join_time, duration) por dia no fuso configurado.
+
+    Cada sessão pertence ao dia local do seu join_time. Os offsets do fuso são
+    resolvidos por busca binária nas transições (horário de verão incluído), e os
+    agregados por dia saem de np.bincount/np.maximum.at sem laços em Python.
+    """
+    tz = tz or get_configured_timezone()
+    since_epoch = _to_epoch(since) if since is not None else None
+
+    rows = [(_to_epoch(session['join_time']), session['duration'] or 0)
+            for session in sessions if session['join_time'] is not None]
+    if since_epoch is not None:
+        rows = [row for row in rows if row[0] >= since_epoch]
+
+    if not rows:
+        empty = np.array([], dtype=np.int64)
+        return DayBins(empty.astype('datetime64[D]'), empty, empty, empty)
+
+    data = np.array(rows, dtype=np.float64)
+    epochs = data[:, 0].astype(np.int64)
+    durations = data[:, 1].astype(np.int64)
+
+    unique_days, inverse = np.unique(local_days(epochs, tz), return_inverse=True)
+    total_seconds = np.bincount(inverse, weights=durations).astype(np.int64)
+    counts = np.bincount(inverse)
+    max_seconds = np.zeros(len(unique_days), dtype=np.int64)
+    np.maximum.at(max_seconds, inverse, durations)
+
+    return DayBins(unique_days.astype('datetime64[D]'), total_seconds, counts, max_seconds)
+
+def calculate_most_active_days(sessions: List[Dict], days: int, tz=None,
+                               bins: Optional[DayBins] = None) -> List[Tuple[str, str, int, int]]:
     """Calcula os dias mais ativos com tempo total e média por sessão, incluindo as datas"""
-    weekdays = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
-    day_stats = {}
-    
-    for session in sessions:
-        join_time = session['join_time'].astimezone(pytz.utc)
-        date_str = join_time.strftime('%d/%m/%Y')
-        day_name = weekdays[join_time.weekday()]
-        duration_min = session['duration'] // 60
-        
-        # Usamos a data como chave para agrupar por dia
-        if date_str not in day_stats:
-            day_stats[date_str] = {
-                'day_name': day_name,
-                'total_min': 0,
-                'count': 0,
-                'date': join_time.date()
-            }
-        
-        day_stats[date_str]['total_min'] += duration_min
-        day_stats[date_str]['count'] += 1
-    
-    # Converter para lista e calcular média
-    active_days = []
-    for date_str, stats in day_stats.items():
-        avg = stats['total_min'] / stats['count'] if stats['count'] > 0 else 0
-        active_days.append((
-            stats['day_name'],
-            date_str,
-            stats['total_min'],
-            int(avg)
-        ))
-    
-    # Ordenar por data (mais recente primeiro)
+    if bins is None:
+        bins = bin_sessions_by_day(sessions, tz)
+
+    active_days = [
+        (WEEKDAYS_PT[day.weekday()], day.strftime('%d/%m/%Y'), int(total // 60), int(avg // 60))
+        for day, total, avg in zip(bins.dates(), bins.total_seconds, bins.average_seconds)
+    ]
+
+    # Ordenar pela média por sessão (maior primeiro)
     active_days.sort(key=lambda x: x[3], reverse=True)
     
     return active_days
 
-async def generate_activity_graph(member: discord.Member, sessions: List[Dict], days: int = 14) -> Optional[BytesIO]:
-    """Gera um gráfico de atividade do usuário para o período específico"""
+async def generate_activity_graph(member: discord.Member, sessions: List[Dict], days: int = 14,
+                                  requester_id: Optional[int] = None, tz=None,
+                                  bins: Optional[DayBins] = None) -> Optional[BytesIO]:
+    """Gera um gráfico de atividade do usuário para o período específico (renderizado fora do event loop)"""
     try:
-        # Verificar e respeitar rate limits
-        await check_graph_rate_limit()
-        
-        # Filtrar sessões para o período solicitado
-        cutoff_date = datetime.now(pytz.utc) - timedelta(days=days)
-        filtered_sessions = [s for s in sessions if s['join_time'].astimezone(pytz.utc) >= cutoff_date]
+        # Agrupar minutos por dia (no fuso configurado) dentro do período solicitado
+        now = datetime.now(pytz.utc)
+        cutoff_date = now - timedelta(days=days)
+        if bins is None:
+            bins = bin_sessions_by_day(sessions, tz, since=cutoff_date)
         
-        if not filtered_sessions:
+        if not len(bins):
             return None
 
-        # Preparar dados para o gráfico
-        dates = []
-        durations = []
-        for session in filtered_sessions:
-            join_time = session['join_time'].astimezone(pytz.utc)
-            dates.append(join_time)
-            durations.append(session['duration'] / 60)  # Converter para minutos
-
-        # Agrupar por data
-        date_durations = {}
-        for date, duration in zip(dates, durations):
-            date_str = date.strftime('%d/%m')
-            if date_str not in date_durations:
-                date_durations[date_str] = 0
-            date_durations[date_str] += duration
-
-        # Ordenar datas
-        sorted_dates = sorted(date_durations.keys(), 
-                            key=lambda x: datetime.strptime(x, '%d/%m'))
-        
-        sorted_values = [date_durations[date] for date in sorted_dates]
+        labels = [day.strftime('%d/%m') for day in bins.dates()]
+        values = (bins.total_seconds / 60).tolist()
 
-        # Configurar o gráfico
-        plt.figure(figsize=(12, 6))
-        plt.style.use('seaborn-v0_8')
-        
-        # Gerar gráfico de barras
-        bars = plt.bar(sorted_dates, sorted_values, color='#5865F2', width=0.7)
-        
-        # Adicionar valores nas barras
-        for bar in bars:
-            height = bar.get_height()
-            if height > 0:
-                plt.text(bar.get_x() + bar.get_width()/2., height,
-                        f'{int(height)} min',
-                        ha='center', va='bottom', fontsize=9)
-
-        # Configurar título e labels com o período
-        start_date = (datetime.now(pytz.utc) - timedelta(days=days)).strftime('%d/%m/%Y')
-        end_date = datetime.now(pytz.utc).strftime('%d/%m/%Y')
-        plt.title(f'Atividade de Voz - {member.display_name}\nPeríodo: {start_date} a {end_date} ({days} dias)', 
-                 fontsize=12, pad=12)
-        plt.xlabel('Data', fontsize=10)
-        plt.ylabel('Minutos em Voz', fontsize=10)
-        
-        # Rotacionar labels do eixo X para melhor legibilidade
-        plt.xticks(rotation=45, fontsize=8)
-        plt.yticks(fontsize=9)
-        plt.ylim(0, max(sorted_values) * 1.2 if max(sorted_values) > 0 else 100)
-        
-        # Adicionar grid
-        plt.grid(axis='y', alpha=0.4)
-        
-        # Ajustar layout para evitar cortes
-        plt.tight_layout()
+        start_date = cutoff_date.strftime('%d/%m/%Y')
+        end_date = now.strftime('%d/%m/%Y')
+        title = f'Atividade de Voz - {member.display_name}\nPeríodo: {start_date} a {end_date} ({days} dias)'
 
-        # Salvar em buffer
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
-        buffer.seek(0)
-        
-        return buffer
-        
+        backend = get_chart_backend()
+        cache_key = graph_cache.make_key(member.guild.id, member.id, days, labels, values, f"{backend}|{title}")
+        png = await graph_cache.get(cache_key)
+        if png is None:
+            requester_id = requester_id or member.id
+            if not check_graph_rate_limit(requester_id):
+                logger.warning(f"Limite de gráficos novos atingido para {requester_id}, ignorando requisição")
+                return None
+            png = await render_activity_chart(labels, values, title, backend)
+            await graph_cache.put(cache_key, png)
+
+        return BytesIO(png)
+
+    except ChartQueueFull as e:
+        logger.warning(f"Gráfico de atividade não gerado: {e}")
+        return None
     except Exception as e:
         logger.error(f"Erro ao gerar gráfico de atividade: {e}", exc_info=True)
         return None
-    finally:
-        if 'plt' in locals():
-            plt.close('all')
 
-async def generate_activity_report(member: discord.Member, sessions: list, days: int = 14) -> Optional[discord.File]:
+async def generate_activity_report(member: discord.Member, sessions: list, days: int = 14,
+                                   requester_id: Optional[int] = None,
+                                   bins: Optional[DayBins] = None) -> Optional[discord.File]:
     """Gera um relatório gráfico de atividade com tratamento robusto de erros"""
     try:
-        # Verificar rate limit antes de gerar o gráfico
-        if not await check_graph_rate_limit():
-            logger.warning("Limite de geração de gráficos atingido, ignorando requisição")
-            return None
-            
-        buffer = await generate_activity_graph(member, sessions, days)
+        buffer = await generate_activity_graph(member, sessions, days, requester_id, bins=bins)
         if buffer:
             return discord.File(buffer, filename='atividade.png')
         return None
@@ -252,22 +267,3 @@ async def batch_process(items, process_func, batch_size=10, delay=1.0):
         # Esperar antes do próximo lote, se não for o último
         if i + batch_size < len(items):
             await asyncio.sleep(delay)
-
-def setup_matplotlib():
-    """Configura o matplotlib para uso eficiente em ambiente headless"""
-    import matplotlib
-    matplotlib.use('Agg')  # Usar backend que não requer display
-    plt.style.use('seaborn-v0_8')  # Usar estilo mais leve
-    plt.rcParams.update({
-        'figure.autolayout': True,  # Ajustar layout automaticamente
-        'figure.dpi': 100,          # Resolução padrão
-        'savefig.dpi': 100,         # Resolução ao salvar
-        'axes.titlesize': 10,       # Tamanho do título
-        'axes.labelsize': 8,        # Tamanho dos labels
-        'xtick.labelsize': 7,       # Tamanho dos ticks X
-        'ytick.labelsize': 7,       # Tamanho dos ticks Y
-        'font.size': 8,             # Tamanho geral da fonte
-    })
-
-# Configurar matplotlib na inicialização
-setup_matplotlib()
\ No newline at end of file